@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
-from .models import User, School
+from .models import User, School, WeeklyReset, WeeklyStanding, PointsLedger, SchoolPurge
 
 @admin.register(School)
 class SchoolAdmin(admin.ModelAdmin):
@@ -30,4 +30,38 @@ class UserAdmin(DjangoUserAdmin):
     list_filter = ('role', 'is_active', 'school', 'is_staff', 'is_superuser')
     search_fields = ('username', 'parent_name', 'children_name', 'staff_name', 'teacher_name', 'school__name')
     ordering = ('username',)
-    readonly_fields = ('last_submission',)
\ No newline at end of file
+    readonly_fields = ('last_submission',)
+
+
+@admin.register(WeeklyReset)
+class WeeklyResetAdmin(admin.ModelAdmin):
+    list_display = ('id', 'week_ending', 'snapshot_count', 'reset_count', 'started_at', 'finished_at')
+    readonly_fields = ('id', 'started_at')
+    ordering = ('-week_ending',)
+
+
+@admin.register(WeeklyStanding)
+class WeeklyStandingAdmin(admin.ModelAdmin):
+    list_display = ('id', 'reset', 'user', 'school', 'weekly_points', 'points')
+    list_filter = ('reset', 'school')
+    search_fields = ('user__username',)
+    ordering = ('reset', '-weekly_points')
+
+
+
+@admin.register(PointsLedger)
+class PointsLedgerAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'delta', 'reason', 'submission', 'occurred_on', 'created_at')
+    list_filter = ('reason', 'occurred_on')
+    search_fields = ('user__username',)
+    readonly_fields = ('id', 'created_at')
+    ordering = ('-created_at', '-id')
+
+
+
+@admin.register(SchoolPurge)
+class SchoolPurgeAdmin(admin.ModelAdmin):
+    list_display = ('id', 'school_name', 'delete_school', 'status', 'users_deleted', 'user_total', 'files_deleted', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('id', 'created_at', 'started_at', 'finished_at')
+    ordering = ('-created_at',)
@@ -0,0 +1,168 @@
+"""
+Resolve the acting user once per request.
+
+Clients authenticate with the token returned by login ("Authorization: Token <key>").
+The deprecated User-ID header, which proves nothing (anyone can send any id), is only
+accepted while settings.ALLOW_LEGACY_USER_ID_AUTH is on; it is off by default.
+Either way request.user is loaded with its school joined. Lookups go through a small
+process-local LRU backed by the Django cache, both invalidated when the user (or any
+school) is saved or deleted and when a token is deleted. Other processes see a change
+after at most USER_LOCAL_CACHE_TTL seconds, provided the Django cache is shared between
+them (REDIS_URL, see settings). With a per-process cache, entries are kept there for
+USER_LOCAL_CACHE_TTL seconds as well, so the same bound holds.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.authentication import BaseAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import User
+
+USER_LOCAL_CACHE_SIZE = 1024
+USER_LOCAL_CACHE_TTL = 30
+USER_CACHE_TIMEOUT = 5 * 60
+USER_CACHE_VERSION_KEY = 'account:user:version'
+
+_local_users = OrderedDict()
+_local_tokens = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _shared_timeout():
+    """How long the Django cache keeps users and tokens"""
+    if isinstance(caches['default'], LocMemCache):
+        # Not shared: another process's invalidations never reach it
+        return USER_LOCAL_CACHE_TTL
+    return USER_CACHE_TIMEOUT
+
+
+def _cache_key(user_id):
+    version = cache.get_or_set(USER_CACHE_VERSION_KEY, time.time_ns, None)
+    return f'account:user:{version}:{user_id}'
+
+
+def _token_cache_key(key):
+    return f'account:token:{key}'
+
+
+def _local_get(store, key):
+    with _local_lock:
+        entry = store.get(key)
+        if entry and entry[0] > time.monotonic():
+            store.move_to_end(key)
+            return entry[1]
+    return None
+
+
+def _local_set(store, key, value):
+    with _local_lock:
+        store[key] = (time.monotonic() + USER_LOCAL_CACHE_TTL, value)
+        store.move_to_end(key)
+        while len(store) > USER_LOCAL_CACHE_SIZE:
+            store.popitem(last=False)
+
+
+def get_cached_user(user_id):
+    """Return a private copy of the user with this id (school joined), or None"""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    user = _local_get(_local_users, user_id)
+    if user is not None:
+        return copy.copy(user)
+
+    key = _cache_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = User.objects.select_related('school').filter(id=user_id).first()
+        if user is None:
+            return None
+        cache.set(key, user, _shared_timeout())
+
+    _local_set(_local_users, user_id, user)
+    return copy.copy(user)
+
+
+def get_cached_token_user_id(key):
+    """Return the id of the user owning this token key, or None"""
+    user_id = _local_get(_local_tokens, key)
+    if user_id is None:
+        user_id = cache.get(_token_cache_key(key))
+        if user_id is None:
+            user_id = Token.objects.filter(key=key).values_list('user_id', flat=True).first()
+            if user_id is None:
+                return None
+            cache.set(_token_cache_key(key), user_id, _shared_timeout())
+        _local_set(_local_tokens, key, user_id)
+    return user_id
+
+
+def invalidate_user(user_id):
+    with _local_lock:
+        _local_users.pop(user_id, None)
+    cache.delete(_cache_key(user_id))
+
+
+def invalidate_token(key):
+    with _local_lock:
+        _local_tokens.pop(key, None)
+    cache.delete(_token_cache_key(key))
+
+
+def invalidate_all_users():
+    """Forget every cached user, e.g. after a school is renamed"""
+    with _local_lock:
+        _local_users.clear()
+    cache.set(USER_CACHE_VERSION_KEY, time.time_ns(), None)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    DRF token authentication whose token -> user lookup is served from the caches above,
+    so a repeat request costs no database round trips.
+    """
+
+    def authenticate_credentials(self, key):
+        user_id = get_cached_token_user_id(key)
+        user = get_cached_user(user_id) if user_id is not None else None
+        if user is None:
+            raise AuthenticationFailed('Invalid token.')
+        if not user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+        return (user, key)
+
+
+class UserIDAuthentication(BaseAuthentication):
+    """
+    Deprecated: authenticate from the User-ID header, for clients that do not log in for
+    a token yet. Unverified, so only used when settings.ALLOW_LEGACY_USER_ID_AUTH is on.
+    Query and body user_id parameters are never read (they often name another user).
+    """
+
+    def authenticate(self, request):
+        if not getattr(settings, 'ALLOW_LEGACY_USER_ID_AUTH', False):
+            return None
+        user_id = request.headers.get('User-ID')
+        if not user_id:
+            return None
+
+        user = get_cached_user(user_id)
+        if user is None:
+            # Unknown ids are treated as anonymous; views decide whether that is allowed
+            return None
+        return (user, None)
+
+
+def acting_user(request):
+    """The authenticated user for this request, or None"""
+    user = request.user
+    return user if user.is_authenticated else None
@@ -0,0 +1,79 @@
+"""
+Helpers for creating many accounts at once (school onboarding).
+"""
+import os
+import random
+import secrets
+import string
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from assignmentapp.visibility import add_users as add_assignment_visibility
+
+from .models import User
+from .search import index_users
+
+GENERATED_USERNAME_PREFIX = 'reach'
+GENERATED_USERNAME_MAX = 99999
+GENERATED_PASSWORD_LENGTH = 8
+BULK_CREATE_BATCH_SIZE = 500
+
+# Below this many passwords a thread pool costs more than it saves
+PARALLEL_HASH_THRESHOLD = 16
+
+
+class UsernameSpaceExhausted(Exception):
+    pass
+
+
+def reserve_usernames(count):
+    """
+    Pick `count` unused reachNNNNN usernames.
+    All taken names are read in one query and the free ones sampled in memory.
+    """
+    prefix_len = len(GENERATED_USERNAME_PREFIX)
+    taken = {
+        int(username[prefix_len:])
+        for username in User.objects.filter(username__startswith=GENERATED_USERNAME_PREFIX).values_list('username', flat=True)
+        if len(username) == prefix_len + 5 and username[prefix_len:].isdigit()
+    }
+    free = [n for n in range(1, GENERATED_USERNAME_MAX + 1) if n not in taken]
+    if len(free) < count:
+        raise UsernameSpaceExhausted(f'Only {len(free)} generated usernames are still available')
+    return [f"{GENERATED_USERNAME_PREFIX}{n:05d}" for n in random.sample(free, count)]
+
+
+def generate_password():
+    """8-character password with uppercase, lowercase, and digits"""
+    alphabet = string.ascii_uppercase + string.ascii_lowercase + string.digits
+    return ''.join(secrets.choice(alphabet) for _ in range(GENERATED_PASSWORD_LENGTH))
+
+
+def hash_passwords(passwords):
+    """
+    Hash raw passwords, spreading the work across CPU cores for large batches.
+    Threads, not processes: PBKDF2 runs in hashlib, which releases the GIL, and a
+    process pool would fork the web worker on every request.
+    """
+    if len(passwords) < PARALLEL_HASH_THRESHOLD:
+        return [make_password(password) for password in passwords]
+
+    workers = min(os.cpu_count() or 1, 8)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hash-passwords') as pool:
+        return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def bulk_create_users(users):
+    """
+    Insert unsaved User instances (passwords already hashed) in chunks inside one transaction.
+    bulk_create sends no post_save signals, so the search index and assignment
+    visibility are updated here directly.
+    """
+    with transaction.atomic():
+        for start in range(0, len(users), BULK_CREATE_BATCH_SIZE):
+            batch = User.objects.bulk_create(users[start:start + BULK_CREATE_BATCH_SIZE])
+            index_users(batch)
+            add_assignment_visibility(batch)
+    return users
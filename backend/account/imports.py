@@ -0,0 +1,182 @@
+"""
+Bulk user import from CSV or XLSX.
+
+Rows are read one at a time, validated, and inserted in batches. Schools are looked
+up in the school registry (account.schools) and existing usernames are checked with
+one query per batch.
+Rows that fail validation are skipped and reported with their row number; every
+other row is imported.
+
+Expected header (column order does not matter, only username and password are required):
+    username,password,role,school,parent_name,children_name,teacher_name,staff_name
+"""
+import csv
+import io
+import zipfile
+
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+
+from .bulk import bulk_create_users, hash_passwords
+from . import schools
+from .models import User
+
+IMPORT_BATCH_SIZE = 500
+IMPORTABLE_ROLES = ['parent', 'teacher', 'staff']
+NAME_FIELDS = ['parent_name', 'children_name', 'teacher_name', 'staff_name']
+
+
+class ImportFormatError(Exception):
+    pass
+
+
+def _read_csv(fileobj):
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    # Row 1 is the header
+    row_number = 1
+    try:
+        reader = csv.DictReader(text)
+        for row_number, row in enumerate(reader, 2):
+            yield row_number, row
+    except UnicodeDecodeError:
+        raise ImportFormatError(f'Row {row_number + 1} could not be read: the file must be a UTF-8 CSV file')
+    except csv.Error as e:
+        raise ImportFormatError(f'Row {row_number + 1} could not be read: {e}')
+    finally:
+        text.detach()
+
+
+def _read_xlsx(fileobj):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFormatError('XLSX import needs openpyxl installed; upload a CSV instead')
+
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    try:
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError, OSError):
+        raise ImportFormatError('The file is not a valid .xlsx workbook')
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows, [])]
+        for row_number, values in enumerate(rows, 2):
+            yield row_number, {
+                column: '' if value is None else str(value)
+                for column, value in zip(header, values)
+            }
+    finally:
+        workbook.close()
+
+
+def read_rows(fileobj, filename):
+    """Yield (row_number, row_dict) from a CSV or XLSX file, one row at a time"""
+    if filename.lower().endswith('.xlsx'):
+        return _read_xlsx(fileobj)
+    if filename.lower().endswith('.csv'):
+        return _read_csv(fileobj)
+    raise ImportFormatError('Unsupported file type; upload a .csv or .xlsx file')
+
+
+class UserImporter:
+    """Validates and inserts user rows in batches, collecting a per-row error report"""
+
+    username_validator = UnicodeUsernameValidator()
+
+    def __init__(self, dry_run=False, batch_size=IMPORT_BATCH_SIZE):
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.seen_usernames = set()
+        self.total_rows = 0
+        self.created_count = 0
+        self.errors = []
+
+    def _error(self, row_number, username, messages):
+        self.errors.append({'row': row_number, 'username': username, 'errors': messages})
+
+    def _validate(self, row_number, row):
+        """Checks that need no database access; returns a User or None"""
+        # Cells beyond the header come back under a None key; ignore them
+        row = {key.strip(): (value or '').strip() for key, value in row.items() if key is not None}
+        username = row.get('username', '')
+        password = row.get('password', '')
+        role = row.get('role') or 'parent'
+        school_name = row.get('school', '')
+
+        messages = []
+        if not username:
+            messages.append('username is required')
+        else:
+            try:
+                self.username_validator(username)
+            except ValidationError as e:
+                messages.extend(e.messages)
+            if len(username) > 150:
+                messages.append('username must be at most 150 characters')
+            if username in self.seen_usernames:
+                messages.append('username appears more than once in the file')
+        if not password:
+            messages.append('password is required')
+        if role not in IMPORTABLE_ROLES:
+            messages.append(f'role must be one of: {", ".join(IMPORTABLE_ROLES)}')
+        if school_name and schools.school_id(school_name) is None:
+            messages.append(f"School '{school_name}' does not exist")
+        for field in NAME_FIELDS:
+            if len(row.get(field, '')) > 100:
+                messages.append(f'{field} must be at most 100 characters')
+
+        if messages:
+            self._error(row_number, username, messages)
+            return None
+
+        self.seen_usernames.add(username)
+        user = User(
+            username=username,
+            password=password,
+            role=role,
+            school_id=schools.school_id(school_name),
+            **{field: row.get(field) or None for field in NAME_FIELDS},
+        )
+        user.import_row = row_number
+        return user
+
+    def _flush(self, batch):
+        existing = set(
+            User.objects.filter(username__in=[user.username for user in batch]).values_list('username', flat=True)
+        )
+        users = []
+        for user in batch:
+            if user.username in existing:
+                self._error(user.import_row, user.username, ['username already exists'])
+            else:
+                users.append(user)
+
+        if not self.dry_run:
+            for user, hashed in zip(users, hash_passwords([user.password for user in users])):
+                user.password = hashed
+            bulk_create_users(users)
+        self.created_count += len(users)
+
+    def run(self, rows):
+        batch = []
+        for row_number, row in rows:
+            self.total_rows += 1
+            user = self._validate(row_number, row)
+            if user is not None:
+                batch.append(user)
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+        return self.report()
+
+    def report(self):
+        return {
+            'dry_run': self.dry_run,
+            'total_rows': self.total_rows,
+            'created_count': self.created_count,
+            'error_count': len(self.errors),
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+        }
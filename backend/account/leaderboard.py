@@ -0,0 +1,141 @@
+"""
+Weekly leaderboard.
+
+The top LEADERBOARD_CACHE_SIZE parents of every scope (all schools, or one school)
+are kept in the Django cache and updated in place whenever a parent earns points,
+so the parent home page never has to sort the whole user table. Requests for more
+rows than are cached, the caller's own rank and rank-around-me windows are served
+by the (role, is_active, weekly_points) indexes on User.
+"""
+import time
+
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import User
+
+LEADERBOARD_CACHE_SIZE = 50
+LEADERBOARD_CACHE_TIMEOUT = 5 * 60
+LEADERBOARD_VERSION_KEY = 'leaderboard:weekly:version'
+LEADERBOARD_LOCK_TIMEOUT = 5
+
+ENTRY_FIELDS = ['id', 'username', 'parent_name', 'children_name', 'school_id', 'weekly_points', 'points', 'live_streak']
+
+
+def _version():
+    return cache.get_or_set(LEADERBOARD_VERSION_KEY, time.time_ns, None)
+
+
+def _cache_key(school_id):
+    # Keyed by day too: cached streaks are only "live" for the day they were read
+    return f"leaderboard:weekly:{_version()}:{timezone.localdate()}:{school_id or 'all'}"
+
+
+def _sort_key(row):
+    return (-(row['weekly_points'] or 0), row['id'])
+
+
+def _parents(school_id=None):
+    """Leaderboard members in rank order"""
+    parents = User.objects.filter(role='parent', is_active=True).with_current_streak().order_by('-weekly_points', 'id')
+    if school_id:
+        parents = parents.filter(school_id=school_id)
+    return parents
+
+
+def _entries(parents):
+    return list(parents.values(*ENTRY_FIELDS, school_name=F('school__name')))
+
+
+def _present(rows, first_rank):
+    """Turn cached/queried rows into the public leaderboard format"""
+    leaderboard_data = []
+    for rank, row in enumerate(rows, first_rank):
+        leaderboard_data.append({
+            'rank': rank,
+            'id': row['id'],
+            'username': row['username'],
+            'parent_name': row['parent_name'],
+            'children_name': row['children_name'],
+            'school': row['school_name'],
+            'weekly_points': row['weekly_points'],
+            'total_points': row['points'],
+            'current_streak': row['live_streak']
+        })
+    return leaderboard_data
+
+
+def top(limit=5, school_id=None):
+    """Top `limit` parents by weekly points, optionally within one school"""
+    if limit > LEADERBOARD_CACHE_SIZE:
+        return _present(_entries(_parents(school_id)[:limit]), 1)
+
+    key = _cache_key(school_id)
+    rows = cache.get(key)
+    if rows is None:
+        rows = _entries(_parents(school_id)[:LEADERBOARD_CACHE_SIZE])
+        cache.set(key, rows, LEADERBOARD_CACHE_TIMEOUT)
+    return _present(rows[:limit], 1)
+
+
+def _ahead_of(user):
+    points = user.weekly_points or 0
+    return Q(weekly_points__gt=points) | Q(weekly_points=points, id__lt=user.id)
+
+
+def rank_of(user, school_id=None):
+    """1-based weekly rank of a parent, or None if they are not on the leaderboard"""
+    if user.role != 'parent' or not user.is_active:
+        return None
+    return _parents(school_id).filter(_ahead_of(user)).count() + 1
+
+
+def around(user, window=2, school_id=None):
+    """The parent's own entry plus up to `window` entries either side of it"""
+    rank = rank_of(user, school_id)
+    if rank is None:
+        return []
+
+    parents = _parents(school_id)
+    # Walk upwards from the user (nearest first), then put the slice back in rank order
+    above = _entries(parents.filter(_ahead_of(user)).order_by('weekly_points', '-id')[:window])
+    above.sort(key=_sort_key)
+    below = _entries(parents.exclude(_ahead_of(user)).exclude(id=user.id)[:window])
+    me = _entries(parents.filter(id=user.id))
+    return _present(above + me + below, rank - len(above))
+
+
+def record_points(user):
+    """
+    Update the cached rankings in place after `user` earned points.
+    Points only ever go up between resets, so the user is the only row that can move.
+    Each update holds a short lock on the cached list; if another request is updating
+    it at the same time, every ranking is dropped instead (and rebuilt on the next
+    read), so neither update can overwrite the other.
+    """
+    for school_id in {None, user.school_id}:
+        key = _cache_key(school_id)
+        lock = f'{key}:lock'
+        if not cache.add(lock, 1, LEADERBOARD_LOCK_TIMEOUT):
+            invalidate()
+            return
+        try:
+            rows = cache.get(key)
+            if rows is None:
+                continue
+
+            rows = [row for row in rows if row['id'] != user.id]
+            if user.role == 'parent' and user.is_active:
+                rows.extend(_entries(User.objects.with_current_streak().filter(id=user.id)))
+                rows.sort(key=_sort_key)
+                # A parent who is still below a full list simply falls off the end again
+                rows = rows[:LEADERBOARD_CACHE_SIZE]
+            cache.set(key, rows, LEADERBOARD_CACHE_TIMEOUT)
+        finally:
+            cache.delete(lock)
+
+
+def invalidate():
+    """Drop every cached ranking (after resets, (de)activations and deletions)"""
+    cache.set(LEADERBOARD_VERSION_KEY, time.time_ns(), None)
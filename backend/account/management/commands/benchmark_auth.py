@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from account.models import User
+
+BENCHMARK_USERNAME = '__benchmark_auth__'
+BENCHMARK_PASSWORD = 'benchmark-password'
+BENCHMARK_ENDPOINT = '/chat/conversations/'
+
+
+class Command(BaseCommand):
+    help = 'Compare logging in before every action against reusing the login token'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--actions', type=int, default=50, help='Authenticated requests per strategy')
+
+    def _measure(self, action, count):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(count):
+                action()
+            elapsed = time.perf_counter() - start
+        return elapsed, len(queries)
+
+    def _report(self, label, elapsed, queries, count):
+        self.stdout.write(
+            f'{label:<22} {elapsed * 1000 / count:8.2f} ms/action  {queries / count:6.2f} queries/action'
+        )
+
+    def handle(self, *args, **options):
+        count = options['actions']
+        client = APIClient()
+
+        # Everything the benchmark writes is rolled back at the end
+        with override_settings(ALLOWED_HOSTS=['testserver'], ALLOW_LEGACY_USER_ID_AUTH=True), transaction.atomic():
+            user = User.objects.create(username=BENCHMARK_USERNAME, role='parent')
+            user.set_password(BENCHMARK_PASSWORD)
+            user.save()
+            credentials = {'username': BENCHMARK_USERNAME, 'password': BENCHMARK_PASSWORD}
+
+            def login_per_action():
+                client.post('/account/login/', credentials, format='json')
+                client.get(BENCHMARK_ENDPOINT, HTTP_USER_ID=str(user.id))
+
+            token = client.post('/account/login/', credentials, format='json').data['token']
+
+            def token_reuse():
+                client.get(BENCHMARK_ENDPOINT, HTTP_AUTHORIZATION=f'Token {token}')
+
+            self.stdout.write(f'{count} authenticated requests to {BENCHMARK_ENDPOINT}')
+            self._report('login per action', *self._measure(login_per_action, count), count)
+            self._report('token reuse', *self._measure(token_reuse, count), count)
+
+            # Drop the rolled-back user/token from the auth caches
+            client.post('/account/logout/', HTTP_AUTHORIZATION=f'Token {token}')
+            user.delete()
+            transaction.set_rollback(True)
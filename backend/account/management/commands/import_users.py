@@ -0,0 +1,29 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from account.imports import IMPORT_BATCH_SIZE, ImportFormatError, UserImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Import users from a CSV or XLSX file and print a per-row error report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to a .csv or .xlsx file')
+        parser.add_argument('--dry-run', action='store_true', help='Validate only, do not create users')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        importer = UserImporter(dry_run=options['dry_run'], batch_size=options['batch_size'])
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                report = importer.run(read_rows(fileobj, options['path']))
+        except (OSError, ImportFormatError) as e:
+            raise CommandError(str(e))
+
+        for error in report['errors']:
+            self.stderr.write(json.dumps(error))
+        verb = 'would be created' if report['dry_run'] else 'created'
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['total_rows']} rows read, {report['created_count']} users {verb}, {report['error_count']} rows rejected"
+        ))
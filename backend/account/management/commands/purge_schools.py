@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from account.models import SchoolPurge
+from account.purge import PURGE_USER_BATCH_SIZE, run_purge
+
+
+class Command(BaseCommand):
+    help = 'Run or resume unfinished school purges (e.g. after a server restart interrupted one)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('purge_ids', nargs='*', type=int, help='Only these purges (default: every unfinished one)')
+        parser.add_argument('--batch-size', type=int, default=PURGE_USER_BATCH_SIZE, help='Users deleted per batch')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        purges = SchoolPurge.objects.filter(status__in=SchoolPurge.UNFINISHED_STATUSES).order_by('created_at')
+        if options['purge_ids']:
+            purges = purges.filter(id__in=options['purge_ids'])
+
+        def progress(purge):
+            self.stdout.write(f'  {purge.school_name}: {purge.users_deleted}/{purge.user_total} users deleted')
+
+        for purge in purges:
+            self.stdout.write(f'Purging {purge.school_name} (purge {purge.id})')
+            try:
+                run_purge(purge, batch_size=options['batch_size'], progress=progress)
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f'Purge {purge.id} failed: {e}'))
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f'{purge.school_name}: {purge.users_deleted} users and {purge.files_deleted} files deleted'
+            ))
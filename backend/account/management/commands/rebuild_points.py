@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from account.points import rebuild_points
+
+
+class Command(BaseCommand):
+    help = "Recompute every user's points, weekly points and streak from the points ledger"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backfill', action='store_true',
+            help='First add ledger entries for submitted assignments that have none',
+        )
+
+    def handle(self, *args, **options):
+        result = rebuild_points(backfill=options['backfill'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['backfilled']} ledger entries backfilled, {result['updated']} users rebuilt"
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from account.search import INDEX_BATCH_SIZE, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the user directory search index from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=INDEX_BATCH_SIZE, help='Users indexed per transaction')
+
+    def handle(self, *args, **options):
+        indexed = rebuild_index(
+            batch_size=options['batch_size'],
+            progress=lambda count: self.stdout.write(f'{count} users indexed'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt for {indexed} users'))
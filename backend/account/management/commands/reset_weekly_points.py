@@ -0,0 +1,31 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from account.weekly_reset import RESET_BATCH_SIZE, run_weekly_reset
+
+
+class Command(BaseCommand):
+    help = "Snapshot this week's standings and reset every user's weekly points in batches (resumable)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--week-ending', help='Week being closed, YYYY-MM-DD (default: today)')
+        parser.add_argument('--batch-size', type=int, default=RESET_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        week_ending = None
+        if options['week_ending']:
+            try:
+                week_ending = date.fromisoformat(options['week_ending'])
+            except ValueError:
+                raise CommandError('--week-ending must be YYYY-MM-DD')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        def progress(run):
+            self.stdout.write(f'  up to user {run.last_user_id}: {run.reset_count} reset')
+
+        run = run_weekly_reset(week_ending, batch_size=options['batch_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Week ending {run.week_ending}: {run.snapshot_count} standings saved, {run.reset_count} users reset'
+        ))
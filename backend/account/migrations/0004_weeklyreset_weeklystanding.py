@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0003_user_user_weekly_rank_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeeklyReset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_ending', models.DateField(help_text='Last day of the week being closed', unique=True)),
+                ('last_user_id', models.BigIntegerField(default=0, help_text='Highest user id already snapshotted and reset')),
+                ('snapshot_count', models.IntegerField(default=0)),
+                ('reset_count', models.IntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-week_ending'],
+            },
+        ),
+        migrations.CreateModel(
+            name='WeeklyStanding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekly_points', models.IntegerField(default=0)),
+                ('points', models.IntegerField(blank=True, default=0, null=True)),
+                ('reset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='standings', to='account.weeklyreset')),
+                ('school', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='account.school')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_standings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['reset', '-weekly_points'], name='account_wee_reset_i_d83b3d_idx')],
+                'constraints': [models.UniqueConstraint(fields=('reset', 'user'), name='uniq_weekly_standing')],
+            },
+        ),
+    ]
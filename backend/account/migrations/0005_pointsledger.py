@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0004_weeklyreset_weeklystanding'),
+        ('assignmentapp', '0006_alter_assignment_due_date_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointsLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField(help_text='Points added (negative to remove)')),
+                ('reason', models.CharField(choices=[('submission', 'Assignment submission'), ('adjustment', 'Manual adjustment')], default='submission', max_length=20)),
+                ('occurred_on', models.DateField(help_text='Day the points were earned (drives the streak)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('submission', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='points_entries', to='assignmentapp.assignmentsubmission')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='points_ledger', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+                'indexes': [models.Index(fields=['user', 'occurred_on'], name='account_poi_user_id_eaa315_idx'), models.Index(fields=['created_at'], name='account_poi_created_9dbd18_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:13
+
+import account.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0005_pointsledger'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', account.models.UserManager()),
+            ],
+        ),
+    ]
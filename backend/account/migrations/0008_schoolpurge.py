@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0007_usersearchgram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchoolPurge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('school_name', models.CharField(max_length=200)),
+                ('delete_school', models.BooleanField(default=False, help_text='Delete the school too once its users are gone')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('finished', 'Finished'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('user_total', models.IntegerField(default=0, help_text='Users in the school when the purge was requested')),
+                ('users_deleted', models.IntegerField(default=0)),
+                ('files_deleted', models.IntegerField(default=0)),
+                ('last_user_id', models.BigIntegerField(default=0, help_text='Highest user id deleted so far')),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('school', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='purges', to='account.school')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
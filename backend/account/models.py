@@ -1,6 +1,8 @@
 import email
-from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.auth.models import AbstractUser, UserManager as AuthUserManager
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Coalesce, Greatest
 from datetime import date, timedelta
 from django.utils import timezone
 
@@ -18,6 +20,24 @@ class School(models.Model):
         return self.name
 
 
+class UserQuerySet(models.QuerySet):
+    def with_current_streak(self, today: date | None = None):
+        """
+        Annotate each user with live_streak, the same value as User.current_streak
+        but computed in SQL, so lists can be filtered and ordered by it.
+        """
+        today = today or timezone.localdate()
+        return self.annotate(live_streak=Case(
+            When(last_submission__range=(today - timedelta(days=1), today), then=Coalesce(F('streaks'), 0)),
+            default=Value(0),
+            output_field=models.IntegerField(),
+        ))
+
+
+class UserManager(AuthUserManager.from_queryset(UserQuerySet)):
+    pass
+
+
 class User(AbstractUser):
     ROLE_CHOICES = [
         ('parent', 'Parent'),
@@ -37,7 +57,12 @@ class User(AbstractUser):
     streaks = models.IntegerField(default=0, blank=True, null=True)
     last_submission = models.DateField(blank=True, null=True)
 
-    
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Weekly leaderboard ranking, globally and per school
+            models.Index(fields=['role', 'is_active', '-weekly_points', 'id'], name='user_weekly_rank_idx'),
+            models.Index(fields=['school', 'role', 'is_active', '-weekly_points', 'id'], name='user_school_weekly_rank_idx'),
+        ]
 
     @property
     def current_streak(self) -> int:
@@ -47,6 +72,9 @@ class User(AbstractUser):
         - If last_submission was yesterday -> return stored streaks
         - Otherwise -> 0 (streak broken)
         """
+        if hasattr(self, 'live_streak'):
+            # Already computed by UserQuerySet.with_current_streak()
+            return self.live_streak
         if not self.last_submission:
             return 0
         today = timezone.localdate()
@@ -60,39 +88,195 @@ class User(AbstractUser):
     date_joined = None
     last_login = None
 
+    objects = UserManager()
+
     def __str__(self):
         return f"{self.username} ({self.role})"
     
-    def update_on_submission(self, points: int = 0, submitted_on: date | None = None) -> None:
+    def update_on_submission(self, points: int = 0, submitted_on: date | None = None, submission=None) -> None:
         """
         Call this when a submission is made today (or pass a specific date).
         Updates streak, points, and weekly points all at once.
+        The counters are updated with one atomic UPDATE (F() expressions), so concurrent
+        submissions cannot overwrite each other, and every points change is written to
+        the PointsLedger in the same transaction.
+        A second submission on the same day keeps the streak (it used to restart it at 1),
+        so the streak counts days with a submission, as rebuild_points does.
         
         Args:
-            points: Points to add to total points
-            weekly_points: Points to add to weekly points
+            points: Points to add to total and weekly points
             submitted_on: Date of submission (defaults to today)
+            submission: The AssignmentSubmission that earned the points, if any
         """
         today = submitted_on or date.today()
         
-        # Update streak logic
-        if self.last_submission == today - timedelta(days=1):
-            self.streaks = (self.streaks or 0) + 1
-        else:
-            self.streaks = 1
-        self.last_submission = today
-        
-        # Update points
+        # Streak: +1 if the last submission was yesterday, kept if it was today, otherwise restarts at 1
+        changes = {
+            'streaks': Case(
+                When(last_submission=today - timedelta(days=1), then=Coalesce(F('streaks'), 0) + 1),
+                When(last_submission=today, then=Greatest(Coalesce(F('streaks'), 0), 1)),
+                default=Value(1),
+            ),
+            'last_submission': today,
+        }
         if points:
-            self.points = (self.points or 0) + points
-            self.weekly_points = (self.weekly_points or 0) + points
-        
-        # Save all changes at once
-        update_fields = ["streaks", "last_submission"]
+            changes['points'] = Coalesce(F('points'), 0) + points
+            changes['weekly_points'] = Coalesce(F('weekly_points'), 0) + points
+
+        with transaction.atomic():
+            User.objects.filter(pk=self.pk).update(**changes)
+            if points:
+                PointsLedger.objects.create(
+                    user=self,
+                    delta=points,
+                    reason=PointsLedger.REASON_SUBMISSION,
+                    submission=submission,
+                    occurred_on=today,
+                )
+        self.refresh_from_db(fields=['streaks', 'last_submission', 'points', 'weekly_points'])
+
+        # .update() skips post_save, so drop the cached copy explicitly
+        from .authentication import invalidate_user
+        invalidate_user(self.pk)
         if points:
-            update_fields.append("points")
-            update_fields.append("weekly_points")
-            
-        self.save(update_fields=update_fields)
+            from .leaderboard import record_points
+            record_points(self)
+        from . import stats
+        stats.invalidate()
+
+
+class WeeklyReset(models.Model):
+    """
+    One run of the weekly points reset job.
+    Users are processed in id order, so last_user_id lets an interrupted run resume where it stopped.
+    """
+    week_ending = models.DateField(unique=True, help_text="Last day of the week being closed")
+    last_user_id = models.BigIntegerField(default=0, help_text="Highest user id already snapshotted and reset")
+    snapshot_count = models.IntegerField(default=0)
+    reset_count = models.IntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-week_ending']
+
+    def __str__(self):
+        return f"Weekly reset for week ending {self.week_ending}"
+
 
+class WeeklyStanding(models.Model):
+    """
+    A user's final weekly points, captured just before the weekly reset zeroes them.
+    """
+    reset = models.ForeignKey(WeeklyReset, on_delete=models.CASCADE, related_name='standings')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='weekly_standings')
+    school = models.ForeignKey(School, on_delete=models.SET_NULL, blank=True, null=True)
+    weekly_points = models.IntegerField(default=0)
+    points = models.IntegerField(default=0, blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['reset', 'user'], name='uniq_weekly_standing'),
+        ]
+        indexes = [
+            models.Index(fields=['reset', '-weekly_points']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.weekly_points} pts ({self.reset.week_ending})"
 
+
+class PointsLedger(models.Model):
+    """
+    Append-only record of every change to a user's points.
+    User.points / weekly_points / streaks can be rebuilt from it (manage.py rebuild_points).
+    """
+    REASON_SUBMISSION = 'submission'
+    REASON_ADJUSTMENT = 'adjustment'
+    REASON_CHOICES = [
+        (REASON_SUBMISSION, 'Assignment submission'),
+        (REASON_ADJUSTMENT, 'Manual adjustment'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='points_ledger')
+    delta = models.IntegerField(help_text="Points added (negative to remove)")
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES, default=REASON_SUBMISSION)
+    submission = models.ForeignKey(
+        'assignmentapp.AssignmentSubmission',
+        on_delete=models.SET_NULL,
+        blank=True, null=True,
+        related_name='points_entries',
+    )
+    occurred_on = models.DateField(help_text="Day the points were earned (drives the streak)")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['user', 'occurred_on']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.delta:+d} ({self.reason})"
+
+
+class UserSearchGram(models.Model):
+    """
+    User directory search index: one row per distinct n-gram of a user's username and
+    names, with the school and role copied on so searches can be scoped without a join.
+    Maintained by account.search (see signals.py).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_grams')
+    gram = models.CharField(max_length=3)
+    school = models.ForeignKey(School, on_delete=models.CASCADE, blank=True, null=True, related_name='+')
+    role = models.CharField(max_length=10)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'gram'], name='unique_user_search_gram'),
+        ]
+        indexes = [
+            models.Index(fields=['gram', 'school', 'role', 'user'], name='user_search_gram_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.gram!r}"
+
+
+class SchoolPurge(models.Model):
+    """
+    A batched deletion of every user in a school (and optionally the school itself).
+    Progress is saved after every batch, so an interrupted purge resumes where it
+    stopped (manage.py purge_schools). See account.purge.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_FINISHED = 'finished'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_FINISHED, 'Finished'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    UNFINISHED_STATUSES = [STATUS_PENDING, STATUS_RUNNING, STATUS_FAILED]
+
+    school = models.ForeignKey(School, on_delete=models.SET_NULL, blank=True, null=True, related_name='purges')
+    school_name = models.CharField(max_length=200)
+    delete_school = models.BooleanField(default=False, help_text="Delete the school too once its users are gone")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    user_total = models.IntegerField(default=0, help_text="Users in the school when the purge was requested")
+    users_deleted = models.IntegerField(default=0)
+    files_deleted = models.IntegerField(default=0)
+    last_user_id = models.BigIntegerField(default=0, help_text="Highest user id deleted so far")
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Purge of {self.school_name} ({self.status})"
@@ -0,0 +1,115 @@
+"""
+Rebuild every user's points, weekly points and streak from the PointsLedger.
+
+Totals come from one grouped query over the ledger. Streaks and last_submission come
+from the days users handed in assignments (AssignmentSubmission, whatever the
+assignment is worth, plus the ledger's submission entries for earlier hand-ins of
+resubmitted work); the results are written back with bulk_update.
+Submissions made before the ledger existed can be backfilled into it first.
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+from assignmentapp.models import AssignmentSubmission
+
+from . import leaderboard
+from .authentication import invalidate_all_users
+from .models import PointsLedger, User, WeeklyReset
+
+REBUILD_BATCH_SIZE = 500
+
+
+def _submitted_assignments():
+    """Handed-in submissions, with the day they were handed in as `day` (the date mark_submitted uses)"""
+    return AssignmentSubmission.objects.filter(status__gte=AssignmentSubmission.STATUS_SUBMITTED).annotate(
+        day=TruncDate(Coalesce('submitted_at', 'created_at'), tzinfo=dt_timezone.utc),
+    )
+
+
+def backfill_ledger():
+    """Add ledger entries for submitted assignments that have none; returns how many were added"""
+    missing = (
+        _submitted_assignments()
+        .exclude(points_entries__isnull=False)
+        .values('id', 'user_id', 'assignment__points', 'day')
+    )
+    entries = [
+        PointsLedger(
+            user_id=row['user_id'],
+            delta=row['assignment__points'],
+            reason=PointsLedger.REASON_SUBMISSION,
+            submission_id=row['id'],
+            occurred_on=row['day'],
+        )
+        for row in missing.iterator(chunk_size=REBUILD_BATCH_SIZE)
+        if row['assignment__points']
+    ]
+    PointsLedger.objects.bulk_create(entries, batch_size=REBUILD_BATCH_SIZE)
+    return len(entries)
+
+
+def _streaks():
+    """Map user id -> (streak, last day) from the days each user handed in work"""
+    days = {}
+    submitted = _submitted_assignments().values_list('user_id', 'day').distinct().order_by()
+    earlier = (
+        PointsLedger.objects.filter(reason=PointsLedger.REASON_SUBMISSION)
+        .values_list('user_id', 'occurred_on')
+        .distinct()
+        .order_by()
+    )
+    for rows in (submitted, earlier):
+        for user_id, day in rows.iterator(chunk_size=REBUILD_BATCH_SIZE * 4):
+            days.setdefault(user_id, set()).add(day)
+
+    streaks = {}
+    for user_id, user_days in days.items():
+        streak, last_day = 0, None
+        for day in sorted(user_days):
+            streak = streak + 1 if last_day == day - timedelta(days=1) else 1
+            last_day = day
+        streaks[user_id] = (streak, last_day)
+    return streaks
+
+
+def rebuild_points(backfill=False):
+    """Recompute points, weekly_points, streaks and last_submission for every user"""
+    backfilled = backfill_ledger() if backfill else 0
+
+    # Weekly points count from the end of the last weekly reset (all time if there has been none)
+    last_reset = WeeklyReset.objects.filter(finished_at__isnull=False).order_by('-finished_at').first()
+    weekly_filter = Q(created_at__gt=last_reset.finished_at) if last_reset else Q()
+    totals = {
+        row['user_id']: row
+        for row in PointsLedger.objects.values('user_id').annotate(
+            total=Sum('delta'),
+            weekly=Sum('delta', filter=weekly_filter),
+        )
+    }
+    streaks = _streaks()
+
+    updated = 0
+    batch = []
+    with transaction.atomic():
+        for user_id in User.objects.values_list('id', flat=True).iterator(chunk_size=REBUILD_BATCH_SIZE):
+            row = totals.get(user_id, {})
+            streak, last_day = streaks.get(user_id, (0, None))
+            batch.append(User(
+                id=user_id,
+                points=row.get('total') or 0,
+                weekly_points=row.get('weekly') or 0,
+                streaks=streak,
+                last_submission=last_day,
+            ))
+            if len(batch) >= REBUILD_BATCH_SIZE:
+                updated += User.objects.bulk_update(batch, ['points', 'weekly_points', 'streaks', 'last_submission'])
+                batch = []
+        if batch:
+            updated += User.objects.bulk_update(batch, ['points', 'weekly_points', 'streaks', 'last_submission'])
+
+    leaderboard.invalidate()
+    invalidate_all_users()
+    return {'backfilled': backfilled, 'updated': updated}
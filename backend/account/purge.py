@@ -0,0 +1,202 @@
+"""
+Batched school purge.
+
+Deleting a school's users with one queryset delete() makes Django's collector load
+every user, submission, attachment, message, forum post, like and comment of the
+school into memory and hold the database locked until it is done. Instead a
+SchoolPurge run takes the school's users PURGE_USER_BATCH_SIZE at a time and, for
+each batch, deletes what they own bottom-up (children before parents) in chunks of
+PURGE_ROW_BATCH_SIZE rows, each chunk its own short transaction. Uploaded files of
+deleted rows are removed from storage once that chunk has committed.
+
+Every step only deletes rows that the next run would delete anyway, so an
+interrupted purge is resumed simply by running it again (manage.py purge_schools).
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, ProtectedError, Q
+from django.utils import timezone
+
+from assignmentapp.models import Assignment, AssignmentSubmission, AssignmentVisibility, SubmissionAttachment
+from chatapp.models import Conversation, Message, Questionnaire
+from forumapp.models import Forum, ForumAttachment, ForumComment, ForumLike
+from mediaapp.models import UploadSession
+
+from . import leaderboard
+from .models import PointsLedger, School, SchoolPurge, User, UserSearchGram, WeeklyStanding
+
+PURGE_USER_BATCH_SIZE = 200
+PURGE_ROW_BATCH_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def _owned_rows(user_ids):
+    """(queryset, file field) pairs for everything these users own, children first"""
+    posts = Forum.objects.filter(posted_by_id__in=user_ids)
+    submissions = AssignmentSubmission.objects.filter(user_id__in=user_ids)
+    return [
+        (Message.objects.filter(from_user_id__in=user_ids), 'attachment'),
+        (Conversation.participants.through.objects.filter(user_id__in=user_ids), None),
+        (ForumLike.objects.filter(Q(forum_post__in=posts) | Q(liked_by_id__in=user_ids)), None),
+        (ForumComment.objects.filter(Q(forum_post__in=posts) | Q(comment_from_id__in=user_ids)), None),
+        (ForumAttachment.objects.filter(forum_post__in=posts), 'file'),
+        (posts, None),
+        (SubmissionAttachment.objects.filter(submission__in=submissions), 'blob'),
+        (PointsLedger.objects.filter(user_id__in=user_ids), None),
+        (submissions, None),
+        (Assignment.assigned_to.through.objects.filter(user_id__in=user_ids), None),
+        (AssignmentVisibility.objects.filter(user_id__in=user_ids), None),
+        (Questionnaire.objects.filter(created_by_id__in=user_ids), None),
+        (WeeklyStanding.objects.filter(user_id__in=user_ids), None),
+        (UserSearchGram.objects.filter(user_id__in=user_ids), None),
+        (UploadSession.objects.filter(user_id__in=user_ids), 'part'),
+    ]
+
+
+def _remove_files(purge_id, storage, names):
+    removed = 0
+    for name in names:
+        try:
+            storage.delete(name)
+            removed += 1
+        except OSError:
+            logger.warning('School purge %s could not remove %s', purge_id, name)
+    SchoolPurge.objects.filter(pk=purge_id).update(files_deleted=F('files_deleted') + removed)
+
+
+def _delete_rows(purge, queryset, file_field=None):
+    model = queryset.model
+    storage = model._meta.get_field(file_field).storage if file_field else None
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:PURGE_ROW_BATCH_SIZE])
+        if not ids:
+            return
+        rows = model.objects.filter(pk__in=ids)
+        names = [name for name in rows.values_list(file_field, flat=True) if name] if file_field else []
+        with transaction.atomic():
+            rows.delete()
+            if names:
+                transaction.on_commit(lambda names=names: _remove_files(purge.pk, storage, names))
+
+
+def _purge_users(purge, user_ids):
+    for queryset, file_field in _owned_rows(user_ids):
+        _delete_rows(purge, queryset, file_field)
+
+    with transaction.atomic():
+        User.objects.filter(id__in=user_ids).delete()
+        purge.users_deleted += len(user_ids)
+        purge.last_user_id = user_ids[-1]
+        purge.save(update_fields=['users_deleted', 'last_user_id'])
+    leaderboard.invalidate()
+
+
+def blocking_assignment_count(school):
+    """Assignments created by the school's users; they are PROTECTed and stop a purge"""
+    return Assignment.objects.filter(created_by__school=school).count()
+
+
+def run_purge(purge, batch_size=PURGE_USER_BATCH_SIZE, progress=None):
+    """
+    Delete every user of the purge's school, batch by batch, then the school itself
+    if requested. Safe to call again on a failed or interrupted purge.
+    `progress`, if given, is called with the purge after every batch.
+    """
+    if purge.status == SchoolPurge.STATUS_FINISHED:
+        return purge
+
+    purge.status = SchoolPurge.STATUS_RUNNING
+    purge.started_at = purge.started_at or timezone.now()
+    purge.error = ''
+    purge.save(update_fields=['status', 'started_at', 'error'])
+
+    try:
+        # school_id is cleared once the school is gone; never fall back to "users without a school"
+        while purge.school_id:
+            user_ids = list(
+                User.objects.filter(school_id=purge.school_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not user_ids:
+                break
+            _purge_users(purge, user_ids)
+            if progress:
+                progress(purge)
+
+        purge.refresh_from_db(fields=['delete_school'])
+        if purge.delete_school and purge.school_id:
+            School.objects.filter(id=purge.school_id).delete()
+    except ProtectedError:
+        purge.status = SchoolPurge.STATUS_FAILED
+        purge.error = 'Some users still own assignments; reassign or delete those assignments first'
+        purge.save(update_fields=['status', 'error'])
+        raise
+    except Exception as e:
+        purge.status = SchoolPurge.STATUS_FAILED
+        purge.error = str(e)
+        purge.save(update_fields=['status', 'error'])
+        raise
+
+    purge.status = SchoolPurge.STATUS_FINISHED
+    purge.finished_at = timezone.now()
+    purge.save(update_fields=['status', 'finished_at'])
+    return purge
+
+
+def _run_in_background(purge_id):
+    try:
+        run_purge(SchoolPurge.objects.get(pk=purge_id))
+    except Exception:
+        logger.exception('School purge %s failed; resume it with manage.py purge_schools', purge_id)
+    finally:
+        connection.close()
+
+
+def request_purge(school, delete_school=False):
+    """
+    Queue the deletion of every user in `school` (and of the school itself if
+    `delete_school`) and start it, in a background thread unless the
+    SCHOOL_PURGE_IN_BACKGROUND setting is False. A purge already under way for the
+    school is reused. Returns the SchoolPurge.
+    """
+    purge = SchoolPurge.objects.filter(school=school, status__in=SchoolPurge.UNFINISHED_STATUSES).first()
+    start = purge is None or purge.status == SchoolPurge.STATUS_FAILED
+    if purge is None:
+        purge = SchoolPurge.objects.create(
+            school=school,
+            school_name=school.name,
+            delete_school=delete_school,
+            user_total=school.user_set.count(),
+        )
+    elif delete_school and not purge.delete_school:
+        purge.delete_school = True
+        purge.save(update_fields=['delete_school'])
+
+    if start:
+        if getattr(settings, 'SCHOOL_PURGE_IN_BACKGROUND', True):
+            transaction.on_commit(
+                lambda: threading.Thread(target=_run_in_background, args=(purge.pk,), daemon=True).start()
+            )
+        else:
+            run_purge(purge)
+    return purge
+
+
+def purge_data(purge):
+    """Public progress report for a purge"""
+    return {
+        'id': purge.id,
+        'school': purge.school_name,
+        'delete_school': purge.delete_school,
+        'status': purge.status,
+        'user_total': purge.user_total,
+        'users_deleted': purge.users_deleted,
+        'files_deleted': purge.files_deleted,
+        'error': purge.error or None,
+        'created_at': purge.created_at,
+        'started_at': purge.started_at,
+        'finished_at': purge.finished_at,
+    }
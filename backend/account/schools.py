@@ -0,0 +1,78 @@
+"""
+School registry: the process-local name <-> id map of every school.
+
+Schools almost never change, yet most staff pages look one up by name or list them
+all. The whole table is loaded once (on first use) and reloaded when a School is
+saved or deleted (see signals.py), when the shared version key in the Django cache
+changes, or at the latest SCHOOL_REGISTRY_TTL seconds after loading, so other
+processes pick up changes too.
+"""
+import hashlib
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import School
+
+SCHOOL_REGISTRY_TTL = 60
+SCHOOL_REGISTRY_VERSION_KEY = 'account:schools:version'
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+class _Snapshot:
+    def __init__(self, version, rows):
+        self.version = version
+        self.expires = time.monotonic() + SCHOOL_REGISTRY_TTL
+        self.rows = rows  # [(id, name)] ordered by name
+        self.ids = {name: school_id for school_id, name in rows}
+        self.names = {school_id: name for school_id, name in rows}
+        self.etag = hashlib.sha1(repr(rows).encode()).hexdigest()
+
+
+def _current():
+    global _snapshot
+    version = cache.get_or_set(SCHOOL_REGISTRY_VERSION_KEY, time.time_ns, None)
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version or snapshot.expires < time.monotonic():
+        with _lock:
+            snapshot = _Snapshot(version, list(School.objects.order_by('name').values_list('id', 'name')))
+            _snapshot = snapshot
+    return snapshot
+
+
+def school_id(name):
+    """Id of the school with this name, or None"""
+    return _current().ids.get(name)
+
+
+def school_name(pk):
+    """Name of the school with this id, or None"""
+    return _current().names.get(pk)
+
+
+def get_school(name):
+    """The School with this name (built without a query), or None"""
+    snapshot = _current()
+    if name not in snapshot.ids:
+        return None
+    return School.from_db(DEFAULT_DB_ALIAS, ['id', 'name'], [snapshot.ids[name], name])
+
+
+def all_schools():
+    """Every school as {'id', 'name'}, ordered by name"""
+    return [{'id': school_id, 'name': name} for school_id, name in _current().rows]
+
+
+def etag():
+    """Changes whenever any school is added, renamed or removed"""
+    return _current().etag
+
+
+def invalidate():
+    global _snapshot
+    _snapshot = None
+    cache.set(SCHOOL_REGISTRY_VERSION_KEY, time.time_ns(), None)
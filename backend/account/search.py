@@ -0,0 +1,135 @@
+"""
+User directory search (chat user picker, find conversation).
+
+Every user is indexed as the distinct trigrams of their username and parent/child/
+teacher/staff names, stored in UserSearchGram next to their school and role, which
+scope a search instead of being matched as text. Each word is padded ("  chan ") so
+its leading grams ("  c", " ch") mark word starts; non-Latin words (Chinese names,
+written without spaces) are also indexed as bigrams.
+
+A search term is split the same way into
+- required grams: the inside of each word (its start when shorter than three letters),
+  enough of which must match for a hit, so typos still find the user;
+- boost grams: the word-start and word-end grams, which only add to the score, so
+  whole-word matches rank first, then names starting with the term, then names
+  merely containing it.
+Matching and ranking is a single GROUP BY over the covering (gram, school, role, user) index.
+"""
+import math
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import User, UserSearchGram
+
+SEARCH_FIELDS = ['username', 'parent_name', 'children_name', 'teacher_name', 'staff_name']
+SEARCH_RESULT_LIMIT = 20
+# Fraction of a term's required grams a user must share with it to match
+SEARCH_MIN_SIMILARITY = 0.3
+INDEX_BATCH_SIZE = 500
+
+
+def _words(text):
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    return ''.join(char if char.isalnum() else ' ' for char in text).split()
+
+
+def _document_grams(texts):
+    grams = set()
+    for text in texts:
+        for word in _words(text):
+            padded = f'  {word} '
+            grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+            if not word.isascii():
+                # Chinese names are written without spaces; bigrams let "大文" find "陳大文"
+                grams.update(word[i:i + 2] for i in range(len(word) - 1))
+    return grams
+
+
+def _query_grams(term):
+    required, boost = set(), set()
+    for word in _words(term):
+        padded = f'  {word} '
+        if len(word) >= 3:
+            required.update(word[i:i + 3] for i in range(len(word) - 2))
+        elif len(word) == 2:
+            required.add(padded[1:4] if word.isascii() else word)
+        else:
+            required.add(padded[:3])
+            continue
+        boost.update([padded[0:3], padded[1:4], padded[-3:]])
+    return required, boost
+
+
+def _index_rows(user):
+    return [
+        UserSearchGram(user_id=user.id, gram=gram, school_id=user.school_id, role=user.role)
+        for gram in _document_grams(getattr(user, field) for field in SEARCH_FIELDS)
+    ]
+
+
+def index_users(users):
+    """(Re)index the given saved users, e.g. after a bulk create"""
+    users = list(users)
+    with transaction.atomic():
+        UserSearchGram.objects.filter(user_id__in=[user.id for user in users]).delete()
+        UserSearchGram.objects.bulk_create(
+            [row for user in users for row in _index_rows(user)],
+            batch_size=INDEX_BATCH_SIZE * 10,
+        )
+
+
+def index_user(user):
+    index_users([user])
+
+
+def rebuild_index(batch_size=INDEX_BATCH_SIZE, progress=None):
+    """Rebuild the whole index in id-ordered batches; returns the number of users indexed"""
+    UserSearchGram.objects.all().delete()
+    indexed = 0
+    last_id = 0
+    while True:
+        batch = list(User.objects.filter(id__gt=last_id).order_by('id')[:batch_size])
+        if not batch:
+            return indexed
+        with transaction.atomic():
+            UserSearchGram.objects.bulk_create(
+                [row for user in batch for row in _index_rows(user)],
+                batch_size=batch_size * 10,
+            )
+        indexed += len(batch)
+        last_id = batch[-1].id
+        if progress:
+            progress(indexed)
+
+
+def search_user_ids(term, school_id=None, role=None, exclude_id=None, limit=SEARCH_RESULT_LIMIT):
+    """Ids of the users best matching `term`, best first, optionally within one school and/or role"""
+    required, boost = _query_grams(term)
+    if not required:
+        return []
+
+    grams = UserSearchGram.objects.filter(gram__in=required | boost)
+    if school_id:
+        grams = grams.filter(school_id=school_id)
+    if role:
+        grams = grams.filter(role=role)
+    if exclude_id:
+        grams = grams.exclude(user_id=exclude_id)
+
+    min_matches = max(1, math.ceil(len(required) * SEARCH_MIN_SIMILARITY))
+    matches = (
+        grams.values('user_id')
+        .annotate(matched=Count('id', filter=Q(gram__in=required)), score=Count('id'))
+        .filter(matched__gte=min_matches)
+        .order_by('-score', 'user_id')
+    )
+    return [row['user_id'] for row in matches[:limit]]
+
+
+def search_users(term, school_id=None, role=None, exclude_id=None, limit=SEARCH_RESULT_LIMIT):
+    """Like search_user_ids, but returns the users (school joined) in rank order"""
+    user_ids = search_user_ids(term, school_id, role, exclude_id, limit)
+    users = User.objects.select_related('school').in_bulk(user_ids)
+    return [users[user_id] for user_id in user_ids if user_id in users]
@@ -1,7 +1,46 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
+from django.db.models import F
 from .models import User, School
 
+
+# Columns fetched for every user row returned by the user-list endpoints
+USER_ROW_FIELDS = ['id', 'username', 'role', 'parent_name', 'children_name', 'staff_name', 'teacher_name']
+
+
+def iter_user_rows(users, include_school=True, chunk_size=None):
+    """
+    Fast read-only serializer for user list endpoints.
+    Projects the queryset with values() so users, their school names and live streaks
+    (UserQuerySet.with_current_streak) come back in a single query.
+    Pass chunk_size to stream rows from a server-side cursor instead of loading them all.
+    """
+    if 'live_streak' not in users.query.annotations:
+        users = users.with_current_streak()
+    rows = users.values(
+        *USER_ROW_FIELDS,
+        'points', 'weekly_points', 'live_streak', 'is_active',
+        school_name=F('school__name'),
+    )
+    if chunk_size:
+        rows = rows.iterator(chunk_size=chunk_size)
+
+    for row in rows:
+        user_data = {field: row[field] for field in USER_ROW_FIELDS}
+        if include_school:
+            user_data['school'] = row['school_name']
+        user_data['points'] = row['points']
+        user_data['weekly_points'] = row['weekly_points']
+        user_data['streaks'] = row['live_streak']
+        user_data['is_active'] = row['is_active']
+        yield user_data
+
+
+def user_rows(users, include_school=True):
+    """Serialize a user queryset into a list of row dicts (see iter_user_rows)."""
+    return list(iter_user_rows(users, include_school=include_school))
+
+
 class SchoolSerializer(serializers.ModelSerializer):
     """Serializer for School model - handles create, read, update operations"""
     
@@ -15,12 +54,11 @@ class SchoolSerializer(serializers.ModelSerializer):
         if not value or not value.strip():
             raise serializers.ValidationError("School name cannot be empty.")
         
-        # Check for uniqueness during creation
-        if not self.instance and School.objects.filter(name=value).exists():
-            raise serializers.ValidationError(f"School with name '{value}' already exists.")
-        
-        # Check for uniqueness during update (excluding current instance)
-        if self.instance and School.objects.filter(name=value).exclude(pk=self.instance.pk).exists():
+        # Checked against the database, not the cached registry, which may be stale
+        existing = School.objects.filter(name=value.strip())
+        if self.instance:
+            existing = existing.exclude(pk=self.instance.pk)
+        if existing.exists():
             raise serializers.ValidationError(f"School with name '{value}' already exists.")
             
         return value.strip()
@@ -39,11 +77,12 @@ class UserSerializer(serializers.ModelSerializer):
     def validate_school(self, value):
         """Validate that the school exists if provided"""
         if value:
-            try:
-                school = School.objects.get(name=value)
-                return school
-            except School.DoesNotExist:
+            # From the database, not the registry snapshot, which may still list a school
+            # another process has just deleted
+            school = School.objects.filter(name=value).first()
+            if school is None:
                 raise serializers.ValidationError(f"School '{value}' does not exist. Please provide a valid school name.")
+            return school
         return None
     
     def create(self, validated_data):
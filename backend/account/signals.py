@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_all_users, invalidate_token, invalidate_user
+from .models import School, User
+from . import schools, search
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def reindex_user(sender, instance, update_fields=None, **kwargs):
+    indexed_fields = {*search.SEARCH_FIELDS, 'school', 'role'}
+    if update_fields is None or indexed_fields & set(update_fields):
+        search.index_user(instance)
+
+
+@receiver([post_save, post_delete], sender=School)
+def forget_cached_users_of_school(sender, instance, **kwargs):
+    invalidate_all_users()
+    # Again after commit, in case another request reloaded the registry in between
+    schools.invalidate()
+    transaction.on_commit(schools.invalidate)
+
+
+@receiver(post_delete, sender=Token)
+def forget_cached_token(sender, instance, **kwargs):
+    invalidate_token(instance.key)
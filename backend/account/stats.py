@@ -0,0 +1,98 @@
+"""
+Per-school dashboard statistics.
+
+The figures for every school come from one grouped aggregate over User (submission
+counts are correlated subqueries inside it, so they do not multiply the user sums)
+and are cached together for SCHOOL_STATS_CACHE_TIMEOUT seconds. A submission or a
+weekly reset drops the cache straight away.
+"""
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Exists, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from assignmentapp.models import AssignmentSubmission
+
+from .models import User
+
+SCHOOL_STATS_CACHE_TIMEOUT = 60
+SCHOOL_STATS_VERSION_KEY = 'account:school-stats:version'
+RECENT_SUBMISSION_DAYS = 7
+
+EMPTY_STATS = {
+    'user_count': 0,
+    'parent_count': 0,
+    'active_parent_count': 0,
+    'teacher_count': 0,
+    'staff_count': 0,
+    'total_points': 0,
+    'weekly_points': 0,
+    'submission_count': 0,
+    'recent_submission_count': 0,
+    'recent_submitter_count': 0,
+}
+
+
+def _cache_key():
+    version = cache.get_or_set(SCHOOL_STATS_VERSION_KEY, time.time_ns, None)
+    return f'account:school-stats:{version}'
+
+
+def _submission_count(submissions):
+    """Correlated per-user count of `submissions`"""
+    return Subquery(
+        submissions.order_by().values('user').annotate(count=Count('id')).values('count'),
+        output_field=IntegerField(),
+    )
+
+
+def _compute():
+    since = timezone.now() - timedelta(days=RECENT_SUBMISSION_DAYS)
+    submitted = AssignmentSubmission.objects.filter(
+        user=OuterRef('pk'), status__gte=AssignmentSubmission.STATUS_SUBMITTED,
+    )
+    recent = submitted.filter(created_at__gte=since)
+    active_parent = Q(role='parent', is_active=True)
+
+    rows = (
+        User.objects.filter(school__isnull=False)
+        .values('school_id')
+        .annotate(
+            user_count=Count('id'),
+            parent_count=Count('id', filter=Q(role='parent')),
+            active_parent_count=Count('id', filter=active_parent),
+            teacher_count=Count('id', filter=Q(role='teacher')),
+            staff_count=Count('id', filter=Q(role='staff')),
+            total_points=Coalesce(Sum('points'), 0),
+            weekly_points=Coalesce(Sum('weekly_points'), 0),
+            submission_count=Coalesce(Sum(_submission_count(submitted)), 0),
+            recent_submission_count=Coalesce(Sum(_submission_count(recent)), 0),
+            recent_submitter_count=Count('id', filter=active_parent & Q(Exists(recent))),
+        )
+        .order_by()
+    )
+    return {row.pop('school_id'): row for row in rows}
+
+
+def school_stats(school_id):
+    """Dashboard figures for one school (zeros for a school without users)"""
+    key = _cache_key()
+    all_stats = cache.get(key)
+    if all_stats is None:
+        all_stats = _compute()
+        cache.set(key, all_stats, SCHOOL_STATS_CACHE_TIMEOUT)
+
+    stats = dict(all_stats.get(school_id, EMPTY_STATS))
+    active_parents = stats['active_parent_count']
+    stats['recent_submission_rate'] = (
+        round(stats['recent_submitter_count'] / active_parents, 4) if active_parents else 0.0
+    )
+    stats['recent_days'] = RECENT_SUBMISSION_DAYS
+    return stats
+
+
+def invalidate():
+    cache.set(SCHOOL_STATS_VERSION_KEY, time.time_ns(), None)
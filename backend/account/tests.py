@@ -1,3 +1,779 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from assignmentapp.models import Assignment, AssignmentSubmission, SubmissionAttachment
+from chatapp.models import Conversation, Message
+from forumapp.models import Forum, ForumComment, ForumLike
+from mediaapp.blobs import collect_garbage
+from mediaapp.models import Blob
+
+from .models import User, School, SchoolPurge, WeeklyReset
+from .bulk import bulk_create_users
+from .points import rebuild_points
+from .serializers import SchoolSerializer, UserSerializer
+from .purge import run_purge
+from .weekly_reset import run_weekly_reset
+from . import leaderboard, schools, search, stats
+from .authentication import USER_LOCAL_CACHE_TTL, get_cached_user, invalidate_all_users
+
+
+class UserListQueryCountTests(TestCase):
+    """The user list endpoints must not issue one query per user."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name='Sunshine Kindergarten')
+        other = School.objects.create(name='Harbour Kindergarten')
+        today = timezone.localdate()
+        for i in range(20):
+            User.objects.create(
+                username=f'parent{i:02d}',
+                role='parent',
+                parent_name=f'Parent {i}',
+                school=cls.school if i % 2 else other,
+                streaks=3,
+                last_submission=today - timedelta(days=i % 3),
+            )
+        cls.teacher = User.objects.create(username='teacher', role='teacher', school=cls.school)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_get_all_users(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/account/users/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_count'], 21)
+
+    def test_get_user_by_school(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/account/users/by-school/', {'school': self.school.name})
+        self.assertEqual(response.data['total_count'], 11)
+        self.assertTrue(all(u['school'] == self.school.name for u in response.data['users']))
+
+    def test_school_users(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/account/schools/{self.school.name}/users/')
+        self.assertEqual(response.data['total_count'], 11)
+        self.assertNotIn('school', response.data['users'][0])
+
+    def test_update_user_name(self):
+        # The body's user_id names the user to rename, not the caller; the rename refreshes
+        # the user's search index (savepoint, delete, insert, release)
+        with self.assertNumQueries(7):
+            response = self.client.post(
+                '/account/users/update-name/',
+                {'user_id': self.teacher.id, 'teacher_name': 'Ms Chan'},
+                format='json',
+            )
+        self.assertEqual(response.data['user']['teacher_name'], 'Ms Chan')
+        self.assertEqual(response.data['user']['school'], self.school.name)
+
+    def test_streak_matches_current_streak(self):
+        response = self.client.get('/account/users/')
+        streaks = {u['id']: u['streaks'] for u in response.data['users']}
+        for user in User.objects.filter(role__in=['staff', 'teacher', 'parent']):
+            self.assertEqual(streaks[user.id], user.current_streak)
+
+
+class UserListPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(7):
+            User.objects.create(username=f'user{i}', role='parent')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_cursor_walks_every_user_once(self):
+        seen = []
+        cursor = ''
+        while True:
+            response = self.client.get('/account/users/', {'page_size': 3, 'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            seen.extend(u['id'] for u in response.data['users'])
+            cursor = response.data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, list(User.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_invalid_page_size(self):
+        response = self.client.get('/account/users/', {'page_size': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_stream_ndjson(self):
+        response = self.client.get('/account/users/', {'stream': 'ndjson'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 7)
+        self.assertEqual(json.loads(lines[0])['username'], 'user0')
+
+    def test_stream_json_keeps_response_shape(self):
+        response = self.client.get('/account/users/', {'stream': 'json'})
+        body = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(body['total_count'], 7)
+        self.assertEqual(len(body['users']), 7)
+
+
+class WeeklyLeaderboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name='Sunshine Kindergarten')
+        cls.parents = [
+            User.objects.create(username=f'parent{i}', role='parent', school=cls.school, weekly_points=i * 10)
+            for i in range(8)
+        ]
+        User.objects.create(username='inactive', role='parent', weekly_points=1000, is_active=False)
+
+    def setUp(self):
+        self.client = APIClient()
+        leaderboard.invalidate()
+
+    def test_top_n(self):
+        response = self.client.get('/account/leaderboard/weekly/', {'limit': 3})
+        self.assertEqual([e['username'] for e in response.data['leaderboard']], ['parent7', 'parent6', 'parent5'])
+        self.assertEqual([e['rank'] for e in response.data['leaderboard']], [1, 2, 3])
+
+    def test_cached_read_does_not_scan(self):
+        self.client.get('/account/leaderboard/weekly/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/account/leaderboard/weekly/')
+        self.assertEqual(response.data['total_count'], 5)
+
+    def test_submission_updates_cache_in_place(self):
+        self.client.get('/account/leaderboard/weekly/')
+        self.client.get('/account/leaderboard/weekly/', {'school': self.school.name})
+        climber = self.parents[0]
+        climber.update_on_submission(points=500)
+
+        for params in ({}, {'school': self.school.name}):
+            response = self.client.get('/account/leaderboard/weekly/', params)
+            top = response.data['leaderboard'][0]
+            self.assertEqual(top['id'], climber.id)
+            self.assertEqual(top['weekly_points'], 500)
+            self.assertEqual(top['current_streak'], 1)
+
+    def test_concurrent_updates_are_not_lost(self):
+        self.client.get('/account/leaderboard/weekly/')
+        climber, rival = self.parents[0], self.parents[1]
+        real_get = cache.get
+        raced = []
+
+        def racing_get(key, *args, **kwargs):
+            rows = real_get(key, *args, **kwargs)
+            if key.startswith('leaderboard:weekly:') and key.endswith(':all') and not raced:
+                # The rival's submission lands while the climber's is updating the board
+                raced.append(key)
+                User.objects.filter(id=rival.id).update(weekly_points=400)
+                rival.refresh_from_db()
+                leaderboard.record_points(rival)
+            return rows
+
+        with mock.patch.object(cache, 'get', side_effect=racing_get):
+            climber.update_on_submission(points=500)
+
+        response = self.client.get('/account/leaderboard/weekly/', {'limit': 2})
+        self.assertEqual([e['id'] for e in response.data['leaderboard']], [climber.id, rival.id])
+
+    def test_rank_around_me(self):
+        me = self.parents[3]
+        response = self.client.get('/account/leaderboard/weekly/', {'user_id': me.id, 'around': 2})
+        self.assertEqual(response.data['me']['rank'], 5)
+        window = response.data['around_me']
+        self.assertEqual([e['id'] for e in window], [p.id for p in (self.parents[5], self.parents[4], me, self.parents[2], self.parents[1])])
+        self.assertEqual([e['rank'] for e in window], [3, 4, 5, 6, 7])
+
+
+class WeeklyResetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name='Sunshine Kindergarten')
+        for i in range(10):
+            User.objects.create(username=f'parent{i}', role='parent', school=cls.school, points=100, weekly_points=i)
+
+    def test_snapshots_then_resets_in_batches(self):
+        batches = []
+        run = run_weekly_reset(batch_size=3, progress=lambda r: batches.append(r.last_user_id))
+
+        self.assertEqual(len(batches), 4)
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual(run.snapshot_count, 9)
+        self.assertFalse(User.objects.exclude(weekly_points=0).exists())
+        self.assertEqual(
+            list(run.standings.order_by('-weekly_points').values_list('weekly_points', flat=True)[:3]),
+            [9, 8, 7],
+        )
+
+    def test_resumes_after_interruption(self):
+        first_id = User.objects.order_by('id').first().id
+        run = WeeklyReset.objects.create(week_ending=timezone.localdate(), last_user_id=first_id + 4)
+
+        run = run_weekly_reset()
+
+        # Users up to last_user_id were already handled by the interrupted run
+        self.assertEqual(run.snapshot_count, 5)
+        self.assertEqual(User.objects.filter(weekly_points__gt=0).count(), 4)
+
+    def test_finished_run_is_not_repeated(self):
+        run_weekly_reset()
+        User.objects.filter(username='parent1').update(weekly_points=5)
+        run_weekly_reset()
+        self.assertEqual(User.objects.get(username='parent1').weekly_points, 5)
+
+    def test_second_reset_on_the_same_day_is_refused(self):
+        client = APIClient()
+        response = client.post('/account/points/weekly/reset/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['reset_count'], response.data['changed_count']), (10, 9))
+        self.assertFalse(response.data['already_reset'])
+
+        User.objects.filter(username='parent1').update(weekly_points=5)
+        again = client.post('/account/points/weekly/reset/')
+        self.assertEqual(again.status_code, 409)
+        self.assertTrue(again.data['already_reset'])
+        self.assertEqual((again.data['snapshot_count'], again.data['changed_count']), (9, 9))
+        self.assertEqual(User.objects.get(username='parent1').weekly_points, 5)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class GenerateAccountsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name='Sunshine Kindergarten')
+        User.objects.create(username='reach00001', role='parent')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_generates_unique_usable_accounts(self):
+        response = self.client.post(
+            '/account/generate_accounts_by_school/',
+            {'school_name': self.school.name, 'role': 'parent', 'number': 20},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        accounts = response.data['accounts']
+        self.assertEqual(len({a['username'] for a in accounts}), 20)
+        self.assertNotIn('reach00001', {a['username'] for a in accounts})
+        self.assertEqual(User.objects.filter(school=self.school).count(), 20)
+        user = User.objects.get(username=accounts[0]['username'])
+        self.assertTrue(user.check_password(accounts[0]['password']))
+
+    def test_csv_download(self):
+        response = self.client.post(
+            '/account/generate_accounts_by_school/',
+            {'school_name': self.school.name, 'role': 'teacher', 'number': 3, 'format': 'csv'},
+            format='json',
+        )
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'username,password,role,school')
+        self.assertEqual(len(lines), 4)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ImportUsersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name='Sunshine Kindergarten')
+        User.objects.create(username='taken', role='parent')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def _upload(self, content, **extra):
+        upload = SimpleUploadedFile('users.csv', content.encode(), content_type='text/csv')
+        return self.client.post('/account/users/import/', {'file': upload, **extra}, format='multipart')
+
+    def test_imports_valid_rows_and_reports_the_rest(self):
+        response = self._upload(
+            'username,password,role,school,parent_name\n'
+            'mum1,secret1,parent,Sunshine Kindergarten,Mrs Wong\n'
+            'taken,secret2,parent,,\n'
+            'mum1,secret3,parent,,\n'
+            'teach1,secret4,teacher,Nowhere,\n'
+            'teach2,secret5,teacher,,\n'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created_count'], 2)
+        self.assertEqual([e['row'] for e in response.data['errors']], [3, 4, 5])
+
+        mum = User.objects.get(username='mum1')
+        self.assertEqual(mum.school, self.school)
+        self.assertEqual(mum.parent_name, 'Mrs Wong')
+        self.assertTrue(mum.check_password('secret1'))
+
+    def test_dry_run_creates_nothing(self):
+        response = self._upload('username,password\nnew1,secret\n', dry_run='true')
+        self.assertEqual(response.data['created_count'], 1)
+        self.assertFalse(User.objects.filter(username='new1').exists())
+
+    def test_unreadable_files_are_refused(self):
+        upload = SimpleUploadedFile('users.csv', 'username,password\nmaman,cl\xe9\n'.encode('latin-1'))
+        response = self.client.post('/account/users/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('UTF-8', response.data['error'])
+
+        # A quoted field longer than the csv module allows
+        response = self._upload('username,password\nmum1,secret\nmum2,"' + 'x' * 200000 + '"\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Row 3', response.data['error'])
+        # Still in its first batch, so nothing was imported
+        self.assertEqual(response.data['created_count'], 0)
+        self.assertFalse(User.objects.filter(username='mum1').exists())
+
+        upload = SimpleUploadedFile('users.xlsx', b'PK\x03\x04 not really a workbook')
+        response = self.client.post('/account/users/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_unknown_file_type(self):
+        upload = SimpleUploadedFile('users.txt', b'x')
+        response = self.client.post('/account/users/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(ALLOW_LEGACY_USER_ID_AUTH=True)
+class UserIDAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name='Sunshine Kindergarten')
+        cls.user = User.objects.create(username='mum', role='parent', school=cls.school)
+
+    def setUp(self):
+        self.client = APIClient()
+        invalidate_all_users()
+
+    def test_user_is_resolved_once_then_cached(self):
+        with self.assertNumQueries(1):
+            user = get_cached_user(self.user.id)
+        with self.assertNumQueries(0):
+            again = get_cached_user(self.user.id)
+            self.assertEqual(again.school.name, self.school.name)
+        self.assertIsNot(user, again)
+
+    def test_save_invalidates(self):
+        get_cached_user(self.user.id)
+        self.user.parent_name = 'Mrs Wong'
+        self.user.save()
+        self.assertEqual(get_cached_user(self.user.id).parent_name, 'Mrs Wong')
+
+    def test_school_rename_invalidates(self):
+        get_cached_user(self.user.id)
+        self.school.name = 'Moonlight Kindergarten'
+        self.school.save()
+        self.assertEqual(get_cached_user(self.user.id).school.name, 'Moonlight Kindergarten')
+
+    def test_per_process_cache_keeps_users_only_as_long_as_the_local_copy(self):
+        with mock.patch('account.authentication.cache.set') as cache_set:
+            get_cached_user(self.user.id)
+        self.assertEqual(cache_set.call_args.args[2], USER_LOCAL_CACHE_TTL)
+
+    def test_header_sets_request_user(self):
+        response = self.client.get('/chat/conversations/', HTTP_USER_ID=str(self.user.id))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/chat/conversations/', HTTP_USER_ID='999999')
+        self.assertEqual(response.status_code, 401)
+
+    def test_only_the_header_is_read(self):
+        response = self.client.get('/chat/conversations/', {'user_id': self.user.id})
+        self.assertEqual(response.status_code, 401)
+        response = self.client.post('/chat/conversations/create/', {'user_id': self.user.id}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(ALLOW_LEGACY_USER_ID_AUTH=False)
+    def test_header_is_ignored_unless_allowed(self):
+        response = self.client.get('/chat/conversations/', HTTP_USER_ID=str(self.user.id))
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class TokenAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='mum', role='parent')
+        cls.user.set_password('secret')
+        cls.user.save()
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def _login(self):
+        response = self.client.post('/account/login/', {'username': 'mum', 'password': 'secret'}, format='json')
+        return response.data['token']
+
+    def test_cached_token_costs_no_queries(self):
+        token = self._login()
+        self.client.get('/chat/conversations/', HTTP_AUTHORIZATION=f'Token {token}')
+        # Only the view's own conversation query remains
+        with self.assertNumQueries(1):
+            response = self.client.get('/chat/conversations/', HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout_revokes_token(self):
+        token = self._login()
+        self.client.post('/account/logout/', HTTP_AUTHORIZATION=f'Token {token}')
+        response = self.client.get('/chat/conversations/', HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        token = self._login()
+        self.client.post('/account/users/deactivate/', {'user_id': self.user.id}, format='json')
+        response = self.client.get('/chat/conversations/', HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(response.status_code, 401)
+
+
+class PointsLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='mum', role='parent')
+
+    def test_submission_updates_counters_and_ledger(self):
+        today = timezone.localdate()
+        self.user.update_on_submission(points=10, submitted_on=today - timedelta(days=1))
+        self.user.update_on_submission(points=5, submitted_on=today)
+        self.user.update_on_submission(points=5, submitted_on=today)
+
+        self.assertEqual((self.user.points, self.user.weekly_points, self.user.streaks), (20, 20, 2))
+        self.assertEqual(list(self.user.points_ledger.values_list('delta', flat=True)), [10, 5, 5])
+
+    def test_same_day_resubmission_keeps_the_streak(self):
+        today = timezone.localdate()
+        for days_ago in (2, 1, 0):
+            self.user.update_on_submission(points=10, submitted_on=today - timedelta(days=days_ago))
+        self.assertEqual(self.user.streaks, 3)
+
+        self.user.update_on_submission(points=10, submitted_on=today)
+        self.assertEqual((self.user.streaks, self.user.last_submission), (3, today))
+        self.user.update_on_submission(submitted_on=today + timedelta(days=1))
+        self.assertEqual(self.user.streaks, 4)
+
+    def test_stale_instances_do_not_lose_points(self):
+        first = User.objects.get(id=self.user.id)
+        second = User.objects.get(id=self.user.id)
+        first.update_on_submission(points=10)
+        second.update_on_submission(points=10)
+        self.assertEqual(User.objects.get(id=self.user.id).points, 20)
+
+    def test_rebuild_from_ledger(self):
+        today = timezone.localdate()
+        for days_ago in (5, 2, 1, 0):
+            self.user.update_on_submission(points=10, submitted_on=today - timedelta(days=days_ago))
+        User.objects.filter(id=self.user.id).update(points=0, weekly_points=0, streaks=0, last_submission=None)
+
+        rebuild_points()
+
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.points, self.user.weekly_points, self.user.streaks), (40, 40, 3))
+        self.assertEqual(self.user.last_submission, today)
+
+    def test_rebuild_counts_submissions_worth_no_points(self):
+        teacher = User.objects.create(username='teacher', role='teacher')
+        now = timezone.now()
+        for days_ago, points in ((2, 0), (1, 0), (0, 10)):
+            assignment = Assignment.objects.create(
+                name=f'Task {days_ago}', release_date=now - timedelta(days=3), due_date=now + timedelta(days=1),
+                created_by=teacher, points=points,
+            )
+            AssignmentSubmission.objects.create(user=self.user, assignment=assignment).mark_submitted(
+                when=now - timedelta(days=days_ago),
+            )
+        self.user.refresh_from_db()
+        live = (self.user.points, self.user.streaks, self.user.last_submission)
+        User.objects.filter(id=self.user.id).update(points=0, weekly_points=0, streaks=0, last_submission=None)
+
+        rebuild_points(backfill=True)
+
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.points, self.user.streaks, self.user.last_submission), live)
+        self.assertEqual(live, (10, 3, now.date()))
+
+
+class CurrentStreakAnnotationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name='Sunshine Kindergarten')
+        today = timezone.localdate()
+        for username, streaks, days_ago in [('today', 8, 0), ('yesterday', 7, 1), ('broken', 9, 2), ('never', 0, None)]:
+            User.objects.create(
+                username=username, role='parent', school=cls.school, streaks=streaks,
+                last_submission=today - timedelta(days=days_ago) if days_ago is not None else None,
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_annotation_matches_property(self):
+        for user in User.objects.with_current_streak():
+            self.assertEqual(user.live_streak, User.objects.get(id=user.id).current_streak)
+
+    def test_min_streak_and_ordering(self):
+        response = self.client.get(
+            f'/account/schools/{self.school.name}/users/', {'min_streak': 7, 'ordering': '-streak'}
+        )
+        self.assertEqual([user['username'] for user in response.data['users']], ['today', 'yesterday'])
+        self.assertEqual([user['streaks'] for user in response.data['users']], [8, 7])
+
+    def test_invalid_params(self):
+        self.assertEqual(self.client.get('/account/users/', {'min_streak': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/account/users/', {'ordering': 'streak', 'page_size': 2}).status_code, 400)
+
+
+@override_settings(ALLOW_LEGACY_USER_ID_AUTH=True)
+class UserSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name='Sunshine Kindergarten')
+        other = School.objects.create(name='Harbour Kindergarten')
+        cls.me = User.objects.create(username='me', role='parent', school=cls.school)
+        cls.chan = User.objects.create(username='p1', role='parent', parent_name='Chan Tai Man', school=cls.school)
+        cls.smith = User.objects.create(username='p2', role='parent', parent_name='Anna Smith', school=cls.school)
+        cls.chandler = User.objects.create(username='p3', role='parent', parent_name='Ben Chandler', school=other)
+        cls.teacher = User.objects.create(username='t1', role='teacher', teacher_name='Miss Chan', school=cls.school)
+
+    def test_prefix_matches_rank_first(self):
+        self.assertEqual(search.search_user_ids('mith'), [self.smith.id])
+        self.assertEqual(search.search_user_ids('chan')[:2], [self.chan.id, self.teacher.id])
+
+    def test_fuzzy_match(self):
+        self.assertEqual(search.search_user_ids('smiht'), [self.smith.id])
+
+    def test_scoped_by_school_and_role(self):
+        self.assertEqual(search.search_user_ids('chan', school_id=self.school.id, role='parent'), [self.chan.id])
+
+    def test_index_follows_saves_and_bulk_creates(self):
+        self.chan.parent_name = 'Wong Siu Ming'
+        self.chan.save()
+        self.assertNotIn(self.chan.id, search.search_user_ids('chan'))
+
+        self.chan.school = None
+        self.chan.save()
+        self.assertIn(self.chan.id, search.search_user_ids('wong'))
+        self.assertNotIn(self.chan.id, search.search_user_ids('wong', school_id=self.school.id))
+
+        bulk_create_users([User(username='bulk1', parent_name='Zed Zhou')])
+        self.assertEqual(len(search.search_user_ids('zhou')), 1)
+
+    def test_chat_search_endpoint(self):
+        client = APIClient()
+        response = client.get('/chat/users/search/', {'q': 'chan', 'role': 'parent'}, HTTP_USER_ID=self.me.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([user['id'] for user in response.data['users']], [self.chan.id, self.chandler.id])
+
+
+@override_settings(SCHOOL_PURGE_IN_BACKGROUND=False)
+class SchoolPurgeTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=self.media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.school = School.objects.create(name='Sunshine Kindergarten')
+        self.parents = [User.objects.create(username=f'p{i}', role='parent', school=self.school) for i in range(5)]
+        other_school = School.objects.create(name='Harbour Kindergarten')
+        self.outsider = User.objects.create(username='outsider', role='parent', school=other_school)
+        teacher = User.objects.create(username='teacher', role='teacher', school=other_school)
+
+        conversation = Conversation.objects.create(created_by=self.parents[0])
+        conversation.participants.add(self.parents[0], self.outsider)
+        Message.objects.create(
+            conversation=conversation, from_user=self.parents[0],
+            attachment=SimpleUploadedFile('hello.txt', b'hello'),
+        )
+        Message.objects.create(conversation=conversation, from_user=self.outsider, text='hi')
+        post = Forum.objects.create(posted_by=self.parents[1], content='post')
+        ForumLike.objects.create(forum_post=post, liked_by=self.outsider)
+        ForumComment.objects.create(forum_post=post, comment_from=self.outsider, content='nice')
+        assignment = Assignment.objects.create(
+            name='Read', release_date=timezone.now(), due_date=timezone.now(), created_by=teacher,
+        )
+        submission = AssignmentSubmission.objects.create(user=self.parents[2], assignment=assignment)
+        attachment = SubmissionAttachment.objects.create(
+            submission=submission, blob=SimpleUploadedFile('work.txt', b'work'),
+        )
+        self.files = [Message.objects.get(from_user=self.parents[0]).attachment.path, attachment.blob.path]
+        self.client = APIClient()
+
+    def test_delete_school_purges_users_dependents_and_files(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/account/schools/{self.school.name}/')
+        self.assertEqual(response.status_code, 202)
+
+        self.assertFalse(School.objects.filter(id=self.school.id).exists())
+        self.assertEqual(list(User.objects.filter(role='parent')), [self.outsider])
+        self.assertEqual(list(Message.objects.values_list('from_user', flat=True)), [self.outsider.id])
+        self.assertFalse(Forum.objects.exists() or ForumLike.objects.exists() or ForumComment.objects.exists())
+        self.assertFalse(AssignmentSubmission.objects.exists())
+        # The purge drops the files' references; the media sweep then removes them
+        self.assertEqual(Blob.objects.filter(ref_count=0).count(), 2)
+        collect_garbage(grace=timedelta(0))
+        self.assertFalse(any(os.path.exists(path) for path in self.files))
+
+        progress = self.client.get(f"/account/schools/purges/{response.data['purge']['id']}/").data['purge']
+        self.assertEqual(progress['status'], 'finished')
+        self.assertEqual((progress['users_deleted'], progress['user_total'], progress['files_deleted']), (5, 5, 2))
+
+    def test_interrupted_purge_resumes(self):
+        school_purge = SchoolPurge.objects.create(school=self.school, school_name=self.school.name, user_total=5)
+
+        def interrupt(run):
+            raise RuntimeError('worker stopped')
+
+        with self.assertRaises(RuntimeError):
+            run_purge(school_purge, batch_size=2, progress=interrupt)
+        school_purge.refresh_from_db()
+        self.assertEqual((school_purge.status, school_purge.users_deleted), ('failed', 2))
+
+        run_purge(school_purge, batch_size=2)
+        self.assertEqual((school_purge.status, school_purge.users_deleted), ('finished', 5))
+        self.assertTrue(School.objects.filter(id=self.school.id).exists())
+        self.assertFalse(self.school.user_set.exists())
+
+    def test_assignment_authors_block_the_purge(self):
+        Assignment.objects.create(
+            name='Draw', release_date=timezone.now(), due_date=timezone.now(), created_by=self.parents[3],
+        )
+        response = self.client.delete(f'/account/schools/{self.school.name}/users/delete-all/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.school.user_set.count(), 5)
+
+
+class SchoolRegistryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name='Sunshine Kindergarten')
+        School.objects.create(name='Harbour Kindergarten')
+
+    def setUp(self):
+        self.client = APIClient()
+        # Earlier tests' rolled-back changes may still be in the registry
+        schools.invalidate()
+
+    def test_lookups_are_served_from_memory(self):
+        schools.school_id(self.school.name)
+        with self.assertNumQueries(0):
+            self.assertEqual(schools.school_id(self.school.name), self.school.id)
+            self.assertEqual(schools.school_name(self.school.id), self.school.name)
+            self.assertEqual(schools.get_school(self.school.name).pk, self.school.id)
+            self.assertIsNone(schools.get_school('Nowhere'))
+
+    def test_save_and_delete_invalidate(self):
+        self.school.name = 'Rainbow Kindergarten'
+        self.school.save()
+        self.assertEqual(schools.school_id('Rainbow Kindergarten'), self.school.id)
+        self.assertIsNone(schools.school_id('Sunshine Kindergarten'))
+        self.school.delete()
+        self.assertIsNone(schools.school_id('Rainbow Kindergarten'))
+
+    def test_duplicate_names_are_refused(self):
+        schools.school_id(self.school.name)
+        # bulk_create skips save(), so the cached registry does not know it
+        School.objects.bulk_create([School(name='Rainbow Kindergarten')])
+
+        response = self.client.post('/account/schools/', {'name': ' Rainbow Kindergarten '}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('name', response.data)
+        response = self.client.put(f'/account/schools/{self.school.name}/', {'name': 'Rainbow Kindergarten'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        # A school of that name created by another request between validation and saving
+        with mock.patch.object(SchoolSerializer, 'save', side_effect=IntegrityError):
+            response = self.client.post('/account/schools/', {'name': 'Harbourside Kindergarten'}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('name', response.data)
+            response = self.client.put(f'/account/schools/{self.school.name}/', {'name': 'Harbourside Kindergarten'}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_signup_checks_the_school_in_the_database(self):
+        schools.school_id(self.school.name)
+        # Deleted without signals, as if by another process: the registry still lists it
+        School.objects.filter(pk=self.school.pk)._raw_delete(School.objects.db)
+        self.assertIsNotNone(schools.school_id('Sunshine Kindergarten'))
+
+        data = {'username': 'mum', 'password': 'secret', 'role': 'parent', 'school': 'Sunshine Kindergarten'}
+        response = self.client.post('/account/signup/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('school', response.data)
+
+        # Deleted between validation and saving
+        data['school'] = 'Harbour Kindergarten'
+        with mock.patch.object(UserSerializer, 'save', side_effect=IntegrityError):
+            response = self.client.post('/account/signup/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.filter(username='mum').exists())
+
+    def test_list_etag(self):
+        response = self.client.get('/account/schools/')
+        self.assertEqual([school['name'] for school in response.data['schools']], ['Harbour Kindergarten', 'Sunshine Kindergarten'])
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/account/schools/available/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+
+        School.objects.create(name='Rainbow Kindergarten')
+        response = self.client.get('/account/schools/available/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['total_count'], 3)
+
+
+class SchoolStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name='Sunshine Kindergarten')
+        other = School.objects.create(name='Harbour Kindergarten')
+        cls.teacher = User.objects.create(username='teacher', role='teacher', school=cls.school)
+        cls.parents = [
+            User.objects.create(username=f'p{i}', role='parent', school=cls.school, points=10, weekly_points=i)
+            for i in range(4)
+        ]
+        User.objects.filter(id=cls.parents[3].id).update(is_active=False)
+        User.objects.create(username='elsewhere', role='parent', school=other, points=99)
+        cls.assignment = Assignment.objects.create(
+            name='Read', release_date=timezone.now(), due_date=timezone.now(), created_by=cls.teacher,
+        )
+        for parent in cls.parents[:2]:
+            AssignmentSubmission.objects.create(
+                user=parent, assignment=cls.assignment, status=AssignmentSubmission.STATUS_SUBMITTED,
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        stats.invalidate()
+
+    def test_stats(self):
+        schools.school_id(self.school.name)  # warm the school registry
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/account/schools/{self.school.name}/stats/')
+        data = response.data['stats']
+        self.assertEqual(
+            (data['user_count'], data['parent_count'], data['active_parent_count'], data['teacher_count']),
+            (5, 4, 3, 1),
+        )
+        self.assertEqual((data['total_points'], data['weekly_points']), (40, 6))
+        self.assertEqual((data['submission_count'], data['recent_submitter_count']), (2, 2))
+        self.assertEqual(data['recent_submission_rate'], round(2 / 3, 4))
+
+        with self.assertNumQueries(0):
+            self.client.get(f'/account/schools/{self.school.name}/stats/')
+
+    def test_submission_invalidates(self):
+        self.client.get(f'/account/schools/{self.school.name}/stats/')
+        submission = AssignmentSubmission.objects.create(user=self.parents[2], assignment=self.assignment)
+        submission.mark_submitted()
+        data = self.client.get(f'/account/schools/{self.school.name}/stats/').data['stats']
+        self.assertEqual((data['submission_count'], data['total_points']), (3, 50))
+
+    def test_unknown_school(self):
+        self.assertEqual(self.client.get('/account/schools/Nowhere/stats/').status_code, 404)
@@ -1,10 +1,25 @@
 from rest_framework.response import Response
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, parser_classes
+from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework import status
-from .serializers import UserSerializer, LoginSerializer, UpdateUserNameSerializer, SchoolSerializer
-from .models import User, School
-import random
-import string
+from rest_framework.authtoken.models import Token
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from .serializers import UserSerializer, LoginSerializer, UpdateUserNameSerializer, SchoolSerializer, iter_user_rows, user_rows
+from .models import User, SchoolPurge, WeeklyReset
+from . import leaderboard, purge, schools, stats
+from .imports import ImportFormatError, UserImporter, read_rows
+from .bulk import UsernameSpaceExhausted, bulk_create_users, generate_password, hash_passwords, reserve_usernames
+from .weekly_reset import run_weekly_reset
+import csv
+import json
+
+# Keyset pagination / streaming limits for GET /account/users/
+USER_PAGE_SIZE_DEFAULT = 100
+USER_PAGE_SIZE_MAX = 1000
+USER_STREAM_CHUNK_SIZE = 2000
 
 @api_view(['POST'])
 def login(request):
@@ -25,9 +40,12 @@ def login(request):
             'weekly_points': user.weekly_points,
             'streaks': user.current_streak
         }
+        # Reuse the token on later requests ("Authorization: Token <key>") instead of logging in again
+        token, _ = Token.objects.get_or_create(user=user)
         
         return Response({
-            'user': user_data
+            'user': user_data,
+            'token': token.key
         }, status=status.HTTP_200_OK)
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -36,7 +54,11 @@ def login(request):
 def signup(request):
     serializer = UserSerializer(data=request.data)
     if serializer.is_valid():
-        user = serializer.save()
+        try:
+            user = serializer.save()
+        except IntegrityError:
+            # The school was deleted (or the username taken) since validation
+            return Response({'error': 'School or username changed meanwhile; please try again'}, status=status.HTTP_400_BAD_REQUEST)
         
         user_data = {
             'id': user.id,
@@ -58,37 +80,98 @@ def signup(request):
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-# @api_view(['POST'])
-# def logout(request):
-#     return Response({'message': 'Successfully logged out'}, status=status.HTTP_200_OK)
+@api_view(['POST'])
+def logout(request):
+    """Revoke the token sent in the Authorization header"""
+    if request.auth:
+        Token.objects.filter(key=request.auth).delete()
+    return Response({'message': 'Successfully logged out'}, status=status.HTTP_200_OK)
+
+def _stream_user_rows(users, stream_format):
+    """Yield users as NDJSON lines or as one chunked JSON document"""
+    rows = iter_user_rows(users, chunk_size=USER_STREAM_CHUNK_SIZE)
+    if stream_format == 'ndjson':
+        for row in rows:
+            yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+        return
+
+    yield '{"users": ['
+    total_count = 0
+    for row in rows:
+        yield (',' if total_count else '') + json.dumps(row, cls=DjangoJSONEncoder)
+        total_count += 1
+    yield f'], "total_count": {total_count}}}'
+
+
+def _filter_by_streak(users, params):
+    """
+    Apply the optional min_streak and ordering=streak|-streak query params using the
+    live streak computed in SQL. Returns (users, error_response).
+    """
+    users = users.with_current_streak()
+    min_streak = params.get('min_streak')
+    if min_streak:
+        try:
+            users = users.filter(live_streak__gte=int(min_streak))
+        except ValueError:
+            return users, Response({'error': 'min_streak must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    ordering = params.get('ordering')
+    if ordering:
+        if ordering not in ('streak', '-streak'):
+            return users, Response({'error': 'ordering must be "streak" or "-streak"'}, status=status.HTTP_400_BAD_REQUEST)
+        users = users.order_by(ordering.replace('streak', 'live_streak'), 'id')
+    return users, None
 
 @api_view(['GET'])
 def get_all_users(request):
     """
     Allow staff users to get all users 
+    Query params (all optional):
+    - page_size / cursor: keyset pagination by id; pass back next_cursor to get the next page
+    - stream: "ndjson" or "json" to stream every user without loading them into memory
+    - min_streak: only users whose live streak is at least this
+    - ordering: "streak" or "-streak" (not combinable with cursor pagination)
     """
     
     # Get all users with roles: staff, teacher, parent
     allowed_roles = ['staff', 'teacher', 'parent']
-    users = User.objects.filter(role__in=allowed_roles)
-    
-    users_data = []
-    for user in users:
-        user_data = {
-            'id': user.id,
-            'username': user.username,
-            'role': user.role,
-            'parent_name': user.parent_name,
-            'children_name': user.children_name,
-            'staff_name': user.staff_name,
-            'teacher_name': user.teacher_name,
-            'school': user.school.name if user.school else None,
-            'points': user.points,
-            'weekly_points': user.weekly_points,
-            'streaks': user.current_streak,
-            'is_active': user.is_active
-        }
-        users_data.append(user_data)
+    users, error = _filter_by_streak(User.objects.filter(role__in=allowed_roles).order_by('id'), request.GET)
+    if error:
+        return error
+
+    stream_format = request.GET.get('stream')
+    if stream_format:
+        if stream_format not in ('ndjson', 'json'):
+            return Response({'error': 'stream must be "ndjson" or "json"'}, status=status.HTTP_400_BAD_REQUEST)
+        content_type = 'application/x-ndjson' if stream_format == 'ndjson' else 'application/json'
+        return StreamingHttpResponse(_stream_user_rows(users, stream_format), content_type=content_type)
+
+    cursor = request.GET.get('cursor')
+    page_size = request.GET.get('page_size')
+    if cursor is not None or page_size is not None:
+        if request.GET.get('ordering'):
+            return Response({'error': 'ordering cannot be combined with cursor pagination'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page_size = min(int(page_size or USER_PAGE_SIZE_DEFAULT), USER_PAGE_SIZE_MAX)
+            if page_size < 1:
+                raise ValueError
+            if cursor:
+                users = users.filter(id__gt=int(cursor))
+        except ValueError:
+            return Response({'error': 'cursor and page_size must be positive integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Fetch one extra row to know whether another page exists
+        users_data = user_rows(users[:page_size + 1])
+        has_more = len(users_data) > page_size
+        users_data = users_data[:page_size]
+        return Response({
+            'users': users_data,
+            'count': len(users_data),
+            'page_size': page_size,
+            'next_cursor': str(users_data[-1]['id']) if has_more else None
+        }, status=status.HTTP_200_OK)
+
+    users_data = user_rows(users)
     
     return Response({
         'users': users_data,
@@ -107,34 +190,18 @@ def get_user_by_id(request):
         return Response({'error': 'Missing query parameter: id'}, status=status.HTTP_400_BAD_REQUEST)
 
     allowed_roles = ['staff', 'teacher', 'parent']
-    try:
-        user = User.objects.get(id=user_id, role__in=allowed_roles)
-    except User.DoesNotExist:
+    users_data = user_rows(User.objects.filter(id=user_id, role__in=allowed_roles))
+    if not users_data:
         return Response({'error': 'User not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-    user_data = {
-        'id': user.id,
-        'username': user.username,
-        'role': user.role,
-        'parent_name': user.parent_name,
-        'children_name': user.children_name,
-        'staff_name': user.staff_name,
-        'teacher_name': user.teacher_name,
-        'school': user.school.name if user.school else None,
-        'points': user.points,
-        'weekly_points': user.weekly_points,
-        'streaks': user.current_streak,
-        'is_active': user.is_active
-    }
-
-    return Response({'user': user_data}, status=status.HTTP_200_OK)
+    return Response({'user': users_data[0]}, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
 def get_user_by_school(request):
     """
     Allow staff users to get users by school.
-    Query params: school=<school_name>
+    Query params: school=<school_name>, min_streak and ordering=streak|-streak (optional)
     """
 
     school_name = request.GET.get('school')
@@ -144,24 +211,10 @@ def get_user_by_school(request):
     allowed_roles = ['staff', 'teacher', 'parent']
     # Since school name is now the primary key, we can filter directly by school name
     users = User.objects.filter(role__in=allowed_roles, school__name=school_name)
-
-    users_data = []
-    for user in users:
-        user_data = {
-            'id': user.id,
-            'username': user.username,
-            'role': user.role,
-            'parent_name': user.parent_name,
-            'children_name': user.children_name,
-            'staff_name': user.staff_name,
-            'teacher_name': user.teacher_name,
-            'school': user.school.name if user.school else None,
-            'points': user.points,
-            'weekly_points': user.weekly_points,
-            'streaks': user.current_streak,
-            'is_active': user.is_active
-        }
-        users_data.append(user_data)
+    users, error = _filter_by_streak(users, request.GET)
+    if error:
+        return error
+    users_data = user_rows(users)
 
     return Response({
         'users': users_data,
@@ -189,6 +242,7 @@ def activate_user(request):
     # Activate the user
     user.is_active = True
     user.save()
+    leaderboard.invalidate()
 
     return Response({
         'message': f'User {user.username} has been activated successfully.',
@@ -223,6 +277,7 @@ def deactivate_user(request):
     # Deactivate the user
     user.is_active = False
     user.save()
+    leaderboard.invalidate()
 
     return Response({
         'message': f'User {user.username} has been deactivated successfully.',
@@ -235,43 +290,56 @@ def deactivate_user(request):
 @api_view(['GET'])
 def get_weekly_leaderboard(request):
     """
-    Get top 5 parents with the highest weekly points.
-    Query params: school=<school_name> (optional - filter by school)
+    Get the parents with the highest weekly points.
+    Query params:
+    - school=<school_name> (optional - filter by school)
+    - limit=<n> (optional - number of parents to return, default 5)
+    - user_id=<id> (optional - also return this parent's rank as "me")
+    - around=<n> (optional, with user_id - also return n parents either side of them)
     """
     
     # Get school filter if provided
     school_name = request.GET.get('school')
-    
-    # Filter parents only
-    parents = User.objects.filter(role='parent', is_active=True)
-    
-    # Apply school filter if provided
+    try:
+        limit = int(request.GET.get('limit', 5))
+        window = int(request.GET.get('around', 0))
+        if limit < 1 or window < 0:
+            raise ValueError
+    except ValueError:
+        return Response({'error': 'limit and around must be positive integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+    school_id = None
     if school_name:
-        parents = parents.filter(school__name=school_name)
-    
-    # Order by weekly_points descending and get top 5
-    top_parents = parents.order_by('-weekly_points')[:5]
-    
-    leaderboard_data = []
-    for rank, parent in enumerate(top_parents, 1):
-        parent_data = {
-            'rank': rank,
-            'id': parent.id,
-            'username': parent.username,
-            'parent_name': parent.parent_name,
-            'children_name': parent.children_name,
-            'school': parent.school.name if parent.school else None,
-            'weekly_points': parent.weekly_points,
-            'total_points': parent.points,
-            'current_streak': parent.current_streak
+        school_id = schools.school_id(school_name)
+
+    response_data = {
+        'leaderboard': [],
+        'total_count': 0,
+        'school_filter': school_name if school_name else 'All schools'
+    }
+    # Unknown school: nobody to rank
+    if school_name and school_id is None:
+        return Response(response_data, status=status.HTTP_200_OK)
+
+    leaderboard_data = leaderboard.top(limit, school_id=school_id)
+    response_data['leaderboard'] = leaderboard_data
+    response_data['total_count'] = len(leaderboard_data)
+
+    user_id = request.GET.get('user_id')
+    if user_id:
+        try:
+            user = User.objects.get(id=user_id)
+        except (User.DoesNotExist, ValueError):
+            return Response({'error': 'User not found.'}, status=status.HTTP_404_NOT_FOUND)
+        response_data['me'] = {
+            'id': user.id,
+            'rank': leaderboard.rank_of(user, school_id=school_id),
+            'weekly_points': user.weekly_points,
         }
-        leaderboard_data.append(parent_data)
+        if window:
+            response_data['around_me'] = leaderboard.around(user, window, school_id=school_id)
     
-    return Response({
-        'leaderboard': leaderboard_data,
-        'total_count': len(leaderboard_data),
-        'school_filter': school_name if school_name else 'All schools'
-    }, status=status.HTTP_200_OK)
+    return Response(response_data, status=status.HTTP_200_OK)
 
 
 @api_view(['POST'])
@@ -279,14 +347,34 @@ def reset_weekly_points(request):
     """
     Reset all users' weekly points to 0.
     This can be called weekly by staff to reset the leaderboard.
+    Final standings are saved first; see account.weekly_reset.
+    A week is closed once per day: a second call on the same day changes nothing and
+    gets 409 with "already_reset": true and the counts of the run that did it.
+    reset_count is the number of users (all of them now have 0 weekly points);
+    changed_count how many of them had weekly points to reset.
     """
-    
-    # Reset weekly points for all users
-    User.objects.all().update(weekly_points=0)
+    week_ending = timezone.localdate()
+    done = WeeklyReset.objects.filter(week_ending=week_ending, finished_at__isnull=False).first()
+    if done:
+        return Response({
+            'error': 'Weekly points have already been reset today.',
+            'already_reset': True,
+            'week_ending': done.week_ending,
+            'finished_at': done.finished_at,
+            'snapshot_count': done.snapshot_count,
+            'changed_count': done.reset_count,
+        }, status=status.HTTP_409_CONFLICT)
+
+    # Snapshot and reset weekly points for all users, batch by batch
+    run = run_weekly_reset(week_ending)
     
     return Response({
         'message': 'Weekly points have been reset for all users.',
-        'reset_count': User.objects.count()
+        'already_reset': False,
+        'week_ending': run.week_ending,
+        'snapshot_count': run.snapshot_count,
+        'reset_count': User.objects.count(),
+        'changed_count': run.reset_count,
     }, status=status.HTTP_200_OK)
 
 
@@ -337,20 +425,7 @@ def update_user_name(request):
     user.save(update_fields=updated_fields)
     
     # Return updated user data
-    user_data = {
-        'id': user.id,
-        'username': user.username,
-        'role': user.role,
-        'parent_name': user.parent_name,
-        'children_name': user.children_name,
-        'staff_name': user.staff_name,
-        'teacher_name': user.teacher_name,
-        'school': user.school.name if user.school else None,
-        'points': user.points,
-        'weekly_points': user.weekly_points,
-        'streaks': user.current_streak,
-        'is_active': user.is_active
-    }
+    user_data = user_rows(User.objects.filter(id=user.id))[0]
     
     return Response({
         'message': f'Successfully updated {", ".join(updated_fields)} for user {user.username}',
@@ -359,6 +434,20 @@ def update_user_name(request):
     }, status=status.HTTP_200_OK)
 
 
+def _school_list_response(request, build):
+    """
+    Serve a school list from the registry with an ETag; answer 304 Not Modified
+    when the client already has the current list.
+    """
+    etag = f'"{schools.etag()}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = build()
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
 @api_view(['GET', 'POST'])
 def school_list_create(request):
     """
@@ -366,16 +455,21 @@ def school_list_create(request):
     POST: Create a new school
     """
     if request.method == 'GET':
-        schools = School.objects.all().order_by('name')
-        serializer = SchoolSerializer(schools, many=True)
-        return Response({
-            'schools': serializer.data,
-            'total_count': len(serializer.data)
-        }, status=status.HTTP_200_OK)
+        def build():
+            school_list = schools.all_schools()
+            return Response({
+                'schools': school_list,
+                'total_count': len(school_list)
+            }, status=status.HTTP_200_OK)
+        return _school_list_response(request, build)
     elif request.method == 'POST':
         serializer = SchoolSerializer(data=request.data)
         if serializer.is_valid():
-            school = serializer.save()
+            try:
+                school = serializer.save()
+            except IntegrityError:
+                # Created by a concurrent request since validation
+                return Response({'name': ['School with this name already exists.']}, status=status.HTTP_400_BAD_REQUEST)
             return Response({
                 'school': SchoolSerializer(school).data,
                 'message': f'School "{school.name}" created successfully'
@@ -387,11 +481,11 @@ def school_detail(request, school_identifier):
     """
     GET: Get a specific school by name
     PUT: Update a school name
-    DELETE: Delete a school and unassign users
+    DELETE: Delete a school and all of its users. The deletion runs in batches in the
+    background; follow it at /account/schools/purges/<id>/ (202 Accepted).
     """
-    try:
-        school = School.objects.get(name=school_identifier)
-    except School.DoesNotExist:
+    school = schools.get_school(school_identifier)
+    if school is None:
         return Response({'error': 'School not found'}, status=status.HTTP_404_NOT_FOUND)
     if request.method == 'GET':
         user_count = school.user_set.count()
@@ -403,32 +497,55 @@ def school_detail(request, school_identifier):
     elif request.method == 'PUT':
         serializer = SchoolSerializer(school, data=request.data)
         if serializer.is_valid():
-            updated_school = serializer.save()
+            try:
+                updated_school = serializer.save()
+            except IntegrityError:
+                return Response({'name': ['School with this name already exists.']}, status=status.HTTP_400_BAD_REQUEST)
+            leaderboard.invalidate()
             return Response({
                 'school': SchoolSerializer(updated_school).data,
                 'message': 'School updated successfully'
             }, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     elif request.method == 'DELETE':
-        user_count = school.user_set.count()
-        school.user_set.all().delete()
-        school_name = school.name
-        school.delete()
+        if purge.blocking_assignment_count(school):
+            return Response(
+                {'error': 'Users of this school created assignments; reassign or delete those assignments first'},
+                status=status.HTTP_409_CONFLICT,
+            )
+        school_purge = purge.request_purge(school, delete_school=True)
         return Response({
-            'message': f'School "{school_name}" and all {user_count} users deleted successfully',
-            'users_deleted': user_count
-        }, status=status.HTTP_200_OK)
+            'message': f'Deleting school "{school.name}" and all {school_purge.user_total} users',
+            'users_deleted': school_purge.users_deleted,
+            'purge': purge.purge_data(school_purge)
+        }, status=status.HTTP_202_ACCEPTED)
 
 @api_view(['GET'])
 def get_available_schools(request):
     """
     Get all available schools
     """
-    schools = School.objects.all().order_by('name')
-    school_names = [school.name for school in schools]
+    def build():
+        school_names = [school['name'] for school in schools.all_schools()]
+        return Response({
+            'schools': school_names,
+            'total_count': len(school_names)
+        }, status=status.HTTP_200_OK)
+    return _school_list_response(request, build)
+
+@api_view(['GET'])
+def school_stats(request, school_identifier):
+    """
+    GET: Dashboard statistics for a school: user counts by role, active parents,
+    total and weekly points, submission counts and the share of active parents who
+    submitted in the last 7 days. Cached for up to a minute.
+    """
+    school = schools.get_school(school_identifier)
+    if school is None:
+        return Response({'error': 'School not found'}, status=status.HTTP_404_NOT_FOUND)
     return Response({
-        'schools': school_names,
-        'total_count': len(school_names)
+        'school': school.name,
+        'stats': stats.school_stats(school.id)
     }, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
@@ -438,10 +555,11 @@ def school_users(request, school_identifier):
     Query params:
     - role (optional): filter by user role
     - active_only (optional): only active users (default: true)
+    - min_streak (optional): only users whose live streak is at least this
+    - ordering (optional): "streak" or "-streak"
     """
-    try:
-        school = School.objects.get(name=school_identifier)
-    except School.DoesNotExist:
+    school = schools.get_school(school_identifier)
+    if school is None:
         return Response({'error': 'School not found'}, status=status.HTTP_404_NOT_FOUND)
     users = school.user_set.all()
     role_filter = request.query_params.get('role')
@@ -450,92 +568,151 @@ def school_users(request, school_identifier):
     active_only = request.query_params.get('active_only', 'true').lower() == 'true'
     if active_only:
         users = users.filter(is_active=True)
-    users_data = []
-    for user in users:
-        users_data.append({
-            'id': user.id,
-            'username': user.username,
-            'role': user.role,
-            'parent_name': user.parent_name,
-            'children_name': user.children_name,
-            'staff_name': user.staff_name,
-            'teacher_name': user.teacher_name,
-            'points': user.points,
-            'weekly_points': user.weekly_points,
-            'streaks': user.current_streak,
-            'is_active': user.is_active
-        })
+    users, error = _filter_by_streak(users, request.query_params)
+    if error:
+        return error
+    users_data = user_rows(users, include_school=False)
     return Response({
         'school': school.name,
         'users': users_data,
         'total_count': len(users_data),
         'filters': {
             'role': role_filter,
-            'active_only': active_only
+            'active_only': active_only,
+            'min_streak': request.query_params.get('min_streak')
         }
     }, status=status.HTTP_200_OK)
 
 @api_view(['DELETE'])
 def delete_all_users_in_school(request, school_identifier):
     """
-    DELETE: Delete all users in a specific school
+    DELETE: Delete all users in a specific school.
+    The deletion runs in batches in the background; follow it at
+    /account/schools/purges/<id>/ (202 Accepted).
     """
-    try:
-        school = School.objects.get(name=school_identifier)
-    except School.DoesNotExist:
+    school = schools.get_school(school_identifier)
+    if school is None:
         return Response({'error': 'School not found'}, status=status.HTTP_404_NOT_FOUND)
-    users_to_delete = school.user_set.all()
-    user_count = users_to_delete.count()
-    deleted_users = list(users_to_delete.values('id', 'username', 'role'))
-    users_to_delete.delete()
+    if purge.blocking_assignment_count(school):
+        return Response(
+            {'error': 'Users of this school created assignments; reassign or delete those assignments first'},
+            status=status.HTTP_409_CONFLICT,
+        )
+    school_purge = purge.request_purge(school)
     return Response({
-        'message': f'Successfully deleted {user_count} users from school "{school.name}"',
-        'deleted_count': user_count,
-        'deleted_users': deleted_users,
-    }, status=status.HTTP_200_OK)
+        'message': f'Deleting {school_purge.user_total} users from school "{school.name}"',
+        'deleted_count': school_purge.users_deleted,
+        'purge': purge.purge_data(school_purge),
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+def school_purge_detail(request, purge_id):
+    """
+    GET: Progress of a school purge started by deleting a school or all its users
+    """
+    try:
+        school_purge = SchoolPurge.objects.get(id=purge_id)
+    except SchoolPurge.DoesNotExist:
+        return Response({'error': 'Purge not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'purge': purge.purge_data(school_purge)}, status=status.HTTP_200_OK)
+
+class _Echo:
+    """File-like object whose write() just returns the line, for streaming csv.writer output"""
+    def write(self, value):
+        return value
+
+
+def _stream_accounts_csv(accounts):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(['username', 'password', 'role', 'school'])
+    for account in accounts:
+        yield writer.writerow([account['username'], account['password'], account['role'], account['school']])
+
 
 @api_view(['POST'])
 def generate_accounts_by_school(request):
     """
     POST: Generate accounts for a school
-    JSON body: {"school_name": str, "role": str, "number": int}
+    JSON body: {"school_name": str, "role": str, "number": int, "format": "json" | "csv" (optional)}
+    With format=csv the credentials are returned as a CSV download.
     """
     school_name = request.data.get('school_name')
     role = request.data.get('role')
-    number = int(request.data.get('number', 0))
+    try:
+        number = int(request.data.get('number', 0))
+    except (TypeError, ValueError):
+        number = 0
     if not school_name or not role or number < 1:
         return Response({'error': 'Missing or invalid parameters'}, status=status.HTTP_400_BAD_REQUEST)
-    try:
-        school = School.objects.get(name=school_name)
-    except School.DoesNotExist:
+    school = schools.get_school(school_name)
+    if school is None:
         return Response({'error': 'School not found'}, status=status.HTTP_404_NOT_FOUND)
-    
-    accounts = []
-    for i in range(number):
-        # Generate username in format reach00001 to reach99999
-        username_number = random.randint(1, 99999)
-        username = f"reach{username_number:05d}"
-        
-        # Check for duplicates and regenerate if needed
-        while User.objects.filter(username=username).exists():
-            username_number = random.randint(1, 99999)
-            username = f"reach{username_number:05d}"
-        
-        # Generate 8-character password with uppercase, lowercase, and digits
-        password = ''.join(random.choices(string.ascii_uppercase + string.ascii_lowercase + string.digits, k=8))
-        
-        user = User.objects.create(username=username, role=role, school=school)
-        user.set_password(password)
-        user.save()
-        
-        accounts.append({
-            'username': username, 
-            'password': password, 
-            'role': role, 
+
+    # Generate 8-character passwords and hash them across a process pool
+    passwords = [generate_password() for _ in range(number)]
+    hashed_passwords = hash_passwords(passwords)
+
+    # Reserve usernames in one query; retry if a concurrent request took one of them first
+    for attempt in range(3):
+        try:
+            usernames = reserve_usernames(number)
+        except UsernameSpaceExhausted as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        users = [
+            User(username=username, password=hashed, role=role, school=school)
+            for username, hashed in zip(usernames, hashed_passwords)
+        ]
+        try:
+            bulk_create_users(users)
+            break
+        except IntegrityError:
+            continue
+    else:
+        return Response({'error': 'Could not reserve unique usernames, please retry'}, status=status.HTTP_409_CONFLICT)
+
+    accounts = [
+        {
+            'username': username,
+            'password': password,
+            'role': role,
             'school': school_name
-        })
+        }
+        for username, password in zip(usernames, passwords)
+    ]
+
+    export_format = request.data.get('format') or request.GET.get('format')
+    if export_format == 'csv':
+        response = StreamingHttpResponse(_stream_accounts_csv(accounts), content_type='text/csv', status=status.HTTP_201_CREATED)
+        response['Content-Disposition'] = f'attachment; filename="accounts-{school.id}.csv"'
+        return response
     
     return Response({
         'accounts': accounts,
         'generated_count': len(accounts)
     }, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@parser_classes([MultiPartParser, FormParser])
+def import_users(request):
+    """
+    POST: Import parents/teachers/staff from a CSV or XLSX file
+    Form data: file=<.csv or .xlsx>, dry_run=true|false (optional, validate only)
+    Returns a per-row error report; rows without errors are imported. A file that cannot
+    be read gets 400; if that happens part-way, created_count says how many users from
+    the rows before it were already imported.
+    """
+    upload = request.FILES.get('file')
+    if not upload:
+        return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
+    dry_run = str(request.data.get('dry_run', 'false')).lower() == 'true'
+
+    importer = UserImporter(dry_run=dry_run)
+    try:
+        report = importer.run(read_rows(upload.file, upload.name))
+    except ImportFormatError as e:
+        return Response({'error': str(e), 'created_count': importer.created_count}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(report, status=status.HTTP_200_OK if dry_run else status.HTTP_201_CREATED)
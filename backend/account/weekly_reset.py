@@ -0,0 +1,76 @@
+"""
+Weekly points reset job.
+
+Users are processed in bounded id ranges. Each range is one short transaction that
+snapshots the users' final weekly points into WeeklyStanding, zeroes them and records
+progress on the WeeklyReset run, so submissions are only ever blocked for one batch
+and an interrupted run picks up at the next unprocessed range.
+
+Schedule it weekly, e.g. from cron:
+    python manage.py reset_weekly_points
+"""
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import leaderboard, stats
+from .models import User, WeeklyReset, WeeklyStanding
+
+RESET_BATCH_SIZE = 500
+
+
+def _reset_batch(run, upper_id):
+    with transaction.atomic():
+        users = (
+            User.objects.select_for_update()
+            .filter(id__gt=run.last_user_id, id__lte=upper_id)
+            .exclude(weekly_points=0)
+        )
+        rows = list(users.values('id', 'school_id', 'weekly_points', 'points'))
+
+        WeeklyStanding.objects.bulk_create(
+            [
+                WeeklyStanding(
+                    reset=run,
+                    user_id=row['id'],
+                    school_id=row['school_id'],
+                    weekly_points=row['weekly_points'] or 0,
+                    points=row['points'],
+                )
+                for row in rows
+                if row['weekly_points']
+            ],
+            ignore_conflicts=True,
+        )
+        reset_count = User.objects.filter(id__in=[row['id'] for row in rows]).update(weekly_points=0)
+
+        run.last_user_id = upper_id
+        run.snapshot_count += sum(1 for row in rows if row['weekly_points'])
+        run.reset_count += reset_count
+        run.save(update_fields=['last_user_id', 'snapshot_count', 'reset_count'])
+
+
+def run_weekly_reset(week_ending=None, batch_size=RESET_BATCH_SIZE, progress=None):
+    """
+    Snapshot and reset every user's weekly points for the week ending `week_ending`
+    (default: today). Safe to call again after an interruption; a finished run is a no-op.
+    `progress`, if given, is called with the run after every batch.
+    """
+    week_ending = week_ending or timezone.localdate()
+    run, _ = WeeklyReset.objects.get_or_create(week_ending=week_ending)
+    if run.finished_at:
+        return run
+
+    # Users created after this point start the new week on 0 points anyway
+    max_id = User.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+    while run.last_user_id < max_id:
+        _reset_batch(run, min(run.last_user_id + batch_size, max_id))
+        leaderboard.invalidate()
+        if progress:
+            progress(run)
+
+    run.finished_at = timezone.now()
+    run.save(update_fields=['finished_at'])
+    leaderboard.invalidate()
+    stats.invalidate()
+    return run
@@ -4,8 +4,8 @@ from .models import Assignment, AssignmentSubmission, SubmissionAttachment
 
 @admin.register(Assignment)
 class AssignmentAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'release_date', 'due_date', 'created_by', 'hidden', 'created_at')
-    list_filter = ('hidden', 'release_date', 'due_date', 'created_by')
+    list_display = ('id', 'name', 'release_date', 'due_date', 'created_by', 'hidden', 'audience', 'created_at')
+    list_filter = ('hidden', 'audience', 'release_date', 'due_date', 'created_by')
     search_fields = ('name', 'created_by__username')
     readonly_fields = ('id', 'created_at')
     ordering = ('-release_date', '-id')
@@ -0,0 +1,145 @@
+"""
+Per-assignment analytics: completion, on-time vs late, score distribution, per school.
+
+Everything comes from three grouped aggregates: the parents the assignment is visible
+to (AssignmentVisibility) per school, the submissions per school, and the graded
+scores per histogram bin. The result is cached per assignment for
+ANALYTICS_CACHE_TIMEOUT seconds; submitting, grading (single or bulk) and saving the
+assignment drop it straight away, so only the first request after a change pays for
+the aggregates. Audience changes caused by users joining or leaving a school show up
+within the timeout.
+"""
+import time
+
+from django.core.cache import cache
+from django.db.models import Count, F, IntegerField, Max, Min, Q, Sum
+from django.db.models.functions import Floor, Least
+from django.utils import timezone
+
+from .models import AssignmentSubmission, AssignmentVisibility
+
+ANALYTICS_CACHE_TIMEOUT = 10 * 60
+ANALYTICS_VERSION_KEY = 'assignmentapp:analytics:version:{}'
+HISTOGRAM_BINS = 10
+
+
+def _cache_key(assignment_id):
+    version = cache.get_or_set(ANALYTICS_VERSION_KEY.format(assignment_id), time.time_ns, None)
+    return f'assignmentapp:analytics:{assignment_id}:{version}'
+
+
+def _rate(part, whole):
+    return round(min(part / whole, 1.0), 4) if whole else None
+
+
+def _histogram(submissions, top):
+    """Counts of graded scores in HISTOGRAM_BINS equal bins from 0 to `top`"""
+    width = top / HISTOGRAM_BINS
+    counts = dict(
+        submissions.filter(score__isnull=False)
+        .annotate(bin=Least(Floor(F('score') / width), HISTOGRAM_BINS - 1, output_field=IntegerField()))
+        .values('bin')
+        .annotate(count=Count('id'))
+        .order_by()
+        .values_list('bin', 'count')
+    )
+    return [
+        {'from': round(i * width, 2), 'to': round((i + 1) * width, 2), 'count': counts.get(i, 0)}
+        for i in range(HISTOGRAM_BINS)
+    ]
+
+
+def _compute(assignment):
+    audience_rows = (
+        AssignmentVisibility.objects.filter(assignment=assignment, user__role='parent')
+        .values('user__school_id', 'user__school__name')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    submissions = AssignmentSubmission.objects.filter(
+        assignment=assignment, status__gte=AssignmentSubmission.STATUS_SUBMITTED,
+    )
+    rows = list(
+        submissions.values('user__school_id', 'user__school__name')
+        .annotate(
+            submitted=Count('id'),
+            graded=Count('id', filter=Q(status=AssignmentSubmission.STATUS_GRADED)),
+            late=Count('id', filter=Q(submitted_at__gt=assignment.due_date)),
+            scored=Count('score'),
+            score_sum=Sum('score'),
+            score_min=Min('score'),
+            score_max=Max('score'),
+        )
+        .order_by()
+    )
+
+    audience = {}
+    schools = {}
+    for row in list(audience_rows) + rows:
+        schools[row['user__school_id']] = {'school_id': row['user__school_id'], 'school': row['user__school__name']}
+        if 'count' in row:
+            audience[row['user__school_id']] = row['count']
+
+    by_school = {row['user__school_id']: row for row in rows}
+    totals = {'audience': 0, 'submitted': 0, 'graded': 0, 'late': 0, 'scored': 0, 'score_sum': 0.0}
+    school_data = []
+    for school_id, school in schools.items():
+        row = by_school.get(school_id, {})
+        figures = {
+            'audience': audience.get(school_id, 0),
+            'submitted': row.get('submitted', 0),
+            'graded': row.get('graded', 0),
+            'late': row.get('late', 0),
+            'scored': row.get('scored', 0),
+            'score_sum': row.get('score_sum') or 0.0,
+        }
+        for key, value in figures.items():
+            totals[key] += value
+        school_data.append({
+            **school,
+            'audience': figures['audience'],
+            'submitted': figures['submitted'],
+            'graded': figures['graded'],
+            'completion_rate': _rate(figures['submitted'], figures['audience']),
+            'on_time': figures['submitted'] - figures['late'],
+            'late': figures['late'],
+            'score_mean': round(figures['score_sum'] / figures['scored'], 2) if figures['scored'] else None,
+        })
+    school_data.sort(key=lambda school: (school['school'] is None, school['school'] or ''))
+
+    score_min = min((row['score_min'] for row in rows if row['score_min'] is not None), default=None)
+    score_max = max((row['score_max'] for row in rows if row['score_max'] is not None), default=None)
+    top = max(float(assignment.points or 0), score_max or 0.0) or 1.0
+    return {
+        'assignment_id': assignment.id,
+        'due_date': assignment.due_date,
+        'audience': totals['audience'],
+        'submitted': totals['submitted'],
+        'graded': totals['graded'],
+        'completion_rate': _rate(totals['submitted'], totals['audience']),
+        'on_time': totals['submitted'] - totals['late'],
+        'late': totals['late'],
+        'score': {
+            'count': totals['scored'],
+            'mean': round(totals['score_sum'] / totals['scored'], 2) if totals['scored'] else None,
+            'min': score_min,
+            'max': score_max,
+            'histogram': _histogram(submissions, top) if totals['scored'] else [],
+        },
+        'schools': school_data,
+        'generated_at': timezone.now(),
+    }
+
+
+def assignment_analytics(assignment):
+    """Analytics of `assignment`, from the cache when nothing changed since they were computed"""
+    key = _cache_key(assignment.id)
+    data = cache.get(key)
+    if data is None:
+        data = _compute(assignment)
+        cache.set(key, data, ANALYTICS_CACHE_TIMEOUT)
+    return data
+
+
+def invalidate(assignment_id):
+    cache.set(ANALYTICS_VERSION_KEY.format(assignment_id), time.time_ns(), None)
@@ -0,0 +1,126 @@
+"""
+Bulk grading.
+
+A list of {submission_id, score, feedback} items for one assignment is validated as a
+whole and, only if every item is valid, written with a single bulk_update inside one
+transaction. Items that leave out score or feedback keep the current value.
+
+Offline grading sheets are CSV files with the header
+    submission_id,score,feedback
+(extra columns such as username are ignored; an empty score or feedback cell means
+"leave unchanged").
+"""
+import csv
+import io
+import math
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import analytics
+from .models import AssignmentSubmission
+
+GRADE_BATCH_MAX = 2000
+GRADED_FIELDS = ['status', 'score', 'feedback', 'graded_at', 'updated_at']
+
+
+class GradeSheetError(Exception):
+    pass
+
+
+def read_grade_sheet(fileobj):
+    """Grade items from a CSV grading sheet; each item carries its sheet row number"""
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.DictReader(text)
+        if 'submission_id' not in (reader.fieldnames or []):
+            raise GradeSheetError('The sheet needs a submission_id column')
+        items = []
+        # Row 1 is the header
+        for row_number, row in enumerate(reader, 2):
+            item = {'row': row_number, 'submission_id': (row.get('submission_id') or '').strip()}
+            for field in ('score', 'feedback'):
+                value = (row.get(field) or '').strip()
+                if value:
+                    item[field] = value
+            items.append(item)
+        return items
+    except UnicodeDecodeError:
+        raise GradeSheetError('The sheet must be a UTF-8 CSV file')
+    finally:
+        text.detach()
+
+
+def _parse_item(item):
+    """(submission_id, changes) for one item; raises ValueError with a message"""
+    if not isinstance(item, dict):
+        raise ValueError('each grade must be an object')
+    try:
+        submission_id = int(item.get('submission_id'))
+    except (TypeError, ValueError):
+        raise ValueError('submission_id must be an integer')
+
+    changes = {}
+    if item.get('score') is not None:
+        try:
+            score = float(item['score'])
+        except (TypeError, ValueError):
+            raise ValueError('score must be a number')
+        if not math.isfinite(score) or score < 0:
+            raise ValueError('score must be a non-negative number')
+        changes['score'] = score
+    if item.get('feedback') is not None:
+        changes['feedback'] = str(item['feedback'])
+    return submission_id, changes
+
+
+def apply_grades(assignment, items):
+    """
+    Grade submissions of `assignment`. Returns (results, errors): on success `errors`
+    is empty and `results` has one compact entry per item; otherwise nothing was
+    written and `errors` lists every invalid item.
+    """
+    if not items:
+        return [], [{'error': 'no grades given'}]
+    if len(items) > GRADE_BATCH_MAX:
+        return [], [{'error': f'at most {GRADE_BATCH_MAX} grades per request'}]
+
+    errors = []
+    parsed = []
+    seen = set()
+    for index, item in enumerate(items):
+        position = {'row': item['row']} if isinstance(item, dict) and 'row' in item else {'index': index}
+        try:
+            submission_id, changes = _parse_item(item)
+            if submission_id in seen:
+                raise ValueError('submission graded twice in this request')
+        except ValueError as e:
+            errors.append({**position, 'error': str(e)})
+            continue
+        seen.add(submission_id)
+        parsed.append((position, submission_id, changes))
+
+    with transaction.atomic():
+        submissions = AssignmentSubmission.objects.select_for_update().in_bulk(
+            [submission_id for _, submission_id, _ in parsed]
+        )
+        for position, submission_id, _ in parsed:
+            submission = submissions.get(submission_id)
+            if submission is None or submission.assignment_id != assignment.id:
+                errors.append({**position, 'submission_id': submission_id, 'error': 'no such submission for this assignment'})
+        if errors:
+            return [], errors
+
+        now = timezone.now()
+        results = []
+        for _, submission_id, changes in parsed:
+            submission = submissions[submission_id]
+            for field, value in changes.items():
+                setattr(submission, field, value)
+            submission.status = AssignmentSubmission.STATUS_GRADED
+            submission.graded_at = now
+            submission.updated_at = now
+            results.append({'submission_id': submission_id, 'score': submission.score, 'status': 'graded'})
+        AssignmentSubmission.objects.bulk_update(submissions.values(), GRADED_FIELDS, batch_size=500)
+    analytics.invalidate(assignment.id)
+    return results, errors
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from assignmentapp.visibility import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute which users can see each assignment from its audience"
+
+    def handle(self, *args, **options):
+        count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Visibility rebuilt for {count} assignments'))
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+VISIBILITY_BATCH_SIZE = 1000
+
+
+def backfill_visibility(apps, schema_editor):
+    """Assignments with an assigned_to list become 'explicit'; the rest stay visible to everyone"""
+    Assignment = apps.get_model('assignmentapp', 'Assignment')
+    AssignmentVisibility = apps.get_model('assignmentapp', 'AssignmentVisibility')
+    User = apps.get_model('account', 'User')
+    Assignees = Assignment.assigned_to.through
+
+    explicit = set(Assignees.objects.values_list('assignment_id', flat=True).distinct())
+    Assignment.objects.filter(id__in=explicit).update(audience='explicit')
+    everyone = list(User.objects.values_list('id', flat=True))
+
+    for assignment_id in Assignment.objects.values_list('id', flat=True):
+        if assignment_id in explicit:
+            user_ids = Assignees.objects.filter(assignment_id=assignment_id).values_list('user_id', flat=True)
+        else:
+            user_ids = everyone
+        AssignmentVisibility.objects.bulk_create(
+            [AssignmentVisibility(assignment_id=assignment_id, user_id=user_id) for user_id in user_ids],
+            batch_size=VISIBILITY_BATCH_SIZE,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0008_schoolpurge'),
+        ('assignmentapp', '0006_alter_assignment_due_date_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='audience',
+            field=models.CharField(choices=[('all', 'Everyone'), ('school', 'One school'), ('explicit', 'Listed users (assigned_to)')], default='all', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='assignment',
+            name='audience_school',
+            field=models.ForeignKey(blank=True, help_text="School whose users see the assignment when audience is 'school'.", null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='assignments', to='account.school'),
+        ),
+        migrations.CreateModel(
+            name='AssignmentVisibility',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visibilities', to='assignmentapp.assignment')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visible_assignments', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['assignment', 'user'], name='assignmenta_assignm_162717_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'assignment'), name='uniq_visibility_user_assignment')],
+            },
+        ),
+        migrations.RunPython(backfill_visibility, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignmentapp', '0007_assignment_audience'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assignmentsubmission',
+            index=models.Index(fields=['assignment', '-created_at', '-id'], name='assignmenta_assignm_44f849_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignmentapp', '0008_submission_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submissionattachment',
+            name='preview',
+            field=models.FileField(blank=True, help_text='Downscaled JPEG of an image, or a still frame of a video.', null=True, upload_to='previews/'),
+        ),
+        migrations.AlterField(
+            model_name='submissionattachment',
+            name='transcode_status',
+            field=models.CharField(blank=True, help_text='pending/processing/success/failed; set by the media worker (mediaapp.processing).', max_length=20, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignmentapp', '0009_submissionattachment_preview'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='assignment',
+            name='questions',
+            field=models.FileField(blank=True, db_index=True, help_text='PDF/Doc containing the questions.', null=True, upload_to='assignments/questions/%Y/%m/%d/'),
+        ),
+        migrations.AlterField(
+            model_name='submissionattachment',
+            name='blob',
+            field=models.FileField(blank=True, db_index=True, help_text='Uploaded file (image/video/audio/pdf).', null=True, upload_to='submissions/%Y/%m/%d/'),
+        ),
+        migrations.AlterField(
+            model_name='submissionattachment',
+            name='preview',
+            field=models.FileField(blank=True, db_index=True, help_text='Downscaled JPEG of an image, or a still frame of a video.', null=True, upload_to='previews/'),
+        ),
+    ]
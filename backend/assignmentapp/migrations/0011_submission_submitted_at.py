@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:53
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_submitted_at(apps, schema_editor):
+    """Before this, the only record of when a submission was handed in is its creation"""
+    AssignmentSubmission = apps.get_model('assignmentapp', 'AssignmentSubmission')
+    AssignmentSubmission.objects.filter(status__gte=1, submitted_at__isnull=True).update(submitted_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignmentapp', '0010_media_file_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignmentsubmission',
+            name='submitted_at',
+            field=models.DateTimeField(blank=True, help_text='When the parent last handed it in', null=True),
+        ),
+        migrations.RunPython(backfill_submitted_at, migrations.RunPython.noop),
+    ]
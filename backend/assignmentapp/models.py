@@ -4,6 +4,12 @@ from django.db import models
 from django.utils import timezone
 
 
+class AssignmentQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Assignments whose audience includes `user` (one lookup in AssignmentVisibility)"""
+        return self.filter(visibilities__user=user)
+
+
 class Assignment(models.Model):
     """
     Assignments entity: represents a homework or project assignment created by staff.
@@ -16,7 +22,7 @@ class Assignment(models.Model):
 
     questions = models.FileField(
         upload_to="assignments/questions/%Y/%m/%d/",
-        blank=True, null=True,
+        blank=True, null=True, db_index=True,
         help_text="PDF/Doc containing the questions."
     )
 
@@ -43,6 +49,26 @@ class Assignment(models.Model):
 
     hidden = models.BooleanField(default=False, help_text="Whether this assignment is hidden from students/parents")
 
+    # Who the assignment is for; the matching users are materialized in AssignmentVisibility
+    AUDIENCE_ALL = "all"
+    AUDIENCE_SCHOOL = "school"
+    AUDIENCE_EXPLICIT = "explicit"
+    AUDIENCE_CHOICES = [
+        (AUDIENCE_ALL, "Everyone"),
+        (AUDIENCE_SCHOOL, "One school"),
+        (AUDIENCE_EXPLICIT, "Listed users (assigned_to)"),
+    ]
+    audience = models.CharField(max_length=10, choices=AUDIENCE_CHOICES, default=AUDIENCE_ALL)
+    audience_school = models.ForeignKey(
+        "account.School",
+        on_delete=models.SET_NULL,
+        blank=True, null=True,
+        related_name="assignments",
+        help_text="School whose users see the assignment when audience is 'school'.",
+    )
+
+    objects = AssignmentQuerySet.as_manager()
+
     class Meta:
         ordering = ["-release_date", "id"]
         indexes = [
@@ -55,11 +81,34 @@ class Assignment(models.Model):
 
     def is_assigned_to_user(self, user) -> bool:
         """Check if this assignment is assigned to a specific user"""
-        # If no specific assignments, it's assigned to everyone
-        if not self.assigned_to.exists():
-            return True
-        # Otherwise, check if user is in the assigned list
-        return self.assigned_to.filter(id=user.id).exists()
+        return self.visibilities.filter(user=user).exists()
+
+    def audience_users(self):
+        """Every user the assignment is assigned to"""
+        from account.models import User
+        return User.objects.filter(visible_assignments__assignment=self)
+
+
+class AssignmentVisibility(models.Model):
+    """
+    One row per (assignment, user) the assignment is assigned to, derived from the
+    assignment's audience. Kept in sync by assignmentapp.visibility (see signals.py);
+    rebuild with manage.py rebuild_assignment_visibility.
+    """
+    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, related_name="visibilities")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="visible_assignments")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "assignment"], name="uniq_visibility_user_assignment"),
+        ]
+        indexes = [
+            models.Index(fields=["assignment", "user"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.assignment_id} → {self.user_id}"
+
 
 class AssignmentSubmission(models.Model):
     """
@@ -93,6 +142,7 @@ class AssignmentSubmission(models.Model):
     feedback = models.TextField(blank=True, null=True)
 
     # Timestamps
+    submitted_at = models.DateTimeField(blank=True, null=True, help_text="When the parent last handed it in")
     graded_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -107,6 +157,8 @@ class AssignmentSubmission(models.Model):
         indexes = [
             models.Index(fields=["user", "assignment"]),
             models.Index(fields=["status"]),
+            # Keyset pagination of an assignment's submissions, newest first
+            models.Index(fields=["assignment", "-created_at", "-id"]),
         ]
 
     def __str__(self) -> str:
@@ -119,11 +171,15 @@ class AssignmentSubmission(models.Model):
         """
         now = when or timezone.now()
         self.status = self.STATUS_SUBMITTED
-        self.save(update_fields=["status", "updated_at"])
+        self.submitted_at = now
+        self.save(update_fields=["status", "submitted_at", "updated_at"])
+
+        from . import analytics
+        analytics.invalidate(self.assignment_id)
         
         # Update user's streak if applicable
         submitted_day = now.date()
-        self.user.update_on_submission(submitted_on=submitted_day, points=self.assignment.points)
+        self.user.update_on_submission(submitted_on=submitted_day, points=self.assignment.points, submission=self)
 
     def mark_graded(self, score: float | None, feedback: str | None, when: timezone.datetime | None = None) -> None:
         """
@@ -136,6 +192,9 @@ class AssignmentSubmission(models.Model):
         self.feedback = feedback
         self.graded_at = when or timezone.now()
         self.save(update_fields=["status", "score", "feedback", "graded_at", "updated_at"])
+
+        from . import analytics
+        analytics.invalidate(self.assignment_id)
         
 
 class SubmissionAttachment(models.Model):
@@ -160,7 +219,7 @@ class SubmissionAttachment(models.Model):
 
     blob = models.FileField(
         upload_to="submissions/%Y/%m/%d/",
-        blank=True, null=True,
+        blank=True, null=True, db_index=True,
         help_text="Uploaded file (image/video/audio/pdf)."
     )
 
@@ -168,9 +227,17 @@ class SubmissionAttachment(models.Model):
     width = models.IntegerField(blank=True, null=True)     # images/video
     height = models.IntegerField(blank=True, null=True)
     duration_ms = models.IntegerField(blank=True, null=True)  # audio/video
+    TRANSCODE_PENDING = "pending"
+    TRANSCODE_PROCESSING = "processing"
+    TRANSCODE_SUCCESS = "success"
+    TRANSCODE_FAILED = "failed"
     transcode_status = models.CharField(
         max_length=20, blank=True, null=True,
-        help_text="e.g., pending/success/failed (if you add processing)."
+        help_text="pending/processing/success/failed; set by the media worker (mediaapp.processing).",
+    )
+    preview = models.FileField(
+        upload_to="previews/", blank=True, null=True, db_index=True,
+        help_text="Downscaled JPEG of an image, or a still frame of a video.",
     )
 
     created_at = models.DateTimeField(auto_now_add=True)
@@ -180,5 +247,17 @@ class SubmissionAttachment(models.Model):
             models.Index(fields=["submission", "kind"]),
         ]
 
+    @classmethod
+    def kind_for(cls, content_type: str | None) -> str:
+        """Attachment kind for a MIME type"""
+        content_type = content_type or ''
+        if content_type.startswith('image/'):
+            return cls.IMAGE
+        if content_type.startswith('video/'):
+            return cls.VIDEO
+        if content_type.startswith('audio/'):
+            return cls.AUDIO
+        return cls.FILE
+
     def __str__(self) -> str:
         return f"Attachment[{self.kind}] for submission {self.submission_id}"
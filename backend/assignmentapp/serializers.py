@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from account.models import User
+from account.models import School, User
+from mediaapp.derivatives import thumbnail_urls
 from .models import Assignment, AssignmentSubmission, SubmissionAttachment
 
 
@@ -14,6 +15,19 @@ class AssignmentSerializer(serializers.ModelSerializer):
     created_by = UserBasicSerializer(read_only=True)
     created_by_name = serializers.CharField(source='created_by.username', read_only=True)
     questions = serializers.FileField(required=False, allow_null=True)
+    audience_school = serializers.SlugRelatedField(
+        slug_field='name', queryset=School.objects.all(), required=False, allow_null=True,
+    )
+
+    def validate(self, attrs):
+        # An assigned_to list decides the audience unless one is given explicitly
+        if 'assigned_to' in attrs and 'audience' not in attrs:
+            attrs['audience'] = Assignment.AUDIENCE_EXPLICIT if attrs['assigned_to'] else Assignment.AUDIENCE_ALL
+        audience = attrs.get('audience', getattr(self.instance, 'audience', Assignment.AUDIENCE_ALL))
+        school = attrs.get('audience_school', getattr(self.instance, 'audience_school', None))
+        if audience == Assignment.AUDIENCE_SCHOOL and school is None:
+            raise serializers.ValidationError({'audience_school': "Required when audience is 'school'."})
+        return attrs
 
     class Meta:
         model = Assignment
@@ -28,6 +42,8 @@ class AssignmentSerializer(serializers.ModelSerializer):
             "created_by",
             "created_by_name",
             "hidden",
+            "audience",
+            "audience_school",
             "assigned_to",
         ]
         read_only_fields = ["id", "created_at", "created_by", "created_by_name"]
@@ -40,6 +56,12 @@ class AssignmentSubmissionSerializer(serializers.ModelSerializer):
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     attachments = serializers.SerializerMethodField()
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Lightweight rows for grading grids: context={'include_attachments': False}
+        if not self.context.get('include_attachments', True):
+            self.fields.pop('attachments')
+
     def get_attachments(self, obj):
         """Get all attachments for this submission"""
         attachments = obj.attachments.all()
@@ -57,16 +79,21 @@ class AssignmentSubmissionSerializer(serializers.ModelSerializer):
             "status_display",
             "score",
             "feedback",
+            "submitted_at",
             "graded_at",
             "created_at",
             "updated_at",
             "attachments",
         ]
-        read_only_fields = ["id", "created_at", "updated_at", "graded_at", "user_name", "assignment_name", "status_display", "attachments"]
+        read_only_fields = ["id", "created_at", "updated_at", "submitted_at", "graded_at", "user_name", "assignment_name", "status_display", "attachments"]
 
 
 class SubmissionAttachmentSerializer(serializers.ModelSerializer):
     """Serializer for submission attachments"""
+    thumbnails = serializers.SerializerMethodField()
+
+    def get_thumbnails(self, obj):
+        return thumbnail_urls(obj)
 
     class Meta:
         model = SubmissionAttachment
@@ -79,6 +106,8 @@ class SubmissionAttachmentSerializer(serializers.ModelSerializer):
             "height",
             "duration_ms",
             "transcode_status",
+            "preview",
+            "thumbnails",
             "created_at",
         ]
-        read_only_fields = ["id", "created_at"]
+        read_only_fields = ["id", "preview", "created_at"]
@@ -0,0 +1,45 @@
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
+
+from account.models import User
+
+from . import analytics, visibility
+from .models import Assignment
+
+
+@receiver(post_save, sender=Assignment)
+def refresh_assignment_visibility(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is None or {'audience', 'audience_school'} & set(update_fields):
+        visibility.refresh_assignment(instance)
+    # The audience or the due date may have changed
+    analytics.invalidate(instance.pk)
+
+
+@receiver(m2m_changed, sender=Assignment.assigned_to.through)
+def assignees_changed(sender, instance, action, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # user.assigned_assignments.add(...) and friends
+        visibility.refresh_user(instance)
+        return
+
+    # Listing users makes the audience explicit; clearing the list gives it back to everyone
+    audience = instance.audience
+    if instance.assigned_to.exists():
+        audience = Assignment.AUDIENCE_EXPLICIT
+    elif action == 'post_clear' and audience == Assignment.AUDIENCE_EXPLICIT:
+        audience = Assignment.AUDIENCE_ALL
+
+    if audience != instance.audience:
+        instance.audience = audience
+        instance.save(update_fields=['audience'])
+    else:
+        visibility.refresh_assignment(instance)
+        analytics.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def refresh_user_visibility(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is None or 'school' in update_fields:
+        visibility.refresh_user(instance)
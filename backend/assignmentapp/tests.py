@@ -1,3 +1,367 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from account.bulk import bulk_create_users
+from account.models import School, User
+
+from . import visibility
+from .analytics import assignment_analytics
+from .grading import apply_grades
+from .models import Assignment, AssignmentSubmission, AssignmentVisibility, SubmissionAttachment
+from .serializers import AssignmentSerializer
+
+
+class UserAssignmentsQueryCountTests(TestCase):
+    """The parent home page feed must cost the same number of queries however many assignments exist."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name='Sunshine Kindergarten')
+        cls.teacher = User.objects.create(username='teacher', role='teacher')
+        cls.parent = User.objects.create(username='parent', role='parent', school=cls.school)
+        cls.other = User.objects.create(username='other', role='parent')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def _add_assignments(self, count):
+        now = timezone.now()
+        for i in range(count):
+            # Every third assignment is for the parent's school
+            school_fields = {'audience': Assignment.AUDIENCE_SCHOOL, 'audience_school': self.school} if i % 3 == 0 else {}
+            assignment = Assignment.objects.create(
+                name=f'Assignment {i}', release_date=now - timedelta(days=i), due_date=now + timedelta(days=7),
+                created_by=self.teacher, **school_fields,
+            )
+            if i % 3 == 1:
+                assignment.assigned_to.add(self.parent)
+            elif i % 3 == 2:
+                assignment.assigned_to.add(self.other)
+            if i % 2 == 0:
+                submission = AssignmentSubmission.objects.create(
+                    user=self.parent, assignment=assignment, status=AssignmentSubmission.STATUS_SUBMITTED,
+                )
+                SubmissionAttachment.objects.create(submission=submission, kind=SubmissionAttachment.FILE)
+
+    def _feed(self):
+        return self.client.get(f'/assignments/user/{self.parent.id}/')
+
+    def test_query_count_is_flat(self):
+        self._add_assignments(6)
+        with self.assertNumQueries(5):
+            small = self._feed()
+        self._add_assignments(60)
+        with self.assertNumQueries(5):
+            large = self._feed()
+        self.assertEqual(len(small.data['assignments']), 4)
+        self.assertEqual(len(large.data['assignments']), 44)
+
+    def test_staff_list_query_count_is_flat(self):
+        self._add_assignments(6)
+        with self.assertNumQueries(2):
+            small = self.client.get('/assignments/')
+        self._add_assignments(60)
+        with self.assertNumQueries(2):
+            large = self.client.get('/assignments/')
+        self.assertEqual(len(small.data), 6)
+        self.assertEqual(len(large.data), 66)
+        self.assertEqual(large.data[0]['audience_school'], self.school.name)
+
+    def test_response_shape(self):
+        self._add_assignments(3)
+        assignments = {item['name']: item for item in self._feed().data['assignments']}
+
+        self.assertEqual(set(assignments), {'Assignment 0', 'Assignment 1'})
+        self.assertEqual(assignments['Assignment 1']['assigned_to'], [self.parent.id])
+        self.assertEqual(assignments['Assignment 0']['audience_school'], self.school.name)
+        self.assertIsNone(assignments['Assignment 1']['submission'])
+        submission = assignments['Assignment 0']['submission']
+        self.assertEqual((submission['user']['id'], submission['assignment_name']), (self.parent.id, 'Assignment 0'))
+        self.assertEqual(len(submission['attachments']), 1)
+
+
+class AssignmentVisibilityTests(TestCase):
+    """AssignmentVisibility must always match each assignment's audience."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name='Sunshine Kindergarten')
+        cls.other_school = School.objects.create(name='Harbour Kindergarten')
+        cls.teacher = User.objects.create(username='teacher', role='teacher', school=cls.school)
+        cls.parent = User.objects.create(username='parent', role='parent', school=cls.school)
+        cls.other = User.objects.create(username='other', role='parent', school=cls.other_school)
+
+    def _assignment(self, **fields):
+        now = timezone.now()
+        return Assignment.objects.create(
+            name='Counting', release_date=now, due_date=now + timedelta(days=7), created_by=self.teacher, **fields,
+        )
+
+    def _audience(self, assignment):
+        return set(assignment.audience_users().values_list('username', flat=True))
+
+    def test_everyone(self):
+        assignment = self._assignment()
+        self.assertEqual(self._audience(assignment), {'teacher', 'parent', 'other'})
+        self.assertTrue(assignment.is_assigned_to_user(self.other))
+
+    def test_school_audience_follows_school_changes(self):
+        assignment = self._assignment(audience=Assignment.AUDIENCE_SCHOOL, audience_school=self.school)
+        self.assertEqual(self._audience(assignment), {'teacher', 'parent'})
+
+        self.other.school = self.school
+        self.other.save(update_fields=['school'])
+        self.parent.school = self.other_school
+        self.parent.save()
+        self.assertEqual(self._audience(assignment), {'teacher', 'other'})
+
+    def test_assigned_to_makes_audience_explicit(self):
+        assignment = self._assignment()
+        assignment.assigned_to.add(self.parent)
+        assignment.refresh_from_db()
+        self.assertEqual(assignment.audience, Assignment.AUDIENCE_EXPLICIT)
+        self.assertEqual(self._audience(assignment), {'parent'})
+        self.assertFalse(assignment.is_assigned_to_user(self.other))
+
+        # Replacing the list never exposes the assignment to everyone in between
+        assignment.assigned_to.set([self.other])
+        self.assertEqual(self._audience(assignment), {'other'})
+
+        assignment.assigned_to.clear()
+        assignment.refresh_from_db()
+        self.assertEqual(assignment.audience, Assignment.AUDIENCE_ALL)
+        self.assertEqual(self._audience(assignment), {'teacher', 'parent', 'other'})
+
+    def test_new_users_see_open_assignments(self):
+        everyone = self._assignment()
+        school_only = self._assignment(audience=Assignment.AUDIENCE_SCHOOL, audience_school=self.school)
+        listed = self._assignment()
+        listed.assigned_to.add(self.parent)
+
+        late = User.objects.create(username='late', role='parent', school=self.school)
+        bulk_create_users([User(username='bulk', role='parent', school=self.school)])
+        bulk = User.objects.get(username='bulk')
+        for user in (late, bulk):
+            visible = set(Assignment.objects.visible_to(user))
+            self.assertEqual(visible, {everyone, school_only})
+
+    def test_rebuild_restores_rows(self):
+        assignment = self._assignment(audience=Assignment.AUDIENCE_SCHOOL, audience_school=self.school)
+        AssignmentVisibility.objects.all().delete()
+        self.assertEqual(visibility.rebuild(), 1)
+        self.assertEqual(self._audience(assignment), {'teacher', 'parent'})
+
+    def test_school_audience_requires_school(self):
+        now = timezone.now()
+        data = {'name': 'Colours', 'release_date': now, 'due_date': now + timedelta(days=1), 'audience': 'school'}
+        self.assertFalse(AssignmentSerializer(data=data).is_valid())
+        data['audience_school'] = self.school.name
+        serializer = AssignmentSerializer(data=data)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        assignment = serializer.save(created_by=self.teacher)
+        self.assertEqual(self._audience(assignment), {'teacher', 'parent'})
+
+
+class AssignmentSubmissionListTests(TestCase):
+    """The grading list costs a fixed number of queries and pages on (created_at, id)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create(username='teacher', role='teacher')
+        now = timezone.now()
+        cls.assignment = Assignment.objects.create(
+            name='Counting', release_date=now, due_date=now + timedelta(days=7), created_by=cls.teacher,
+        )
+        for i in range(7):
+            parent = User.objects.create(username=f'parent{i}', role='parent')
+            submission = AssignmentSubmission.objects.create(
+                user=parent, assignment=cls.assignment,
+                status=AssignmentSubmission.STATUS_GRADED if i % 3 == 0 else AssignmentSubmission.STATUS_SUBMITTED,
+            )
+            SubmissionAttachment.objects.create(submission=submission, kind=SubmissionAttachment.FILE)
+        # Identical timestamps must still page without gaps or repeats
+        AssignmentSubmission.objects.filter(user__username__in=['parent2', 'parent3', 'parent4']).update(created_at=now)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = f'/assignments/{self.assignment.id}/submissions/'
+
+    def test_unpaginated_list_is_prefetched(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data), 7)
+        self.assertEqual(len(response.data[0]['attachments']), 1)
+
+    def test_pages_cover_every_submission_once(self):
+        seen, cursor = [], ''
+        while True:
+            with self.assertNumQueries(3):
+                response = self.client.get(self.url, {'page_size': 2, 'cursor': cursor})
+            seen.extend(item['id'] for item in response.data['submissions'])
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                break
+        expected = list(
+            AssignmentSubmission.objects.filter(assignment=self.assignment)
+            .order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_filters_and_lightweight_rows(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'graded': 'false', 'include_attachments': 'false'})
+        self.assertEqual(len(response.data), 4)
+        self.assertNotIn('attachments', response.data[0])
+        self.assertEqual(len(self.client.get(self.url, {'status': AssignmentSubmission.STATUS_GRADED}).data), 3)
+
+    def test_bad_parameters(self):
+        for params in ({'status': 5}, {'graded': 'maybe'}, {'cursor': 'nonsense'}, {'page_size': 0}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+
+
+class BulkGradeTests(TestCase):
+    """Bulk grading applies every grade in one go or none at all."""
+
+    @classmethod
+    def setUpTestData(cls):
+        teacher = User.objects.create(username='teacher', role='teacher')
+        now = timezone.now()
+        cls.assignment = Assignment.objects.create(
+            name='Counting', release_date=now, due_date=now + timedelta(days=7), created_by=teacher,
+        )
+        other = Assignment.objects.create(
+            name='Colours', release_date=now, due_date=now + timedelta(days=7), created_by=teacher,
+        )
+        parents = [User.objects.create(username=f'parent{i}', role='parent') for i in range(3)]
+        cls.submissions = [
+            AssignmentSubmission.objects.create(
+                user=parent, assignment=cls.assignment, status=AssignmentSubmission.STATUS_SUBMITTED, feedback='Keep going',
+            )
+            for parent in parents
+        ]
+        cls.foreign = AssignmentSubmission.objects.create(user=parents[0], assignment=other)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = f'/assignments/{self.assignment.id}/submissions/grade/'
+
+    def test_grades_are_applied_together(self):
+        first, second, third = self.submissions
+        grades = [
+            {'submission_id': first.id, 'score': 9.5, 'feedback': 'Well done'},
+            {'submission_id': second.id, 'score': 7},
+            {'submission_id': third.id, 'feedback': 'Try again'},
+        ]
+        # assignment, locked submissions, one UPDATE, plus the transaction's savepoint pair
+        with self.assertNumQueries(5):
+            response = self.client.post(self.url, {'grades': grades}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['graded'], 3)
+
+        graded = {s.id: s for s in AssignmentSubmission.objects.filter(assignment=self.assignment)}
+        self.assertEqual((graded[first.id].score, graded[first.id].feedback), (9.5, 'Well done'))
+        self.assertEqual((graded[second.id].score, graded[second.id].feedback), (7, 'Keep going'))
+        self.assertIsNone(graded[third.id].score)
+        for submission in graded.values():
+            self.assertEqual(submission.status, AssignmentSubmission.STATUS_GRADED)
+            self.assertIsNotNone(submission.graded_at)
+
+    def test_any_invalid_grade_rejects_the_batch(self):
+        grades = [
+            {'submission_id': self.submissions[0].id, 'score': 8},
+            {'submission_id': self.submissions[1].id, 'score': 'ten'},
+            {'submission_id': self.foreign.id, 'score': 5},
+        ]
+        response = self.client.post(self.url, {'grades': grades}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertFalse(AssignmentSubmission.objects.filter(status=AssignmentSubmission.STATUS_GRADED).exists())
+
+    def test_csv_grading_sheet(self):
+        first, second, _ = self.submissions
+        sheet = SimpleUploadedFile(
+            'grades.csv',
+            f'submission_id,username,score,feedback\n{first.id},parent0,6,Nice\n{second.id},parent1,,\n'.encode(),
+            content_type='text/csv',
+        )
+        response = self.client.post(self.url, {'file': sheet}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.data)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.score, first.feedback), (6, 'Nice'))
+        self.assertEqual((second.status, second.feedback), (AssignmentSubmission.STATUS_GRADED, 'Keep going'))
+
+
+class AssignmentAnalyticsTests(TestCase):
+    """Analytics are grouped per school, cached, and refreshed by submitting and grading."""
+
+    @classmethod
+    def setUpTestData(cls):
+        sunshine = School.objects.create(name='Sunshine Kindergarten')
+        harbour = School.objects.create(name='Harbour Kindergarten')
+        teacher = User.objects.create(username='teacher', role='teacher', school=sunshine)
+        now = timezone.now()
+        cls.assignment = Assignment.objects.create(
+            name='Counting', release_date=now, due_date=now + timedelta(days=7), created_by=teacher, points=10,
+        )
+        cls.parents = [User.objects.create(username=f'sun{i}', role='parent', school=sunshine) for i in range(3)]
+        cls.parents += [User.objects.create(username=f'harbour{i}', role='parent', school=harbour) for i in range(2)]
+
+        cls.submissions = [
+            AssignmentSubmission.objects.create(user=parent, assignment=cls.assignment) for parent in cls.parents[:4]
+        ]
+        for submission in cls.submissions[:3]:
+            submission.mark_submitted()
+        AssignmentSubmission.objects.filter(pk=cls.submissions[1].pk).update(submitted_at=now + timedelta(days=8))
+        cls.submissions[0].mark_graded(score=9, feedback='')
+        cls.submissions[2].mark_graded(score=4, feedback='')
+
+    def setUp(self):
+        # Ids are reused between tests, and so would be cached analytics
+        cache.clear()
+
+    def test_figures(self):
+        data = assignment_analytics(self.assignment)
+        self.assertEqual(
+            (data['audience'], data['submitted'], data['graded'], data['completion_rate'], data['on_time'], data['late']),
+            (5, 3, 2, 0.6, 2, 1),
+        )
+        self.assertEqual((data['score']['count'], data['score']['mean'], data['score']['max']), (2, 6.5, 9))
+        self.assertEqual([b['count'] for b in data['score']['histogram']], [0, 0, 0, 0, 1, 0, 0, 0, 0, 1])
+
+        schools = {s['school']: s for s in data['schools']}
+        self.assertEqual(set(schools), {'Sunshine Kindergarten', 'Harbour Kindergarten'})
+        sunshine, harbour = schools['Sunshine Kindergarten'], schools['Harbour Kindergarten']
+        self.assertEqual((sunshine['audience'], sunshine['submitted'], sunshine['late']), (3, 3, 1))
+        self.assertEqual((sunshine['completion_rate'], sunshine['score_mean']), (1.0, 6.5))
+        self.assertEqual((harbour['audience'], harbour['submitted'], harbour['completion_rate']), (2, 0, 0.0))
+
+    def test_cached_until_a_submission_or_grade(self):
+        assignment_analytics(self.assignment)
+        with self.assertNumQueries(0):
+            assignment_analytics(self.assignment)
+
+        self.submissions[3].mark_submitted()
+        self.assertEqual(assignment_analytics(self.assignment)['submitted'], 4)
+
+        self.submissions[3].mark_graded(score=10, feedback='')
+        self.assertEqual(assignment_analytics(self.assignment)['score']['count'], 3)
+
+    def test_bulk_grading_refreshes(self):
+        self.assertEqual(assignment_analytics(self.assignment)['graded'], 2)
+        results, errors = apply_grades(self.assignment, [{'submission_id': self.submissions[1].id, 'score': 7}])
+        self.assertEqual(errors, [])
+        data = assignment_analytics(self.assignment)
+        self.assertEqual((data['graded'], data['score']['mean']), (3, 6.67))
+
+    def test_endpoint(self):
+        response = APIClient().get(f'/assignments/{self.assignment.id}/analytics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['submitted'], 3)
+        self.assertEqual(len(response.data['schools']), 2)
 
-# Create your tests here.
@@ -17,6 +17,8 @@ urlpatterns = [
     
     # Assignment submissions
     path('<int:assignment_pk>/submissions/', views.assignment_submissions, name='assignment-submissions'),
+    path('<int:assignment_pk>/submissions/grade/', views.bulk_grade_submissions, name='bulk-grade-submissions'),
+    path('<int:assignment_pk>/analytics/', views.assignment_analytics, name='assignment-analytics'),
     path('<int:assignment_pk>/submit/', views.submit_assignment, name='submit-assignment'),
     path('submissions/<int:submission_pk>/grade/', views.grade_submission, name='grade-submission'),
     path('submissions/<int:submission_pk>/feedback/', views.update_submission_feedback, name='update-submission-feedback'),
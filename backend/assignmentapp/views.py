@@ -1,3 +1,7 @@
+import binascii
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
 from rest_framework.decorators import api_view, parser_classes
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.response import Response
@@ -5,27 +9,24 @@ from rest_framework import status
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.core.paginator import Paginator
+from django.db.models import Prefetch, Q
+from account.authentication import acting_user
 from account.models import User
+from mediaapp.processing import queue_submission_attachment
+from mediaapp.upload_handlers import media_uploads, rejected_upload
+from mediaapp.uploads import UploadError, attach_upload, get_complete_upload
 
+from .analytics import assignment_analytics as compute_assignment_analytics
+from .grading import GradeSheetError, apply_grades, read_grade_sheet
 from .models import Assignment, AssignmentSubmission, SubmissionAttachment
-from account.models import User
 from .serializers import AssignmentSerializer, AssignmentSubmissionSerializer
 
+SUBMISSION_PAGE_SIZE_DEFAULT = 50
+SUBMISSION_PAGE_SIZE_MAX = 500
+QUESTION_FILE_KINDS = ('document', 'image')
 
-def get_user(request):
-    """Check if user role is staff"""
-    # Get user_id from request (could be from headers, query params, or body)
-    user_id = request.headers.get('User-ID') or request.GET.get('user_id') or request.data.get('user_id')
-    
-    if not user_id:
-        return False, None
-    
-    try:
-        user = User.objects.get(id=user_id)
-        return user
-    except User.DoesNotExist:
-        return False, None
 
+@media_uploads(kinds=QUESTION_FILE_KINDS)
 @api_view(['GET', 'POST'])
 @parser_classes([JSONParser, MultiPartParser, FormParser])
 def assignment_list_create(request):
@@ -33,14 +34,21 @@ def assignment_list_create(request):
     GET: List all assignments (staff only)
     POST: Create a new assignment (staff only)
     """
-    user = get_user(request)
+    user = acting_user(request)
  
     if request.method == 'GET':
-        assignments = Assignment.objects.all().order_by('-release_date')
+        assignments = (
+            Assignment.objects.select_related('created_by', 'audience_school')
+            .prefetch_related(Prefetch('assigned_to', queryset=User.objects.only('id')))
+            .order_by('-release_date')
+        )
         serializer = AssignmentSerializer(assignments, many=True)
         return Response(serializer.data)
     
     elif request.method == 'POST':
+        rejected = rejected_upload(request)
+        if rejected:
+            return Response({'detail': str(rejected)}, status=rejected.status)
         serializer = AssignmentSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save(created_by=user)
@@ -52,31 +60,27 @@ def assignment_list_create(request):
 def user_assignments(request, user_id):
     """Get assignments for a specific user"""
     user = get_object_or_404(User, id=user_id)
-    
-    # Get all non-hidden assignments
-    all_assignments = Assignment.objects.filter(hidden=False).order_by('-release_date')
-    
-    # Filter assignments that are assigned to this user
-    assignments = [assignment for assignment in all_assignments if assignment.is_assigned_to_user(user)]
-    
+
+    # One query for the visible assignments, plus one prefetch each for their assignees,
+    # this user's submissions and those submissions' attachments
+    my_submissions = AssignmentSubmission.objects.filter(user=user).select_related('user').prefetch_related('attachments')
+    assignments = (
+        Assignment.objects.filter(hidden=False)
+        .visible_to(user)
+        .select_related('created_by', 'audience_school')
+        .prefetch_related(
+            Prefetch('assigned_to', queryset=User.objects.only('id')),
+            Prefetch('submissions', queryset=my_submissions, to_attr='my_submissions'),
+        )
+        .order_by('-release_date')
+    )
+
     # Serialize assignments with submission status for this user
     assignment_data = []
     for assignment in assignments:
-        assignment_serializer = AssignmentSerializer(assignment)
-        assignment_info = assignment_serializer.data
-        
-        # Check if user has submitted this assignment
-        submission = AssignmentSubmission.objects.filter(
-            user=user, 
-            assignment=assignment
-        ).first()
-        
-        if submission:
-            submission_serializer = AssignmentSubmissionSerializer(submission)
-            assignment_info['submission'] = submission_serializer.data
-        else:
-            assignment_info['submission'] = None
-            
+        assignment_info = AssignmentSerializer(assignment).data
+        submission = assignment.my_submissions[0] if assignment.my_submissions else None
+        assignment_info['submission'] = AssignmentSubmissionSerializer(submission).data if submission else None
         assignment_data.append(assignment_info)
     
     return Response({
@@ -86,6 +90,7 @@ def user_assignments(request, user_id):
     })
 
 
+@media_uploads(kinds=QUESTION_FILE_KINDS)
 @api_view(['GET', 'PUT', 'PATCH', 'DELETE'])
 @parser_classes([JSONParser, MultiPartParser, FormParser])
 def assignment_detail(request, pk):
@@ -102,6 +107,9 @@ def assignment_detail(request, pk):
         return Response(serializer.data)
     
     elif request.method in ['PUT', 'PATCH']:
+        rejected = rejected_upload(request)
+        if rejected:
+            return Response({'detail': str(rejected)}, status=rejected.status)
         partial = request.method == 'PATCH'
         serializer = AssignmentSerializer(assignment, data=request.data, partial=partial)
         if serializer.is_valid():
@@ -154,14 +162,93 @@ def assignment_update_deadline(request, pk):
     })
 
 
+def _encode_submission_cursor(submission):
+    """Opaque keyset cursor for (created_at, id)"""
+    raw = f'{submission.created_at.isoformat()}|{submission.id}'
+    return urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_submission_cursor(cursor):
+    """(created_at, id) from a cursor; raises ValueError if malformed"""
+    try:
+        created_at, submission_id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError(cursor)
+    return datetime.fromisoformat(created_at), int(submission_id)
+
+
 @api_view(['GET'])
 def assignment_submissions(request, assignment_pk):
-    """List submissions for an assignment (staff only)"""
+    """
+    List submissions for an assignment, newest first (staff only)
+    Query params (all optional):
+    - status: 0 (not submitted), 1 (submitted) or 2 (graded)
+    - graded: "true" or "false"
+    - include_attachments: "false" leaves attachments out (lighter rows for grading grids)
+    - page_size / cursor: keyset pagination on (created_at, id); pass back next_cursor to get the next page
+    """
 
     assignment = get_object_or_404(Assignment, pk=assignment_pk)
-    submissions = AssignmentSubmission.objects.filter(assignment=assignment).order_by('-created_at')
-    serializer = AssignmentSubmissionSerializer(submissions, many=True)
-    return Response(serializer.data)
+    submissions = AssignmentSubmission.objects.filter(assignment=assignment).order_by('-created_at', '-id')
+
+    status_filter = request.GET.get('status')
+    if status_filter is not None:
+        if status_filter not in {str(value) for value, _ in AssignmentSubmission.STATUS_CHOICES}:
+            return Response({'detail': 'status must be 0, 1 or 2'}, status=status.HTTP_400_BAD_REQUEST)
+        submissions = submissions.filter(status=int(status_filter))
+
+    graded = request.GET.get('graded')
+    if graded is not None:
+        if graded not in ('true', 'false'):
+            return Response({'detail': 'graded must be "true" or "false"'}, status=status.HTTP_400_BAD_REQUEST)
+        if graded == 'true':
+            submissions = submissions.filter(status=AssignmentSubmission.STATUS_GRADED)
+        else:
+            submissions = submissions.filter(status__lt=AssignmentSubmission.STATUS_GRADED)
+
+    include_attachments = request.GET.get('include_attachments', 'true') != 'false'
+    submissions = submissions.select_related('user', 'assignment')
+    if include_attachments:
+        submissions = submissions.prefetch_related('attachments')
+    context = {'include_attachments': include_attachments}
+
+    cursor = request.GET.get('cursor')
+    page_size = request.GET.get('page_size')
+    if cursor is None and page_size is None:
+        return Response(AssignmentSubmissionSerializer(submissions, many=True, context=context).data)
+
+    try:
+        page_size = min(int(page_size or SUBMISSION_PAGE_SIZE_DEFAULT), SUBMISSION_PAGE_SIZE_MAX)
+        if page_size < 1:
+            raise ValueError
+        if cursor:
+            created_at, submission_id = _decode_submission_cursor(cursor)
+            submissions = submissions.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=submission_id)
+            )
+    except ValueError:
+        return Response({'detail': 'invalid cursor or page_size'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Fetch one extra row to know whether another page exists
+    page = list(submissions[:page_size + 1])
+    has_more = len(page) > page_size
+    page = page[:page_size]
+    return Response({
+        'submissions': AssignmentSubmissionSerializer(page, many=True, context=context).data,
+        'count': len(page),
+        'page_size': page_size,
+        'next_cursor': _encode_submission_cursor(page[-1]) if has_more else None,
+    })
+
+
+@api_view(['GET'])
+def assignment_analytics(request, assignment_pk):
+    """
+    Completion, on-time vs late, score histogram and per-school breakdown of an
+    assignment (staff only). Cached; refreshed when submissions are made or graded.
+    """
+    assignment = get_object_or_404(Assignment, pk=assignment_pk)
+    return Response(compute_assignment_analytics(assignment))
 
 
 @api_view(['POST'])
@@ -178,6 +265,34 @@ def grade_submission(request, submission_pk):
     return Response(serializer.data)
 
 
+@api_view(['POST'])
+@parser_classes([JSONParser, MultiPartParser, FormParser])
+def bulk_grade_submissions(request, assignment_pk):
+    """
+    Grade many submissions of an assignment at once (staff only)
+    JSON: {"grades": [{"submission_id": 1, "score": 9.5, "feedback": "Well done"}, ...]}
+    or form data: file=<grading sheet .csv with submission_id,score,feedback columns>
+    All grades are applied together or, if any is invalid, none are.
+    """
+    assignment = get_object_or_404(Assignment, pk=assignment_pk)
+
+    upload = request.FILES.get('file')
+    if upload:
+        try:
+            items = read_grade_sheet(upload.file)
+        except GradeSheetError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        items = request.data.get('grades')
+        if not isinstance(items, list):
+            return Response({'detail': 'grades list or file is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    results, errors = apply_grades(assignment, items)
+    if errors:
+        return Response({'detail': 'No grades were applied', 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'assignment_id': assignment.id, 'graded': len(results), 'results': results})
+
+
 @api_view(['PATCH'])
 @parser_classes([JSONParser, MultiPartParser, FormParser])
 def update_submission_feedback(request, submission_pk):
@@ -228,7 +343,7 @@ def update_submission_feedback(request, submission_pk):
 @parser_classes([JSONParser, MultiPartParser, FormParser])
 def assign_to_parents(request, assignment_pk):
     """Assign an assignment to specific parents (staff only)"""
-    user = get_user(request)
+    user = acting_user(request)
     # Note: Add staff check if needed: if user.role != 'staff': return 403
     
     assignment = get_object_or_404(Assignment, pk=assignment_pk)
@@ -245,8 +360,10 @@ def assign_to_parents(request, assignment_pk):
             'detail': f'Parent users not found with IDs: {list(missing_ids)}'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    # Clear existing assignments and add new ones
-    assignment.assigned_to.clear()
+    # Replace the assigned list; set() only touches the difference
+    if assignment.audience != Assignment.AUDIENCE_EXPLICIT:
+        assignment.audience = Assignment.AUDIENCE_EXPLICIT
+        assignment.save(update_fields=['audience'])
     assignment.assigned_to.set(parents)
     
     return Response({
@@ -257,11 +374,44 @@ def assign_to_parents(request, assignment_pk):
     })
 
 
+def _requested_upload(request, user):
+    """(upload, error response) for the request's upload_id, if it names one"""
+    upload_id = request.data.get('upload_id')
+    if not upload_id or request.FILES:
+        return None, None
+    try:
+        return get_complete_upload(upload_id, user), None
+    except UploadError as e:
+        return None, Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _attach_upload(submission, upload):
+    """Replace the submission's attachments with a completed chunked upload"""
+    SubmissionAttachment.objects.filter(submission=submission).delete()
+    attachment = SubmissionAttachment(
+        submission=submission,
+        kind=SubmissionAttachment.kind_for(upload.content_type),
+        transcode_status=SubmissionAttachment.TRANSCODE_PENDING,
+    )
+    try:
+        attach_upload(upload, attachment, 'blob')
+    except UploadError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    attachment.save()
+    queue_submission_attachment(attachment)
+    return None
+
+
+@media_uploads()
 @api_view(['POST'])
-@parser_classes([MultiPartParser, FormParser])
+@parser_classes([JSONParser, MultiPartParser, FormParser])
 def submit_assignment(request, assignment_pk):
-    """Submit an assignment (parent only)"""
-    user = get_user(request)
+    """
+    Submit an assignment (parent only)
+    Attach a file directly, or pass upload_id of a completed chunked upload (see mediaapp)
+    Files are checked for type and size as they arrive (mediaapp.upload_handlers)
+    """
+    user = acting_user(request)
 
     assignment = get_object_or_404(Assignment, pk=assignment_pk)
     
@@ -277,6 +427,13 @@ def submit_assignment(request, assignment_pk):
     now = timezone.now()
     if now > assignment.due_date:
         return Response({'detail': 'Assignment deadline has passed'}, status=status.HTTP_400_BAD_REQUEST)
+
+    rejected = rejected_upload(request)
+    if rejected:
+        return Response({'detail': str(rejected)}, status=rejected.status)
+    upload, error = _requested_upload(request, user)
+    if error:
+        return error
     
     # Check if user already has a submission for this assignment
     existing_submission = AssignmentSubmission.objects.filter(
@@ -306,39 +463,23 @@ def submit_assignment(request, assignment_pk):
         # Clear existing attachments for this submission (in case of resubmission)
         SubmissionAttachment.objects.filter(submission=submission).delete()
         
-        # Determine file type based on content type
-        content_type = uploaded_file.content_type or ''
-        
-        if content_type.startswith('image/'):
-            kind = SubmissionAttachment.IMAGE
-        elif content_type.startswith('video/'):
-            kind = SubmissionAttachment.VIDEO
-        elif content_type.startswith('audio/'):
-            kind = SubmissionAttachment.AUDIO
-        else:
-            kind = SubmissionAttachment.FILE
+        # Determine file type based on content type (sniffed from the file's bytes)
+        kind = SubmissionAttachment.kind_for(uploaded_file.content_type)
         
         # Create SubmissionAttachment object
         attachment = SubmissionAttachment.objects.create(
             submission=submission,
             kind=kind,
-            blob=uploaded_file
+            blob=uploaded_file,
+            transcode_status=SubmissionAttachment.TRANSCODE_PENDING,
         )
         
-        # Set metadata for images
-        if kind == SubmissionAttachment.IMAGE:
-            try:
-                from PIL import Image
-                image = Image.open(uploaded_file)
-                attachment.width = image.width
-                attachment.height = image.height
-                attachment.save(update_fields=['width', 'height'])
-            except ImportError:
-                # PIL not installed, skip metadata
-                pass
-            except Exception:
-                # Error processing image, skip metadata
-                pass
+        # Dimensions, duration and preview are filled in by the media worker
+        queue_submission_attachment(attachment)
+    elif upload:
+        error = _attach_upload(submission, upload)
+        if error:
+            return error
     
     serializer = AssignmentSubmissionSerializer(submission)
     return Response({
@@ -349,11 +490,15 @@ def submit_assignment(request, assignment_pk):
     }, status=status.HTTP_201_CREATED)
 
 
+@media_uploads()
 @api_view(['PATCH'])
-@parser_classes([MultiPartParser, FormParser])
+@parser_classes([JSONParser, MultiPartParser, FormParser])
 def edit_submission(request, submission_pk):
-    """Edit a submission (parent only - can only edit their own submissions)"""
-    user = get_user(request)
+    """
+    Edit a submission (parent only - can only edit their own submissions)
+    Replace the file directly, or pass upload_id of a completed chunked upload
+    """
+    user = acting_user(request)
 
     submission = get_object_or_404(AssignmentSubmission, pk=submission_pk)
     
@@ -373,6 +518,13 @@ def edit_submission(request, submission_pk):
     # Check if submission hasn't been graded yet
     if submission.status == AssignmentSubmission.STATUS_GRADED:
         return Response({'detail': 'Cannot edit graded submissions'}, status=status.HTTP_400_BAD_REQUEST)
+
+    rejected = rejected_upload(request)
+    if rejected:
+        return Response({'detail': str(rejected)}, status=rejected.status)
+    upload, error = _requested_upload(request, user)
+    if error:
+        return error
     
     # Handle file replacement if new file is provided
     if request.FILES:
@@ -382,37 +534,23 @@ def edit_submission(request, submission_pk):
         # Clear existing attachments
         SubmissionAttachment.objects.filter(submission=submission).delete()
         
-        # Determine file type based on content type
-        content_type = uploaded_file.content_type or ''
-        
-        if content_type.startswith('image/'):
-            kind = SubmissionAttachment.IMAGE
-        elif content_type.startswith('video/'):
-            kind = SubmissionAttachment.VIDEO
-        elif content_type.startswith('audio/'):
-            kind = SubmissionAttachment.AUDIO
-        else:
-            kind = SubmissionAttachment.FILE
+        # Determine file type based on content type (sniffed from the file's bytes)
+        kind = SubmissionAttachment.kind_for(uploaded_file.content_type)
         
         # Create new SubmissionAttachment object
         attachment = SubmissionAttachment.objects.create(
             submission=submission,
             kind=kind,
-            blob=uploaded_file
+            blob=uploaded_file,
+            transcode_status=SubmissionAttachment.TRANSCODE_PENDING,
         )
         
-        # Set metadata for images
-        if kind == SubmissionAttachment.IMAGE:
-            try:
-                from PIL import Image
-                image = Image.open(uploaded_file)
-                attachment.width = image.width
-                attachment.height = image.height
-                attachment.save(update_fields=['width', 'height'])
-            except ImportError:
-                pass
-            except Exception:
-                pass
+        # Dimensions, duration and preview are filled in by the media worker
+        queue_submission_attachment(attachment)
+    elif upload:
+        error = _attach_upload(submission, upload)
+        if error:
+            return error
     
     # Update submission timestamp
     submission.save(update_fields=['updated_at'])
@@ -0,0 +1,92 @@
+"""
+Materialized assignment visibility.
+
+An assignment's audience is everyone, one school, or the users listed in assigned_to.
+AssignmentVisibility holds one row per (assignment, user) in that audience, so "can
+this user see this assignment", "which assignments can this user see" and "who still
+has to submit" are single indexed lookups instead of re-deriving the audience.
+
+The rows are refreshed
+- per assignment when it is saved or its assigned_to list changes,
+- per user when a user is created or changes school,
+- for users inserted with bulk_create by calling add_users() (no signals fire).
+"""
+from django.db import transaction
+from django.db.models import Q
+
+from account.models import User
+
+from .models import Assignment, AssignmentVisibility
+
+VISIBILITY_BATCH_SIZE = 1000
+
+
+def _insert(pairs):
+    rows = [AssignmentVisibility(assignment_id=assignment_id, user_id=user_id) for assignment_id, user_id in pairs]
+    AssignmentVisibility.objects.bulk_create(rows, batch_size=VISIBILITY_BATCH_SIZE, ignore_conflicts=True)
+
+
+def _audience_users(assignment):
+    if assignment.audience == Assignment.AUDIENCE_ALL:
+        return User.objects.all()
+    if assignment.audience == Assignment.AUDIENCE_SCHOOL:
+        return User.objects.filter(school_id=assignment.audience_school_id) if assignment.audience_school_id else User.objects.none()
+    return User.objects.filter(assigned_assignments=assignment)
+
+
+def _assignments_for(user):
+    audience = Q(audience=Assignment.AUDIENCE_ALL) | Q(audience=Assignment.AUDIENCE_EXPLICIT, assigned_to=user)
+    if user.school_id:
+        audience |= Q(audience=Assignment.AUDIENCE_SCHOOL, audience_school_id=user.school_id)
+    return Assignment.objects.filter(audience)
+
+
+def refresh_assignment(assignment):
+    """Bring the assignment's visibility rows in line with its audience"""
+    audience = _audience_users(assignment)
+    current = AssignmentVisibility.objects.filter(assignment=assignment)
+    with transaction.atomic():
+        current.exclude(user__in=audience).delete()
+        missing = audience.exclude(id__in=current.values('user_id')).values_list('id', flat=True)
+        batch = []
+        for user_id in missing.iterator(chunk_size=VISIBILITY_BATCH_SIZE):
+            batch.append((assignment.id, user_id))
+            if len(batch) >= VISIBILITY_BATCH_SIZE:
+                _insert(batch)
+                batch = []
+        _insert(batch)
+
+
+def refresh_user(user):
+    """Bring the user's visibility rows in line with the audiences they belong to"""
+    assignments = _assignments_for(user)
+    current = AssignmentVisibility.objects.filter(user=user)
+    with transaction.atomic():
+        current.exclude(assignment__in=assignments).delete()
+        missing = assignments.exclude(id__in=current.values('assignment_id')).values_list('id', flat=True)
+        _insert((assignment_id, user.id) for assignment_id in missing)
+
+
+def add_users(users):
+    """Add visibility rows for newly created users (e.g. after bulk_create)"""
+    everyone = list(Assignment.objects.filter(audience=Assignment.AUDIENCE_ALL).values_list('id', flat=True))
+    by_school = {}
+    for assignment_id, school_id in Assignment.objects.filter(
+        audience=Assignment.AUDIENCE_SCHOOL, audience_school_id__in={user.school_id for user in users},
+    ).values_list('id', 'audience_school_id'):
+        by_school.setdefault(school_id, []).append(assignment_id)
+
+    _insert(
+        (assignment_id, user.id)
+        for user in users
+        for assignment_id in everyone + by_school.get(user.school_id, [])
+    )
+
+
+def rebuild():
+    """Recompute every visibility row; returns the number of assignments processed"""
+    count = 0
+    for assignment in Assignment.objects.order_by('id').iterator():
+        refresh_assignment(assignment)
+        count += 1
+    return count
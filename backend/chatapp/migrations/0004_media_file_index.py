@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatapp', '0003_remove_questionnaire_embedding_html_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='attachment',
+            field=models.FileField(blank=True, db_index=True, null=True, upload_to='chat/attachments/%Y/%m/%d/'),
+        ),
+    ]
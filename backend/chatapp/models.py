@@ -58,7 +58,7 @@ class Message(models.Model):
         related_name="sent_messages"
     )
     text = models.TextField(blank=True, null=True)
-    attachment = models.FileField(upload_to="chat/attachments/%Y/%m/%d/", blank=True, null=True)
+    attachment = models.FileField(upload_to="chat/attachments/%Y/%m/%d/", blank=True, null=True, db_index=True)
     created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from mediaapp.derivatives import thumbnail_urls
 from .models import Conversation, Message, Questionnaire
 
 User = get_user_model()
@@ -20,11 +21,15 @@ class UserBasicSerializer(serializers.ModelSerializer):
 
 class MessageSerializer(serializers.ModelSerializer):
     from_user = UserBasicSerializer(read_only=True)
+    thumbnails = serializers.SerializerMethodField()
+
+    def get_thumbnails(self, obj):
+        return thumbnail_urls(obj)
 
     class Meta:
         model = Message
         fields = [
-            'id', 'conversation', 'from_user', 'text', 'attachment', 'created_at'
+            'id', 'conversation', 'from_user', 'text', 'attachment', 'thumbnails', 'created_at'
         ]
         read_only_fields = ['id', 'from_user', 'created_at']
 
@@ -68,7 +73,8 @@ class MessageCreateSerializer(serializers.ModelSerializer):
         fields = ['text', 'attachment']
 
     def validate(self, data):
-        if not data.get('text') and not data.get('attachment'):
+        # context['upload'] is a completed chunked upload sent instead of a file
+        if not data.get('text') and not data.get('attachment') and not self.context.get('upload'):
             raise serializers.ValidationError("Either text or attachment must be provided.")
         return data
 
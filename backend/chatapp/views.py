@@ -2,25 +2,18 @@ from rest_framework.response import Response
 from rest_framework.decorators import api_view
 from rest_framework import status
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
 from django.contrib.auth import get_user_model
+from account import schools as user_schools, search as user_search
+from account.authentication import acting_user
+from mediaapp.storage import save_shared
+from mediaapp.upload_handlers import media_uploads, rejected_upload
+from mediaapp.uploads import UploadError, attach_upload, get_complete_upload
 from .models import Conversation, Message, Questionnaire
 from .serializers import ConversationSerializer, MessageSerializer, MessageCreateSerializer, UserBasicSerializer, QuestionnaireSerializer
 
 User = get_user_model()
 
 
-def get_user_from_request(request):
-    """Get user from User-ID header"""
-    user_id = request.headers.get('User-ID')
-    if not user_id:
-        return None
-    try:
-        return User.objects.get(id=user_id)
-    except User.DoesNotExist:
-        return None
-
-
 @api_view(['POST'])
 def create_private_conversation(request):
     """
@@ -28,7 +21,7 @@ def create_private_conversation(request):
     Headers: User-ID: <user_id>
     Body: {"participant_id": <other_user_id>}
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -69,7 +62,7 @@ def create_group_conversation(request):
     Headers: User-ID: <user_id>
     Body: {"participant_ids": [<user_id1>, <user_id2>, ...], "name": "Group Name"}
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -103,7 +96,7 @@ def get_conversations(request):
     Get user's conversations
     Headers: User-ID: <user_id>
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -122,7 +115,7 @@ def get_conversation_detail(request, conversation_id):
     Get conversation details
     Headers: User-ID: <user_id>
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -135,14 +128,16 @@ def get_conversation_detail(request, conversation_id):
     return Response({'conversation': serializer.data}, status=status.HTTP_200_OK)
 
 
+@media_uploads()
 @api_view(['POST'])
 def send_message(request, conversation_id):
     """
     Send a message in conversation
     Headers: User-ID: <user_id>
     Body: {"text": "message", "attachment": <file>}
+      or {"text": "message", "upload_id": "<id of a completed chunked upload>"}
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -151,12 +146,26 @@ def send_message(request, conversation_id):
     except Conversation.DoesNotExist:
         return Response({'error': 'Conversation not found'}, status=status.HTTP_404_NOT_FOUND)
 
-    serializer = MessageCreateSerializer(data=request.data)
+    rejected = rejected_upload(request)
+    if rejected:
+        return Response({'error': str(rejected)}, status=rejected.status)
+
+    upload = None
+    if request.data.get('upload_id') and not request.FILES.get('attachment'):
+        try:
+            upload = get_complete_upload(request.data['upload_id'], user)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = MessageCreateSerializer(data=request.data, context={'upload': upload})
     if serializer.is_valid():
-        message = serializer.save(
-            conversation=conversation,
-            from_user=user
-        )
+        message = Message(conversation=conversation, from_user=user, **serializer.validated_data)
+        if upload:
+            try:
+                attach_upload(upload, message, 'attachment')
+            except UploadError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        message.save()
         
         # Update conversation updated_at
         conversation.save()
@@ -173,7 +182,7 @@ def get_messages(request, conversation_id):
     Get all messages in conversation
     Headers: User-ID: <user_id>
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -198,7 +207,7 @@ def delete_message(request, message_id):
     Delete a message (sender only)
     Headers: User-ID: <user_id>
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -218,7 +227,7 @@ def add_participants(request, conversation_id):
     Headers: User-ID: <user_id>
     Body: {"participant_ids": [<user_id1>, <user_id2>]}
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -249,7 +258,7 @@ def remove_participant(request, conversation_id):
     Headers: User-ID: <user_id>
     Body: {"participant_id": <user_id>}
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -282,7 +291,7 @@ def leave_conversation(request, conversation_id):
     Leave a conversation
     Headers: User-ID: <user_id>
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -306,27 +315,34 @@ def search_users(request):
     """
     Search users to start conversation
     Headers: User-ID: <user_id>
-    Query: ?q=<search_term>&role=<role>
+    Query: ?q=<search_term>&role=<role>&school=<school_name>
+    Matches are ranked: names starting with the term first, then names containing it,
+    then close misspellings (see account.search).
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
 
     search_term = request.GET.get('q', '')
     role_filter = request.GET.get('role', '')
+    school_name = request.GET.get('school', '')
 
-    users = User.objects.exclude(id=user.id)  # Exclude current user
+    school_id = None
+    if school_name:
+        school_id = user_schools.school_id(school_name)
+        if school_id is None:
+            return Response({'users': [], 'total_count': 0}, status=status.HTTP_200_OK)
 
     if search_term:
-        users = users.filter(
-            Q(parent_name__icontains=search_term)|
-            Q(children_name__icontains=search_term)
-        )
-
-    if role_filter:
-        users = users.filter(role=role_filter)
+        users = user_search.search_users(search_term, school_id=school_id, role=role_filter or None, exclude_id=user.id)
+    else:
+        users = User.objects.select_related('school').exclude(id=user.id)  # Exclude current user
+        if role_filter:
+            users = users.filter(role=role_filter)
+        if school_id:
+            users = users.filter(school_id=school_id)
+        users = users[:20]  # Limit results
 
-    users = users[:20]  # Limit results
     serializer = UserBasicSerializer(users, many=True)
     
     return Response({
@@ -342,7 +358,7 @@ def find_conversation(request):
     Headers: User-ID: <user_id>
     Query: ?participant_name=<username_or_parent_name> OR ?name=<conversation_name>
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -357,11 +373,9 @@ def find_conversation(request):
     # Find by participant name (username or parent_name)
     if participant_name:
         try:
-            # Search for user by username or parent_name
-            other_user = User.objects.filter(
-                Q(username__icontains=participant_name) |
-                Q(parent_name__icontains=participant_name)
-            ).first()
+            # Best match on username or any name from the user directory index
+            matches = user_search.search_user_ids(participant_name, exclude_id=user.id, limit=1)
+            other_user = User.objects.filter(id=matches[0]).first() if matches else None
             
             if not other_user:
                 return Response({'error': 'User not found with that name'}, status=status.HTTP_404_NOT_FOUND)
@@ -398,7 +412,7 @@ def questionnaire_list_create(request):
     POST: Create a new questionnaire (staff/admin only)
     Headers: User-ID: <user_id>
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -438,7 +452,7 @@ def questionnaire_detail(request, pk):
     DELETE: Delete/deactivate a questionnaire (staff only)
     Headers: User-ID: <user_id>
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -484,7 +498,7 @@ def questionnaire_deactivate(request, pk):
     POST: Deactivate a questionnaire (staff only)
     Headers: User-ID: <user_id>
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -511,7 +525,7 @@ def questionnaire_activate(request, pk):
     POST: Activate a questionnaire (staff only)
     Headers: User-ID: <user_id>
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -532,6 +546,7 @@ def questionnaire_activate(request, pk):
     }, status=status.HTTP_200_OK)
 
 
+@media_uploads()
 @api_view(['POST'])
 def send_to_all(request):
     """
@@ -539,7 +554,7 @@ def send_to_all(request):
     Headers: User-ID: <user_id>
     Body: {"text": "message", "attachment": <file>}
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
     
@@ -547,6 +562,10 @@ def send_to_all(request):
     if user.role != 'staff':
         return Response({'error': 'Permission denied. Only staff can send messages to all users.'}, status=status.HTTP_403_FORBIDDEN)
     
+    rejected = rejected_upload(request)
+    if rejected:
+        return Response({'error': str(rejected)}, status=rejected.status)
+
     # Validate message content
     serializer = MessageCreateSerializer(data=request.data)
     if not serializer.is_valid():
@@ -562,7 +581,13 @@ def send_to_all(request):
     conversations_created = []
     messages_sent = []
     
-    for recipient in all_users:
+    recipients = list(all_users)
+    attachment = serializer.validated_data.get('attachment')
+    if attachment:
+        # Stored once; every message of the broadcast points at the same file
+        attachment = save_shared(Message.attachment.field, attachment, len(recipients))
+
+    for recipient in recipients:
         # Check if private conversation already exists
         existing_conv = Conversation.objects.filter(
             conversation_type='private',
@@ -585,7 +610,7 @@ def send_to_all(request):
             conversation=conversation,
             from_user=user,
             text=serializer.validated_data.get('text', ''),
-            attachment=serializer.validated_data.get('attachment')
+            attachment=attachment
         )
         
         # Update conversation timestamp
@@ -606,6 +631,7 @@ def send_to_all(request):
     }, status=status.HTTP_201_CREATED)
 
 
+@media_uploads()
 @api_view(['POST'])
 def send_to_all_by_school(request, school_name):
     """
@@ -613,7 +639,7 @@ def send_to_all_by_school(request, school_name):
     Headers: User-ID: <user_id>
     Body: {"text": "message", "attachment": <file>}
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
     
@@ -621,6 +647,10 @@ def send_to_all_by_school(request, school_name):
     if user.role != 'staff':
         return Response({'error': 'Permission denied. Only staff can send messages to all users by school.'}, status=status.HTTP_403_FORBIDDEN)
     
+    rejected = rejected_upload(request)
+    if rejected:
+        return Response({'error': str(rejected)}, status=rejected.status)
+
     # Validate message content
     serializer = MessageCreateSerializer(data=request.data)
     if not serializer.is_valid():
@@ -641,7 +671,13 @@ def send_to_all_by_school(request, school_name):
     conversations_created = []
     messages_sent = []
     
-    for recipient in school_users:
+    recipients = list(school_users)
+    attachment = serializer.validated_data.get('attachment')
+    if attachment:
+        # Stored once; every message of the broadcast points at the same file
+        attachment = save_shared(Message.attachment.field, attachment, len(recipients))
+
+    for recipient in recipients:
         # Check if private conversation already exists
         existing_conv = Conversation.objects.filter(
             conversation_type='private',
@@ -664,7 +700,7 @@ def send_to_all_by_school(request, school_name):
             conversation=conversation,
             from_user=user,
             text=serializer.validated_data.get('text', ''),
-            attachment=serializer.validated_data.get('attachment')
+            attachment=attachment
         )
         
         # Update conversation timestamp
@@ -687,6 +723,7 @@ def send_to_all_by_school(request, school_name):
     }, status=status.HTTP_201_CREATED)
 
 
+@media_uploads()
 @api_view(['POST'])
 def send_to_role_by_school(request, school_name, role):
     """
@@ -694,7 +731,7 @@ def send_to_role_by_school(request, school_name, role):
     Headers: User-ID: <user_id>
     Body: {"text": "message", "attachment": <file>}
     """
-    user = get_user_from_request(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
     
@@ -709,6 +746,10 @@ def send_to_role_by_school(request, school_name, role):
             'error': f'Invalid role "{role}". Valid roles are: {", ".join(valid_roles)}'
         }, status=status.HTTP_400_BAD_REQUEST)
     
+    rejected = rejected_upload(request)
+    if rejected:
+        return Response({'error': str(rejected)}, status=rejected.status)
+
     # Validate message content
     serializer = MessageCreateSerializer(data=request.data)
     if not serializer.is_valid():
@@ -730,7 +771,13 @@ def send_to_role_by_school(request, school_name, role):
     conversations_created = []
     messages_sent = []
     
-    for recipient in role_users:
+    recipients = list(role_users)
+    attachment = serializer.validated_data.get('attachment')
+    if attachment:
+        # Stored once; every message of the broadcast points at the same file
+        attachment = save_shared(Message.attachment.field, attachment, len(recipients))
+
+    for recipient in recipients:
         # Check if private conversation already exists
         existing_conv = Conversation.objects.filter(
             conversation_type='private',
@@ -753,7 +800,7 @@ def send_to_role_by_school(request, school_name, role):
             conversation=conversation,
             from_user=user,
             text=serializer.validated_data.get('text', ''),
-            attachment=serializer.validated_data.get('attachment')
+            attachment=attachment
         )
         
         # Update conversation timestamp
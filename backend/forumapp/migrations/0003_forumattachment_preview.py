@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forumapp', '0002_remove_forum_created_at_remove_forum_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forumattachment',
+            name='preview',
+            field=models.FileField(blank=True, help_text='Downscaled JPEG of an image, or a still frame of a video', null=True, upload_to='previews/'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forumapp', '0003_forumattachment_preview'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='forumattachment',
+            name='file',
+            field=models.FileField(db_index=True, upload_to='forum/attachments/%Y/%m/%d/'),
+        ),
+        migrations.AlterField(
+            model_name='forumattachment',
+            name='preview',
+            field=models.FileField(blank=True, db_index=True, help_text='Downscaled JPEG of an image, or a still frame of a video', null=True, upload_to='previews/'),
+        ),
+    ]
@@ -59,7 +59,7 @@ class ForumAttachment(models.Model):
         on_delete=models.CASCADE,
         related_name='attachments'
     )
-    file = models.FileField(upload_to='forum/attachments/%Y/%m/%d/')
+    file = models.FileField(upload_to='forum/attachments/%Y/%m/%d/', db_index=True)
     file_type = models.CharField(max_length=20, choices=ATTACHMENT_TYPES)
     file_name = models.CharField(max_length=255)
     file_size = models.PositiveIntegerField(help_text="File size in bytes")
@@ -68,6 +68,10 @@ class ForumAttachment(models.Model):
     width = models.PositiveIntegerField(null=True, blank=True)
     height = models.PositiveIntegerField(null=True, blank=True)
     duration_ms = models.PositiveIntegerField(null=True, blank=True, help_text="Duration in milliseconds for videos")
+    preview = models.FileField(
+        upload_to='previews/', blank=True, null=True, db_index=True,
+        help_text="Downscaled JPEG of an image, or a still frame of a video",
+    )
     
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from account.models import User
+from mediaapp.derivatives import thumbnail_urls
 from .models import Forum, ForumAttachment, ForumComment, ForumLike
 
 
@@ -12,7 +13,11 @@ class UserBasicSerializer(serializers.ModelSerializer):
 
 class ForumAttachmentSerializer(serializers.ModelSerializer):
     """Serializer for forum attachments"""
-    
+    thumbnails = serializers.SerializerMethodField()
+
+    def get_thumbnails(self, obj):
+        return thumbnail_urls(obj)
+
     class Meta:
         model = ForumAttachment
         fields = [
@@ -24,8 +29,10 @@ class ForumAttachmentSerializer(serializers.ModelSerializer):
             "width",
             "height", 
             "duration_ms",
+            "preview",
+            "thumbnails",
         ]
-        read_only_fields = ["id", "file_size"]
+        read_only_fields = ["id", "file_size", "preview"]
 
 
 class ForumCommentSerializer(serializers.ModelSerializer):
@@ -85,16 +92,11 @@ class ForumSerializer(serializers.ModelSerializer):
     def get_is_liked_by_user(self, obj):
         """Check if the current user liked this post"""
         request = self.context.get('request')
-        if request:
-            # Get user_id from request (could be from headers, query params, or body)
-            user_id = request.headers.get('User-ID') or request.GET.get('user_id') or request.data.get('user_id')
-            if user_id:
-                try:
-                    from account.models import User
-                    user = User.objects.get(id=user_id)
-                    return obj.likes.filter(liked_by=user).exists()
-                except User.DoesNotExist:
-                    pass
+        if request and request.user.is_authenticated:
+            # Use the prefetched likes when the view loaded them
+            if 'likes' in getattr(obj, '_prefetched_objects_cache', {}):
+                return any(like.liked_by_id == request.user.id for like in obj.likes.all())
+            return obj.likes.filter(liked_by_id=request.user.id).exists()
         return False
     
     class Meta:
@@ -2,7 +2,7 @@ from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from PIL import Image
+import logging
 import os
 
 from .models import Forum, ForumAttachment, ForumComment, ForumLike
@@ -12,24 +12,15 @@ from .serializers import (
     ForumCommentSerializer, 
     ForumAttachmentSerializer
 )
-from account.models import User
+from account.authentication import acting_user
+from mediaapp.processing import queue_forum_attachment
+from mediaapp.upload_handlers import media_uploads, rejected_upload
+from mediaapp.uploads import UploadError, attach_upload, get_complete_upload
 
-
-def get_user(request):
-    """Get user from User-ID header"""
-    # Get user_id from request (could be from headers, query params, or body)
-    user_id = request.headers.get('User-ID') or request.GET.get('user_id') or request.data.get('user_id')
-    
-    if not user_id:
-        return None
-    
-    try:
-        user = User.objects.get(id=user_id)
-        return user
-    except User.DoesNotExist:
-        return None
+logger = logging.getLogger(__name__)
 
 
+@media_uploads()
 @api_view(['GET', 'POST'])
 def forum_posts(request):
     """
@@ -57,9 +48,13 @@ def forum_posts(request):
         }, status=status.HTTP_200_OK)
     
     elif request.method == 'POST':
-        user = get_user(request)
+        user = acting_user(request)
         if not user:
             return Response({'error': 'User-ID header required'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        rejected = rejected_upload(request)
+        if rejected:
+            return Response({'error': str(rejected)}, status=rejected.status)
         
         serializer = ForumCreateSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
@@ -94,7 +89,7 @@ def forum_post_detail(request, pk):
     DELETE: Delete a forum post (only by owner or staff)
     """
     post = get_object_or_404(Forum, pk=pk)
-    user = get_user(request)
+    user = acting_user(request)
     
     if request.method == 'GET':
         serializer = ForumSerializer(post, context={'request': request})
@@ -128,10 +123,11 @@ def forum_post_detail(request, pk):
         return Response({'message': 'Post deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
 
 
+@media_uploads()
 @api_view(['POST'])
 def upload_attachment(request, post_pk):
     """Upload attachment to a forum post"""
-    user = get_user(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID header required'}, status=status.HTTP_401_UNAUTHORIZED)
     
@@ -140,13 +136,23 @@ def upload_attachment(request, post_pk):
     # Check permissions
     if post.posted_by != user and user.role != 'staff':
         return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
-    
-    if 'file' not in request.FILES:
+
+    rejected = rejected_upload(request)
+    if rejected:
+        return Response({'error': str(rejected)}, status=rejected.status)
+    
+    if 'file' in request.FILES:
+        attachment_data = create_attachment(post, request.FILES['file'])
+    elif request.data.get('upload_id'):
+        # A completed chunked upload (see mediaapp)
+        try:
+            upload = get_complete_upload(request.data['upload_id'], user)
+            attachment_data = create_attachment_from_upload(post, upload)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    else:
         return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
     
-    file = request.FILES['file']
-    attachment_data = create_attachment(post, file)
-    
     if attachment_data:
         return Response(attachment_data, status=status.HTTP_201_CREATED)
     else:
@@ -156,7 +162,7 @@ def upload_attachment(request, post_pk):
 @api_view(['POST'])
 def toggle_like(request, post_pk):
     """Toggle like on a forum post"""
-    user = get_user(request)
+    user = acting_user(request)
     if not user:
         return Response({'error': 'User-ID header required'}, status=status.HTTP_401_UNAUTHORIZED)
     
@@ -198,7 +204,7 @@ def forum_comments(request, post_pk):
         }, status=status.HTTP_200_OK)
     
     elif request.method == 'POST':
-        user = get_user(request)
+        user = acting_user(request)
         if not user:
             return Response({'error': 'User-ID header required'}, status=status.HTTP_401_UNAUTHORIZED)
         
@@ -222,7 +228,7 @@ def comment_detail(request, comment_pk):
     DELETE: Delete a comment (only by owner or staff)
     """
     comment = get_object_or_404(ForumComment, pk=comment_pk)
-    user = get_user(request)
+    user = acting_user(request)
     
     if not user:
         return Response({'error': 'User-ID header required'}, status=status.HTTP_401_UNAUTHORIZED)
@@ -251,7 +257,7 @@ def comment_detail(request, comment_pk):
 @api_view(['POST'])
 def approve_post(request, post_pk):
     """Approve a pending forum post (staff only)"""
-    user = get_user(request)
+    user = acting_user(request)
     if not user or user.role != 'staff':
         return Response({'error': 'Staff permission required'}, status=status.HTTP_403_FORBIDDEN)
     
@@ -278,7 +284,7 @@ def approve_post(request, post_pk):
 @api_view(['POST'])
 def reject_post(request, post_pk):
     """Reject a pending forum post (staff only)"""
-    user = get_user(request)
+    user = acting_user(request)
     if not user or user.role != 'staff':
         return Response({'error': 'Staff permission required'}, status=status.HTTP_403_FORBIDDEN)
     
@@ -296,7 +302,7 @@ def reject_post(request, post_pk):
 @api_view(['POST'])
 def toggle_pin(request, post_pk):
     """Toggle pin status of a forum post (staff only)"""
-    user = get_user(request)
+    user = acting_user(request)
     if not user or user.role != 'staff':
         return Response({'error': 'Staff permission required'}, status=status.HTTP_403_FORBIDDEN)
     
@@ -316,7 +322,7 @@ def toggle_pin(request, post_pk):
 @api_view(['GET'])
 def pending_posts(request):
     """Get all pending posts for staff approval"""
-    user = get_user(request)
+    user = acting_user(request)
     if not user or user.role != 'staff':
         return Response({'error': 'Staff permission required'}, status=status.HTTP_403_FORBIDDEN)
     
@@ -329,36 +335,31 @@ def pending_posts(request):
     }, status=status.HTTP_200_OK)
 
 
+def _attachment_type(content_type):
+    """ForumAttachment file_type for a MIME type"""
+    content_type = content_type or ''
+    if content_type.startswith('image/'):
+        return 'image'
+    if content_type.startswith('video/'):
+        return 'video'
+    if content_type == 'application/pdf':
+        return 'pdf'
+    return 'document'
+
+
 def create_attachment(post, file):
     """Helper function to create attachment with metadata"""
     try:
-        # Determine file type
-        file_type = 'document'
-        if file.content_type.startswith('image/'):
-            file_type = 'image'
-        elif file.content_type.startswith('video/'):
-            file_type = 'video'
-        elif file.content_type == 'application/pdf':
-            file_type = 'pdf'
-        
         # Create attachment
         attachment = ForumAttachment.objects.create(
             forum_post=post,
             file=file,
-            file_type=file_type,
+            file_type=_attachment_type(file.content_type),
             file_name=file.name,
             file_size=file.size
         )
-        
-        # For images, get dimensions
-        if file_type == 'image':
-            try:
-                with Image.open(file) as img:
-                    attachment.width = img.width
-                    attachment.height = img.height
-                    attachment.save()
-            except Exception:
-                pass  # If we can't get dimensions, that's ok
+        # Dimensions, duration and preview are filled in by the media worker
+        queue_forum_attachment(attachment)
         
         serializer = ForumAttachmentSerializer(attachment)
         return serializer.data
@@ -366,3 +367,24 @@ def create_attachment(post, file):
     except Exception as e:
         print(f"Error creating attachment: {e}")
         return None
+
+
+def create_attachment_from_upload(post, upload):
+    """
+    Create an attachment from a completed chunked upload; its file is moved, not copied.
+    Raises UploadError if the upload cannot be attached.
+    """
+    attachment = ForumAttachment(
+        forum_post=post,
+        file_type=_attachment_type(upload.content_type),
+        file_name=upload.filename,
+        file_size=upload.size,
+    )
+    try:
+        attach_upload(upload, attachment, 'file')
+    except UploadError:
+        logger.exception('Could not attach upload %s to forum post %s', upload.pk, post.pk)
+        raise
+    attachment.save()
+    queue_forum_attachment(attachment)
+    return ForumAttachmentSerializer(attachment).data
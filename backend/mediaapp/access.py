@@ -0,0 +1,74 @@
+"""
+Who may see which uploaded media.
+
+- Forum attachments belong to forum posts, which everyone can read.
+- Submission attachments: the parent who submitted, and teachers and staff.
+- Chat attachments: the participants of the conversation.
+- Assignment question files: teachers and staff, and parents the assignment is visible to.
+
+Media is fetched by <img>/<video> tags and download links, which go to plain Django
+views rather than DRF ones and send no credentials: the URLs the API hands out are
+signed (mediaapp.signing). Unsigned requests are checked against request_user(), which
+authenticates the same way the API does.
+"""
+from django.db.models import Q
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+
+from account.authentication import CachedTokenAuthentication, UserIDAuthentication, acting_user
+from assignmentapp.models import Assignment, SubmissionAttachment
+from chatapp.models import Message
+from forumapp.models import ForumAttachment
+
+GRADER_ROLES = ('teacher', 'staff')
+
+
+def can_view_submission(user, submission):
+    return user is not None and (submission.user_id == user.id or user.role in GRADER_ROLES)
+
+
+def can_view_message(user, message):
+    return user is not None and message.conversation.participants.filter(id=user.id).exists()
+
+
+def can_view(user, obj):
+    """Whether `user` (None when anonymous) may see the media of `obj`"""
+    if isinstance(obj, ForumAttachment):
+        return True
+    if isinstance(obj, SubmissionAttachment):
+        return can_view_submission(user, obj.submission)
+    if isinstance(obj, Message):
+        return can_view_message(user, obj)
+    return False
+
+
+def can_view_file(user, name):
+    """
+    Whether `user` may fetch the stored file `name`. Blobs are shared by content, so
+    the file may belong to several rows; seeing any one of them is enough.
+    """
+    if ForumAttachment.objects.filter(Q(file=name) | Q(preview=name)).exists():
+        return True
+    if user is None:
+        return False
+    grader = user.role in GRADER_ROLES
+
+    submissions = SubmissionAttachment.objects.filter(Q(blob=name) | Q(preview=name))
+    if not grader:
+        submissions = submissions.filter(submission__user=user)
+    if submissions.exists():
+        return True
+    if Message.objects.filter(attachment=name, conversation__participants=user).exists():
+        return True
+    assignments = Assignment.objects.filter(questions=name)
+    if not grader:
+        assignments = assignments.filter(visibilities__user=user)
+    return assignments.exists()
+
+
+def request_user(request):
+    """The acting user of a plain Django request, or None"""
+    try:
+        return acting_user(Request(request, authenticators=[CachedTokenAuthentication(), UserIDAuthentication()]))
+    except APIException:
+        return None
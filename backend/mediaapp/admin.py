@@ -0,0 +1,23 @@
+from django.contrib import admin
+
+from .models import Blob, MediaJob, UploadSession
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'filename', 'size', 'offset', 'status', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('filename', 'user__username')
+    readonly_fields = ('id', 'created_at', 'updated_at')
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'name', 'size', 'ref_count', 'updated_at')
+    search_fields = ('sha256', 'name')
+
+
+@admin.register(MediaJob)
+class MediaJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'object_id', 'status', 'attempts', 'run_after', 'finished_at')
+    list_filter = ('status', 'task')
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class MediaappConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'mediaapp'
+
+    def ready(self):
+        # Registers the media job handlers
+        from . import processing  # noqa: F401
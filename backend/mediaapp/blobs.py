@@ -0,0 +1,128 @@
+"""
+Housekeeping for content-addressed media (see mediaapp.storage).
+
+collect_garbage() is the background sweep: it recounts how many FileField values
+point at each blob, corrects ref_count, and deletes blobs nothing points at. Blobs
+touched within BLOB_GC_GRACE are left alone, so a file saved moments ago whose row is
+not yet committed is never collected. Run it regularly with manage.py gc_media.
+
+import_legacy_files() moves files stored under the old date-based paths into blobs,
+keeping one copy of each distinct content (manage.py gc_media --import-legacy).
+"""
+import logging
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.apps import apps
+from django.db import models, transaction
+from django.utils import timezone
+
+from .models import Blob
+from .storage import BLOB_STAGING_DIR, ContentAddressedStorage, file_sha256
+
+BLOB_GC_GRACE = timedelta(hours=1)
+
+logger = logging.getLogger(__name__)
+
+
+def blob_fields():
+    """(model, field name) of every FileField kept in content-addressed storage"""
+    return [
+        (model, field.name)
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.FileField) and isinstance(field.storage, ContentAddressedStorage)
+    ]
+
+
+def _stored_names(model, field_name):
+    return (
+        model.objects.exclude(**{f'{field_name}__isnull': True}).exclude(**{field_name: ''})
+        .values_list(field_name, flat=True).iterator(chunk_size=2000)
+    )
+
+
+def reference_counts():
+    """Counter of blob name -> number of FileField values pointing at it"""
+    counts = Counter()
+    for model, field_name in blob_fields():
+        counts.update(name for name in _stored_names(model, field_name) if name.startswith('blobs/'))
+    return counts
+
+
+def _remove_staging_leftovers(storage, cutoff):
+    staging = storage.path(BLOB_STAGING_DIR)
+    if not os.path.isdir(staging):
+        return
+    for entry in os.scandir(staging):
+        if entry.is_file() and entry.stat().st_mtime < cutoff.timestamp():
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def collect_garbage(grace=BLOB_GC_GRACE):
+    """Delete unreferenced blobs; returns (blobs removed, bytes freed)"""
+    from django.core.files.storage import default_storage
+
+    cutoff = timezone.now() - grace
+    counts = reference_counts()
+    removed = freed = 0
+    for blob in Blob.objects.filter(updated_at__lt=cutoff).iterator(chunk_size=2000):
+        actual = counts.get(blob.name, 0)
+        if actual:
+            if actual != blob.ref_count:
+                Blob.objects.filter(pk=blob.pk, updated_at__lt=cutoff).update(ref_count=actual)
+            continue
+
+        with transaction.atomic():
+            # A save since the recount touches updated_at and keeps the blob
+            if not Blob.objects.select_for_update().filter(pk=blob.pk, updated_at__lt=cutoff).exists():
+                continue
+            try:
+                os.remove(default_storage.path(blob.name))
+            except FileNotFoundError:
+                pass
+            Blob.objects.filter(pk=blob.pk).delete()
+        removed += 1
+        freed += blob.size
+
+    _remove_staging_leftovers(default_storage, cutoff)
+    return removed, freed
+
+
+def import_legacy_files(progress=None):
+    """
+    Re-point FileField values outside blobs/ at blobs, removing duplicate copies.
+    Returns (files imported, bytes freed). `progress`, if given, is called with the
+    running totals after each model field.
+    """
+    from django.core.files.storage import default_storage
+
+    imported = freed = 0
+    moved = {}  # legacy name -> blob name, for names shared by several rows
+    for model, field_name in blob_fields():
+        storage = model._meta.get_field(field_name).storage
+        legacy = model.objects.exclude(**{f'{field_name}__isnull': True}).exclude(**{field_name: ''}).exclude(
+            **{f'{field_name}__startswith': 'blobs/'},
+        )
+        for pk, name in legacy.values_list('pk', field_name).iterator(chunk_size=500):
+            if name in moved:
+                storage.reference(moved[name])
+            else:
+                path = storage.path(name)
+                if not os.path.exists(path):
+                    logger.warning('Media file %s of %s %s is missing; left as is', name, model.__name__, pk)
+                    continue
+                sha256, size = file_sha256(path)
+                blob_existed = Blob.objects.filter(sha256=sha256).exists()
+                moved[name] = storage.store(path, sha256, size, name)
+                imported += 1
+                if blob_existed:
+                    freed += size
+            model.objects.filter(pk=pk).update(**{field_name: moved[name]})
+        if progress:
+            progress(model, field_name, imported, freed)
+    return imported, freed
@@ -0,0 +1,179 @@
+"""
+Thumbnails of uploaded images, made on first request and cached on disk.
+
+Every image attachment (and every video attachment, through its poster) has a few
+fixed thumbnail sizes. The first request for one renders it from the original, as
+WebP when the client accepts it and JPEG otherwise, and writes it under
+MEDIA_ROOT/derived/; later requests are served from that file. The cache is capped
+at the THUMBNAIL_CACHE_MAX_BYTES setting: once it grows past that, the least
+recently used thumbnails are deleted until it is back under THUMBNAIL_CACHE_LOW_WATER
+of the cap. Cached files are keyed by the source file's name, which is a content
+address (see mediaapp.storage), so a thumbnail never outlives its source's content.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+from assignmentapp.models import SubmissionAttachment
+from chatapp.models import Message
+from forumapp.models import ForumAttachment
+
+from .signing import sign_url
+
+THUMBNAIL_SIZES = {'sm': 160, 'md': 480, 'lg': 1080}
+THUMBNAIL_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_DIR = 'derived'
+THUMBNAIL_CACHE_MAX_BYTES_DEFAULT = 1024 ** 3
+THUMBNAIL_CACHE_LOW_WATER = 0.8
+THUMBNAIL_RESCAN_INTERVAL = 600
+# Only bump a hit thumbnail's mtime (its LRU position) this often
+THUMBNAIL_TOUCH_INTERVAL = 3600
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff'}
+
+SOURCES = {
+    'submission': SubmissionAttachment,
+    'forum': ForumAttachment,
+    'message': Message,
+}
+
+_usage_lock = threading.Lock()
+_usage = {'bytes': None, 'scanned': 0.0}
+
+
+def source_file(obj):
+    """The image a thumbnail of `obj` is made from, or None if it has none (yet)"""
+    if isinstance(obj, SubmissionAttachment):
+        if obj.kind == SubmissionAttachment.IMAGE:
+            return obj.blob or None
+        if obj.kind == SubmissionAttachment.VIDEO:
+            return obj.preview or None
+    elif isinstance(obj, ForumAttachment):
+        if obj.file_type == 'image':
+            return obj.file or None
+        if obj.file_type == 'video':
+            return obj.preview or None
+    elif isinstance(obj, Message):
+        if obj.attachment and os.path.splitext(obj.attachment.name)[1].lower() in IMAGE_EXTENSIONS:
+            return obj.attachment
+    return None
+
+
+def thumbnail_urls(obj):
+    """{size: signed url} of the thumbnails of `obj`, or None if it has no image to show"""
+    if source_file(obj) is None:
+        return None
+    source = next(name for name, model in SOURCES.items() if isinstance(obj, model))
+    return {
+        size: sign_url(reverse('mediaapp:thumbnail', kwargs={'source': source, 'pk': obj.pk, 'size': size}),
+                       thumbnail_key(source, obj.pk))
+        for size in THUMBNAIL_SIZES
+    }
+
+
+def thumbnail_key(source, pk):
+    """What thumbnail URLs are signed for; one signature covers every size"""
+    return f'thumbnails/{source}/{pk}'
+
+
+def _cache_root():
+    return os.path.join(settings.MEDIA_ROOT, THUMBNAIL_DIR)
+
+
+def _cache_max_bytes():
+    return getattr(settings, 'THUMBNAIL_CACHE_MAX_BYTES', THUMBNAIL_CACHE_MAX_BYTES_DEFAULT)
+
+
+def _cache_path(field_file, size, fmt):
+    key = hashlib.sha1(field_file.name.encode()).hexdigest()
+    return os.path.join(_cache_root(), key[:2], key, f'{size}.{fmt}')
+
+
+def _cached_files():
+    for root, _, names in os.walk(_cache_root()):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            yield stat.st_mtime, stat.st_size, path
+
+
+def evict(max_bytes=None):
+    """Delete least recently used thumbnails until the cache is under its low-water mark"""
+    max_bytes = _cache_max_bytes() if max_bytes is None else max_bytes
+    files = sorted(_cached_files())
+    total = sum(size for _, size, _ in files)
+    if total > max_bytes:
+        target = max_bytes * THUMBNAIL_CACHE_LOW_WATER
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+    with _usage_lock:
+        _usage['bytes'] = total
+        _usage['scanned'] = time.monotonic()
+    return total
+
+
+def _record_write(size):
+    with _usage_lock:
+        stale = _usage['bytes'] is None or time.monotonic() - _usage['scanned'] > THUMBNAIL_RESCAN_INTERVAL
+        if not stale:
+            _usage['bytes'] += size
+        over = stale or _usage['bytes'] > _cache_max_bytes()
+    if over:
+        evict()
+
+
+def _render(source_path, px, fmt, target):
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((px, px))
+        if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        elif fmt == 'webp' and image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, staged = tempfile.mkstemp(dir=os.path.dirname(target))
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                image.save(out, THUMBNAIL_FORMATS[fmt], quality=THUMBNAIL_QUALITY)
+            # Concurrent renders of the same thumbnail simply replace each other
+            os.replace(staged, target)
+        except BaseException:
+            os.remove(staged)
+            raise
+
+
+def get_thumbnail(field_file, size, fmt):
+    """Path of the cached thumbnail, rendering it first if needed; None if the source is unreadable"""
+    path = _cache_path(field_file, size, fmt)
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        pass
+    else:
+        if time.time() - mtime > THUMBNAIL_TOUCH_INTERVAL:
+            os.utime(path)
+        return path
+
+    try:
+        _render(field_file.path, THUMBNAIL_SIZES[size], fmt, path)
+    except (OSError, Image.DecompressionBombError):
+        # Missing or not an image (UnidentifiedImageError is an OSError)
+        return None
+    _record_write(os.path.getsize(path))
+    return path
@@ -0,0 +1,152 @@
+"""
+What kinds of files may be uploaded, and how big they may be.
+
+The type of an upload is taken from its first bytes, not from the Content-Type the
+client sent (which browsers guess from the extension, and anyone can set). Each type
+belongs to a kind (image, video, audio or document) with its own size limit; files of
+any other type are refused.
+"""
+import codecs
+import os
+
+SNIFF_BYTES = 512
+MIB = 1024 * 1024
+
+UPLOAD_KIND_LIMITS = {
+    'image': 25 * MIB,
+    'video': 512 * MIB,
+    'audio': 100 * MIB,
+    'document': 50 * MIB,
+}
+
+UPLOAD_TYPES = {
+    'image/jpeg': 'image',
+    'image/png': 'image',
+    'image/gif': 'image',
+    'image/webp': 'image',
+    'image/heic': 'image',
+    'video/mp4': 'video',
+    'video/quicktime': 'video',
+    'video/webm': 'video',
+    'video/x-msvideo': 'video',
+    'audio/mpeg': 'audio',
+    'audio/mp4': 'audio',
+    'audio/ogg': 'audio',
+    'audio/wav': 'audio',
+    'audio/flac': 'audio',
+    'audio/webm': 'audio',
+    'application/pdf': 'document',
+    'application/msword': 'document',
+    'application/vnd.ms-excel': 'document',
+    'application/vnd.ms-powerpoint': 'document',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'document',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': 'document',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation': 'document',
+    'text/plain': 'document',
+    'text/csv': 'document',
+}
+
+# Containers that need the file name to tell what is inside
+ZIP_TYPES = {
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+}
+OLE_TYPES = {
+    '.doc': 'application/msword',
+    '.xls': 'application/vnd.ms-excel',
+    '.ppt': 'application/vnd.ms-powerpoint',
+}
+TEXT_TYPES = {'.txt': 'text/plain', '.csv': 'text/csv'}
+
+
+class UploadRejected(Exception):
+    """The file may not be uploaded; the message is safe to show"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _iso_media_type(head):
+    brand = head[8:12]
+    if brand in (b'heic', b'heix', b'mif1', b'msf1'):
+        return 'image/heic'
+    if brand == b'M4A ':
+        return 'audio/mp4'
+    if brand == b'qt  ':
+        return 'video/quicktime'
+    return 'video/mp4'
+
+
+def _is_text(head):
+    if b'\x00' in head:
+        return False
+    try:
+        # Not final: the sample may end inside a character
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def sniff_content_type(head, filename='', declared=''):
+    """
+    MIME type of a file from its first SNIFF_BYTES bytes, or None if it is not one we
+    accept. The name is only used to tell apart formats that share a container, and the
+    declared type only whether a WebM file is audio.
+    """
+    ext = os.path.splitext(filename or '')[1].lower()
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head.startswith(b'RIFF'):
+        return {b'WEBP': 'image/webp', b'WAVE': 'audio/wav', b'AVI ': 'video/x-msvideo'}.get(head[8:12])
+    if head[4:8] == b'ftyp':
+        return _iso_media_type(head)
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'audio/webm' if (declared or '').startswith('audio/') else 'video/webm'
+    if head.startswith(b'OggS'):
+        return 'audio/ogg'
+    if head.startswith(b'fLaC'):
+        return 'audio/flac'
+    if head.startswith(b'ID3') or head[:2] in (b'\xff\xfb', b'\xff\xf3', b'\xff\xf2'):
+        return 'audio/mpeg'
+    if head.startswith(b'%PDF-'):
+        return 'application/pdf'
+    if head.startswith(b'PK\x03\x04'):
+        return ZIP_TYPES.get(ext)
+    if head.startswith(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'):
+        return OLE_TYPES.get(ext)
+    if ext in TEXT_TYPES and head and _is_text(head):
+        return TEXT_TYPES[ext]
+    return None
+
+
+def upload_limit(content_type, kinds=None):
+    """Most bytes a file of this type may have; raises UploadRejected if the type is not allowed"""
+    kind = UPLOAD_TYPES.get(content_type)
+    if kind is None or (kinds is not None and kind not in kinds):
+        allowed = ', '.join(kinds or UPLOAD_KIND_LIMITS)
+        raise UploadRejected(f'Unsupported file type; allowed: {allowed}', status=415)
+    return UPLOAD_KIND_LIMITS[kind]
+
+
+def check_size(content_type, size):
+    """Raise UploadRejected if `size` bytes is too big for a file of this (allowed) type"""
+    limit = UPLOAD_KIND_LIMITS[UPLOAD_TYPES[content_type]]
+    if size > limit:
+        raise UploadRejected(f'{UPLOAD_TYPES[content_type].capitalize()} files may be at most {limit // MIB} MB', status=413)
+
+
+def check_file(path, filename, size, declared='', kinds=None):
+    """Sniffed MIME type of the complete file at `path`; raises UploadRejected"""
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+    content_type = sniff_content_type(head, filename, declared)
+    upload_limit(content_type, kinds)
+    check_size(content_type, size)
+    return content_type
@@ -0,0 +1,115 @@
+"""
+Database-backed job queue for background media work; no broker needed.
+
+Request handlers enqueue() a MediaJob and return; one or more workers
+(manage.py run_media_worker) claim pending jobs with a compare-and-set UPDATE, so two
+workers never run the same job, and call the handler registered for the job's task
+with its object id. A failing job is retried with exponential backoff up to
+JOB_MAX_ATTEMPTS times. A job left running by a worker that died is picked up again
+after JOB_TIMEOUT.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import MediaJob
+
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = timedelta(seconds=30)
+JOB_TIMEOUT = timedelta(minutes=15)
+JOB_KEEP_FINISHED = timedelta(days=1)
+WORKER_POLL_INTERVAL = 2
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def handler(task):
+    """Register the decorated function as the handler of `task`"""
+    def register(func):
+        _handlers[task] = func
+        return func
+    return register
+
+
+def enqueue(task, object_id, delay=None):
+    """Queue `task` for `object_id`; it runs once the current transaction commits"""
+    if task not in _handlers:
+        raise ValueError(f'No handler registered for {task}')
+    return MediaJob.objects.create(task=task, object_id=object_id, run_after=timezone.now() + (delay or timedelta()))
+
+
+def _runnable(now):
+    return Q(status=MediaJob.STATUS_PENDING, run_after__lte=now) | Q(
+        status=MediaJob.STATUS_RUNNING, started_at__lt=now - JOB_TIMEOUT,
+    )
+
+
+def claim():
+    """Take the next runnable job, or return None"""
+    now = timezone.now()
+    candidates = MediaJob.objects.filter(_runnable(now)).order_by('run_after', 'id').values_list('id', flat=True)[:10]
+    for job_id in candidates:
+        claimed = MediaJob.objects.filter(_runnable(now), pk=job_id).update(
+            status=MediaJob.STATUS_RUNNING, started_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return MediaJob.objects.get(pk=job_id)
+    return None
+
+
+def run(job):
+    """Run a claimed job and record the outcome"""
+    try:
+        _handlers[job.task](job.object_id)
+    except Exception as e:
+        logger.exception('Media job %s failed (attempt %s)', job, job.attempts)
+        if job.attempts >= JOB_MAX_ATTEMPTS or job.task not in _handlers:
+            job.status = MediaJob.STATUS_FAILED
+            job.finished_at = timezone.now()
+        else:
+            job.status = MediaJob.STATUS_PENDING
+            job.run_after = timezone.now() + JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+        job.error = f'{type(e).__name__}: {e}'
+        job.save(update_fields=['status', 'finished_at', 'run_after', 'error'])
+        return False
+
+    job.status = MediaJob.STATUS_DONE
+    job.finished_at = timezone.now()
+    job.error = ''
+    job.save(update_fields=['status', 'finished_at', 'error'])
+    return True
+
+
+def run_pending(limit=None):
+    """Run runnable jobs until none are left (or `limit` ran); returns how many ran"""
+    count = 0
+    while limit is None or count < limit:
+        job = claim()
+        if job is None:
+            break
+        run(job)
+        count += 1
+    return count
+
+
+def prune_finished(older_than=JOB_KEEP_FINISHED):
+    """Forget jobs that finished successfully more than `older_than` ago"""
+    return MediaJob.objects.filter(
+        status=MediaJob.STATUS_DONE, finished_at__lt=timezone.now() - older_than,
+    ).delete()[0]
+
+
+def work(poll_interval=WORKER_POLL_INTERVAL, stop=None):
+    """Worker loop: run jobs as they arrive until `stop()` returns true"""
+    while not (stop and stop()):
+        if not run_pending(limit=100):
+            prune_finished()
+            # Do not hold a connection open while idle
+            connection.close()
+            time.sleep(poll_interval)
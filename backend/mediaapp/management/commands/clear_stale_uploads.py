@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from mediaapp.uploads import UPLOAD_STALE_AFTER, clear_stale
+
+
+class Command(BaseCommand):
+    help = "Delete chunked uploads that were abandoned before being attached"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=int(UPLOAD_STALE_AFTER.total_seconds() // 3600),
+            help='Only uploads idle for at least this many hours',
+        )
+
+    def handle(self, *args, hours, **options):
+        count = clear_stale(timedelta(hours=hours))
+        self.stdout.write(self.style.SUCCESS(f'Removed {count} stale uploads'))
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from mediaapp.blobs import BLOB_GC_GRACE, collect_garbage, import_legacy_files
+
+
+class Command(BaseCommand):
+    help = "Delete media blobs nothing refers to (schedule regularly, e.g. hourly)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-minutes', type=int, default=int(BLOB_GC_GRACE.total_seconds() // 60),
+            help='Leave blobs touched within this many minutes alone',
+        )
+        parser.add_argument(
+            '--import-legacy', action='store_true',
+            help='First move files stored under the old date-based paths into blobs, dropping duplicates',
+        )
+
+    def handle(self, *args, grace_minutes, import_legacy, **options):
+        if import_legacy:
+            imported, freed = import_legacy_files(
+                progress=lambda model, field, count, _: self.stdout.write(f'{model.__name__}.{field}: {count} files so far')
+            )
+            self.stdout.write(self.style.SUCCESS(f'Imported {imported} legacy files, {freed} duplicate bytes removed'))
+
+        removed, freed = collect_garbage(timedelta(minutes=grace_minutes))
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} unreferenced blobs ({freed} bytes)'))
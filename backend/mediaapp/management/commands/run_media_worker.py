@@ -0,0 +1,26 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from mediaapp.jobs import WORKER_POLL_INTERVAL, run_pending, work
+
+
+class Command(BaseCommand):
+    help = "Run background media jobs (image/video metadata and previews) as they are queued"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--burst', action='store_true', help='Run the jobs queued now, then exit')
+        parser.add_argument('--poll-interval', type=float, default=WORKER_POLL_INTERVAL)
+
+    def handle(self, *args, burst, poll_interval, **options):
+        if burst:
+            count = run_pending()
+            self.stdout.write(self.style.SUCCESS(f'Ran {count} media jobs'))
+            return
+
+        stopping = []
+        # Finish the job in hand on SIGTERM/SIGINT, then exit
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: stopping.append(True))
+        self.stdout.write('Media worker started')
+        work(poll_interval=poll_interval, stop=lambda: bool(stopping))
@@ -0,0 +1,100 @@
+import uuid
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class UploadSession(models.Model):
+    """
+    A chunked, resumable upload (see mediaapp.uploads).
+    The bytes received so far live in `part`; `offset` is how many of them there are.
+    """
+    STATUS_UPLOADING = "uploading"
+    STATUS_COMPLETE = "complete"
+    STATUS_ATTACHED = "attached"
+    STATUS_CHOICES = [
+        (STATUS_UPLOADING, "Uploading"),
+        (STATUS_COMPLETE, "Complete"),
+        (STATUS_ATTACHED, "Attached"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="upload_sessions")
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.BigIntegerField(help_text="Total size in bytes, declared when the upload is opened")
+    offset = models.BigIntegerField(default=0, help_text="Bytes received so far")
+    sha256 = models.CharField(
+        max_length=64, blank=True,
+        help_text="Expected SHA-256 (hex) if the client gave one; the verified digest once complete",
+    )
+    part = models.FileField(upload_to="uploads/partial/", blank=True, help_text="The bytes received so far")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_UPLOADING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "updated_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.filename} ({self.offset}/{self.size}, {self.status})"
+
+
+class Blob(models.Model):
+    """
+    One stored file, named by its content (see mediaapp.storage). Every FileField value
+    that points at `name` counts as a reference; ref_count is kept up to date as files
+    are saved and deleted, and corrected by the garbage-collection sweep.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["ref_count", "updated_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class MediaJob(models.Model):
+    """
+    A unit of background media work, run by manage.py run_media_worker (see
+    mediaapp.jobs). `task` names a registered handler that is called with `object_id`.
+    """
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    task = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.task}({self.object_id}) {self.status}"
@@ -0,0 +1,170 @@
+"""
+Background processing of uploaded media, run by the media worker (see mediaapp.jobs).
+
+For each new submission or forum attachment it reads image dimensions, probes
+audio/video duration and size with ffprobe, and renders a preview: a downscaled JPEG
+of an image or a still frame of a video (with ffmpeg). ffprobe and ffmpeg are
+optional; without them videos simply get no duration or poster.
+SubmissionAttachment.transcode_status goes pending -> processing -> success, or
+failed when the file cannot be read.
+"""
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from assignmentapp.models import SubmissionAttachment
+from forumapp.models import ForumAttachment
+
+from .jobs import enqueue, handler
+
+PREVIEW_MAX_SIZE = 480
+PREVIEW_QUALITY = 80
+TOOL_TIMEOUT = 120
+
+SUBMISSION_ATTACHMENT_TASK = 'media.submission_attachment'
+FORUM_ATTACHMENT_TASK = 'media.forum_attachment'
+
+logger = logging.getLogger(__name__)
+
+
+class UnreadableMedia(Exception):
+    """The file is not a readable image/audio/video; retrying will not help"""
+
+
+def _jpeg(image):
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((PREVIEW_MAX_SIZE, PREVIEW_MAX_SIZE))
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=PREVIEW_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def _image_info(path):
+    try:
+        with Image.open(path) as image:
+            width, height = ImageOps.exif_transpose(image).size
+            return {'width': width, 'height': height, 'preview': _jpeg(image)}
+    except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+        raise UnreadableMedia(str(e))
+
+
+def _probe(path):
+    """Duration and picture size from ffprobe, or {} if ffprobe is not installed"""
+    if not shutil.which('ffprobe'):
+        return {}
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', path],
+        capture_output=True, timeout=TOOL_TIMEOUT,
+    )
+    if result.returncode:
+        raise UnreadableMedia(result.stderr.decode(errors='replace').strip()[:500])
+    data = json.loads(result.stdout or b'{}')
+    info = {}
+    duration = (data.get('format') or {}).get('duration')
+    if duration:
+        info['duration_ms'] = int(float(duration) * 1000)
+    video = next((s for s in data.get('streams', []) if s.get('codec_type') == 'video'), None)
+    if video and video.get('width'):
+        info['width'], info['height'] = video['width'], video['height']
+    return info
+
+
+def _poster(path, duration_ms):
+    """A JPEG still frame of the video, or None without ffmpeg"""
+    if not shutil.which('ffmpeg'):
+        return None
+    seek = '1' if (duration_ms or 0) > 2000 else '0'
+    result = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-ss', seek, '-i', path, '-frames:v', '1', '-f', 'image2', '-c:v', 'png', 'pipe:1'],
+        capture_output=True, timeout=TOOL_TIMEOUT,
+    )
+    if result.returncode or not result.stdout:
+        return None
+    with Image.open(io.BytesIO(result.stdout)) as frame:
+        return _jpeg(frame)
+
+
+def analyse(path, kind):
+    """Metadata and preview bytes for the media file at `path` ('image', 'video' or 'audio')"""
+    if kind == 'image':
+        return _image_info(path)
+    info = _probe(path)
+    if kind == 'video':
+        info['preview'] = _poster(path, info.get('duration_ms'))
+    else:
+        info.pop('width', None)
+        info.pop('height', None)
+    return info
+
+
+def _apply(attachment, field_file, kind):
+    """Fill in metadata fields and the preview of `attachment`; returns the updated field names"""
+    try:
+        info = analyse(field_file.path, kind)
+    except FileNotFoundError:
+        raise
+    except (OSError, ValueError, subprocess.TimeoutExpired) as e:
+        # Truncated or corrupt images, garbled ffprobe output, a tool that hangs on the file
+        raise UnreadableMedia(f'{type(e).__name__}: {e}')
+    preview = info.pop('preview', None)
+    fields = list(info)
+    for field, value in info.items():
+        setattr(attachment, field, value)
+    if preview:
+        stem = os.path.splitext(os.path.basename(field_file.name))[0]
+        attachment.preview.save(f'{stem}.jpg', ContentFile(preview), save=False)
+        fields.append('preview')
+    return fields
+
+
+@handler(SUBMISSION_ATTACHMENT_TASK)
+def process_submission_attachment(attachment_id):
+    attachment = SubmissionAttachment.objects.filter(pk=attachment_id).first()
+    if attachment is None or not attachment.blob:
+        return
+    if attachment.kind == SubmissionAttachment.FILE:
+        SubmissionAttachment.objects.filter(pk=attachment_id).update(transcode_status=SubmissionAttachment.TRANSCODE_SUCCESS)
+        return
+
+    SubmissionAttachment.objects.filter(pk=attachment_id).update(transcode_status=SubmissionAttachment.TRANSCODE_PROCESSING)
+    try:
+        fields = _apply(attachment, attachment.blob, attachment.kind)
+    except (UnreadableMedia, FileNotFoundError) as e:
+        logger.warning('Submission attachment %s could not be processed: %s', attachment_id, e)
+        SubmissionAttachment.objects.filter(pk=attachment_id).update(transcode_status=SubmissionAttachment.TRANSCODE_FAILED)
+        return
+    attachment.transcode_status = SubmissionAttachment.TRANSCODE_SUCCESS
+    attachment.save(update_fields=fields + ['transcode_status'])
+
+
+@handler(FORUM_ATTACHMENT_TASK)
+def process_forum_attachment(attachment_id):
+    attachment = ForumAttachment.objects.filter(pk=attachment_id).first()
+    if attachment is None or attachment.file_type not in ('image', 'video'):
+        return
+    try:
+        fields = _apply(attachment, attachment.file, attachment.file_type)
+    except (UnreadableMedia, FileNotFoundError) as e:
+        logger.warning('Forum attachment %s could not be processed: %s', attachment_id, e)
+        return
+    if fields:
+        attachment.save(update_fields=fields)
+
+
+def queue_submission_attachment(attachment):
+    """Queue processing of a new submission attachment (created with transcode_status pending)"""
+    enqueue(SUBMISSION_ATTACHMENT_TASK, attachment.id)
+
+
+def queue_forum_attachment(attachment):
+    """Queue processing of a new forum attachment"""
+    if attachment.file_type in ('image', 'video'):
+        enqueue(FORUM_ATTACHMENT_TASK, attachment.id)
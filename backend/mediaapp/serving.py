@@ -0,0 +1,163 @@
+"""
+Serving stored media.
+
+Files under MEDIA_URL are served by serve() once the URL's signature (mediaapp.signing) or
+mediaapp.access.can_view_file allows it.
+Responses carry an ETag (the content hash for blobs, mtime and size otherwise) and
+Last-Modified, so repeat requests get a 304, and honour a single byte Range, so seeking
+in a video only fetches the part being played. A blob name always has the same content
+(see mediaapp.storage), so blobs are cached by the browser for a year; other files are
+revalidated on every use.
+
+With MEDIA_SENDFILE = 'x-accel-redirect' (nginx, with an internal location at
+MEDIA_ACCEL_REDIRECT_PREFIX aliasing MEDIA_ROOT) or 'x-sendfile' (Apache mod_xsendfile,
+lighttpd) Django only checks access and the proxy sends the bytes, ranges included.
+Otherwise FileResponse streams the file, through the server's wsgi.file_wrapper
+(sendfile) when it has one.
+"""
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .storage import ContentAddressedStorage
+
+BLOB_MAX_AGE = 365 * 24 * 3600
+SERVE_BLOCK_SIZE = 64 * 1024
+SENDFILE_HEADERS = {'x-accel-redirect': 'X-Accel-Redirect', 'x-sendfile': 'X-Sendfile'}
+ACCEL_REDIRECT_PREFIX_DEFAULT = '/protected-media/'
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    (start, end), both inclusive, of the single byte range in a Range header, or None
+    if the whole file should be sent (no usable range; several ranges are not supported).
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if start >= size:
+        raise RangeNotSatisfiable
+    end = min(int(last), size - 1) if last else size - 1
+    if end < start:
+        # Invalid, so the header is ignored
+        return None
+    return start, end
+
+
+class _FileRange:
+    """
+    `length` bytes of an open file from `start`. It has no fileno(), so servers do not
+    sendfile() it (which would send the rest of the file).
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self._file = file
+        self._left = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self._left:
+            size = self._left
+        data = self._file.read(size) if size else b''
+        self._left -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def _sendfile_response(storage, name, path, content_type):
+    header = SENDFILE_HEADERS.get(getattr(settings, 'MEDIA_SENDFILE', None))
+    if header is None:
+        return None
+    response = HttpResponse(content_type=content_type)
+    if header == 'X-Accel-Redirect':
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', ACCEL_REDIRECT_PREFIX_DEFAULT)
+        response[header] = prefix.rstrip('/') + '/' + quote(name)
+    else:
+        response[header] = path
+    return response
+
+
+def _file_response(request, path, size, etag, content_type):
+    byte_range = None
+    range_header = request.headers.get('Range')
+    # If-Range: only send a part if the client's copy is still current
+    if range_header and request.headers.get('If-Range', etag) == etag:
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    file = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(_FileRange(file, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response.block_size = SERVE_BLOCK_SIZE
+    return response
+
+
+def serve(request, storage, name):
+    """The response for GET/HEAD of the stored file `name`; access must already be checked"""
+    path = storage.path(name)
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        raise Http404
+    if not stat.S_ISREG(info.st_mode):
+        raise Http404
+
+    if isinstance(storage, ContentAddressedStorage) and storage.is_blob(name):
+        etag = '"%s"' % os.path.splitext(os.path.basename(name))[0]
+        cache_control = f'private, max-age={BLOB_MAX_AGE}, immutable'
+    else:
+        etag = f'"{info.st_mtime_ns:x}-{info.st_size:x}"'
+        cache_control = 'private, no-cache'
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(info.st_mtime),
+        'Cache-Control': cache_control,
+        'Accept-Ranges': 'bytes',
+    }
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(info.st_mtime))
+    if response is not None:
+        # 304 Not Modified or 412 Precondition Failed
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    response = _sendfile_response(storage, name, path, content_type)
+    if response is None:
+        response = _file_response(request, path, info.st_size, etag, content_type)
+    for header, value in headers.items():
+        response[header] = value
+    return response
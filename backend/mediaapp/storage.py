@@ -0,0 +1,138 @@
+"""
+Content-addressed media storage.
+
+Every file is stored once per distinct content, at blobs/<aa>/<bb>/<sha256><ext>,
+whatever upload_to path the model asks for. Saving hashes the bytes while they are
+written to a staging file under blobs/tmp/; if a blob with that digest already exists
+the staged copy is dropped and the existing name is returned, so a resubmitted PDF or
+one attachment broadcast to every parent takes no extra disk space or writes.
+
+Each save adds a reference to the blob's Blob row and each delete() takes one away.
+Files are only removed from disk by the sweep in mediaapp.blobs (manage.py gc_media),
+which recounts the actual references first. Names outside blobs/ (files stored before
+this backend was enabled) behave exactly as with FileSystemStorage.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .signing import sign_url
+
+BLOB_DIR = 'blobs'
+BLOB_STAGING_DIR = 'blobs/tmp'
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def file_sha256(path):
+    """(hex SHA-256, size) of the file at `path`"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(data)
+            size += len(data)
+    return digest.hexdigest(), size
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def is_blob(self, name):
+        return bool(name) and name.startswith(BLOB_DIR + '/') and not name.startswith(BLOB_STAGING_DIR + '/')
+
+    def blob_name(self, sha256, filename):
+        ext = os.path.splitext(filename or '')[1].lower()
+        if not (1 < len(ext) <= 10 and ext[1:].isalnum()):
+            ext = ''
+        return f'{BLOB_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}'
+
+    def _save(self, name, content):
+        if hasattr(content, 'temporary_file_path'):
+            # Already on disk: hash it (unless the upload handler did) and move it into
+            # place, which is a rename for files staged under blobs/tmp/
+            sha256 = getattr(content, 'sha256', None)
+            if sha256:
+                size = content.size
+            else:
+                sha256, size = file_sha256(content.temporary_file_path())
+            return self.store(content.temporary_file_path(), sha256, size, name, keep_source=True)
+
+        staging = self.path(BLOB_STAGING_DIR)
+        os.makedirs(staging, exist_ok=True)
+        fd, staged = tempfile.mkstemp(dir=staging)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    out.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+        except BaseException:
+            os.remove(staged)
+            raise
+        return self.store(staged, digest.hexdigest(), size, name)
+
+    def store(self, path, sha256, size, filename, keep_source=False):
+        """
+        Make the file at `path` the blob for `sha256`, or drop it if that blob already
+        exists (unless `keep_source`), and add a reference. Returns the blob's name.
+        """
+        from .models import Blob
+
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(sha256=sha256).first()
+            if blob is None:
+                blob = Blob(sha256=sha256, name=self.blob_name(sha256, filename), size=size)
+            target = self.path(blob.name)
+            if os.path.exists(target):
+                if not keep_source:
+                    os.remove(path)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                file_move_safe(path, target, allow_overwrite=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(target, self.file_permissions_mode)
+            blob.ref_count += 1
+            blob.save()
+        return blob.name
+
+    def reference(self, name, count=1):
+        """Record `count` more rows pointing at an already stored blob"""
+        from .models import Blob
+
+        if self.is_blob(name) and count > 0:
+            Blob.objects.filter(name=name).update(ref_count=F('ref_count') + count, updated_at=timezone.now())
+
+    def url(self, name):
+        # Signed, so <img>/<video> tags can load it without credentials (see mediaapp.signing)
+        url = super().url(name)
+        return sign_url(url, name) if name else url
+
+    def delete(self, name):
+        from .models import Blob
+
+        if not self.is_blob(name):
+            return super().delete(name)
+        # Other rows may share the blob; the sweep removes it once nothing does
+        Blob.objects.filter(name=name, ref_count__gt=0).update(
+            ref_count=F('ref_count') - 1, updated_at=timezone.now(),
+        )
+
+
+def save_shared(field, file, count):
+    """
+    Store `file` once for the FileField `field` and return the name that `count`
+    new rows (e.g. the messages of one broadcast) can all be given.
+    """
+    storage = field.storage
+    name = storage.save(field.generate_filename(None, file.name), file, max_length=field.max_length)
+    if isinstance(storage, ContentAddressedStorage):
+        storage.reference(name, count - 1)
+    return name
@@ -0,0 +1,665 @@
+import hashlib
+import io
+import os
+import subprocess
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from account.models import User
+from assignmentapp.models import Assignment, SubmissionAttachment
+from assignmentapp.serializers import SubmissionAttachmentSerializer
+from chatapp.models import Conversation, Message
+from forumapp.models import Forum, ForumAttachment
+
+from . import filetypes, jobs
+from .blobs import collect_garbage, import_legacy_files
+from .derivatives import evict, thumbnail_urls
+from .models import Blob, MediaJob, UploadSession
+from .uploads import UploadOffsetMismatch, clear_stale, write_chunk
+
+# Uploads are typed by their first bytes: an MP4 file type box, then filler
+VIDEO = b'\x00\x00\x00\x18ftypmp42' + bytes(range(256)) * 40
+
+
+@override_settings(ALLOW_LEGACY_USER_ID_AUTH=True)
+class ChunkedUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent = User.objects.create(username='parent', role='parent')
+        cls.teacher = User.objects.create(username='teacher', role='teacher')
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=self.media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_USER_ID=str(self.parent.id))
+
+    def _open(self, data=VIDEO, **fields):
+        response = self.client.post('/uploads/', {
+            'filename': 'reading.mp4', 'size': len(data), 'content_type': 'video/mp4',
+            'sha256': hashlib.sha256(data).hexdigest(), **fields,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['upload']['upload_id']
+
+    def _send(self, upload_id, offset, chunk, **headers):
+        return self.client.generic(
+            'PATCH', f'/uploads/{upload_id}/', chunk, content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset), **headers,
+        )
+
+    def _upload(self, data=VIDEO):
+        upload_id = self._open(data)
+        for offset in range(0, len(data), 4096):
+            self.assertEqual(self._send(upload_id, offset, data[offset:offset + 4096]).status_code, 200)
+        self.assertEqual(self.client.post(f'/uploads/{upload_id}/complete/').status_code, 200)
+        return upload_id
+
+    def test_resumable_upload(self):
+        upload_id = self._open()
+        self.assertEqual(self._send(upload_id, 0, VIDEO[:6000]).status_code, 200)
+
+        # A retried or out-of-order chunk is refused with the offset to resume from
+        conflict = self._send(upload_id, 4000, VIDEO[4000:8000])
+        self.assertEqual((conflict.status_code, conflict.data['offset']), (409, 6000))
+        progress = self.client.get(f'/uploads/{upload_id}/')
+        self.assertEqual(progress['Upload-Offset'], '6000')
+
+        bad = self._send(upload_id, 6000, b'x' * 10, HTTP_CHUNK_SHA256=hashlib.sha256(b'y' * 10).hexdigest())
+        self.assertEqual(bad.status_code, 400)
+        self.assertEqual(self.client.post(f'/uploads/{upload_id}/complete/').status_code, 400)
+
+        self.assertEqual(self._send(upload_id, 6000, VIDEO[6000:]).status_code, 200)
+        done = self.client.post(f'/uploads/{upload_id}/complete/')
+        self.assertEqual(done.data['upload']['status'], UploadSession.STATUS_COMPLETE)
+
+    def test_chunk_sent_twice_at_once_is_recorded_once(self):
+        upload_id = self._open()
+        self.assertEqual(self._send(upload_id, 0, VIDEO[:4000]).status_code, 200)
+        session = UploadSession.objects.get(pk=upload_id)
+
+        class Racing(io.BytesIO):
+            # The other copy of the chunk is stored while this one is still arriving
+            def read(inner, size=-1):
+                data = super().read(size)
+                if inner.tell() == 4000:
+                    UploadSession.objects.filter(pk=upload_id).update(offset=8000)
+                return data
+
+        with self.assertRaises(UploadOffsetMismatch) as raised:
+            write_chunk(session, 4000, Racing(VIDEO[4000:8000]), 4000)
+        self.assertEqual(raised.exception.offset, 8000)
+        with open(session.part.path, 'rb') as part:
+            self.assertEqual(part.read(), VIDEO[:8000])
+
+    def test_checksum_mismatch_is_refused(self):
+        upload_id = self._open(sha256='0' * 64)
+        self._send(upload_id, 0, VIDEO)
+        response = self.client.post(f'/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_completion_checks_the_file_type(self):
+        program = b'MZ\x90\x00' + bytes(600)
+        upload_id = self._open(program, filename='reading.pdf', content_type='application/pdf')
+        self._send(upload_id, 0, program)
+        response = self.client.post(f'/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unsupported file type', response.data['error'])
+
+    def test_upload_attaches_to_submission_once(self):
+        now = timezone.now()
+        assignment = Assignment.objects.create(
+            name='Read aloud', release_date=now, due_date=now + timedelta(days=1), created_by=self.teacher,
+        )
+        upload_id = self._upload()
+        part = UploadSession.objects.get(pk=upload_id).part.path
+
+        response = self.client.post(f'/assignments/{assignment.id}/submit/', {'upload_id': upload_id}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        attachment = SubmissionAttachment.objects.get(submission_id=response.data['submission_id'])
+        self.assertEqual(attachment.kind, SubmissionAttachment.VIDEO)
+        with attachment.blob.open('rb') as stored:
+            self.assertEqual(stored.read(), VIDEO)
+        self.assertFalse(os.path.exists(part))
+
+        again = self.client.post(f'/assignments/{assignment.id}/submit/', {'upload_id': upload_id}, format='json')
+        self.assertEqual(again.status_code, 400)
+
+    def test_upload_attaches_to_message(self):
+        conversation = Conversation.objects.create(created_by=self.parent)
+        conversation.participants.add(self.parent, self.teacher)
+        upload_id = self._upload()
+
+        response = self.client.post(
+            f'/chat/conversations/{conversation.id}/messages/', {'upload_id': upload_id}, format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        with Message.objects.get().attachment.open('rb') as stored:
+            self.assertEqual(stored.read(), VIDEO)
+
+    def test_upload_that_cannot_be_stored_is_reported_on_the_forum(self):
+        post = Forum.objects.create(posted_by=self.parent, content='Our trip', status='approved')
+        upload_id = self._upload()
+
+        with mock.patch('mediaapp.storage.ContentAddressedStorage.store', side_effect=OSError('disk full')), \
+                self.assertLogs('forumapp.views', 'ERROR'):
+            response = self.client.post(f'/forum/posts/{post.id}/attachments/', {'upload_id': upload_id}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Upload could not be stored; try again')
+        self.assertFalse(ForumAttachment.objects.exists())
+        self.assertEqual(UploadSession.objects.get(pk=upload_id).status, UploadSession.STATUS_COMPLETE)
+
+    def test_other_users_cannot_use_an_upload(self):
+        upload_id = self._upload()
+        self.client.credentials(HTTP_USER_ID=str(self.teacher.id))
+        self.assertEqual(self.client.get(f'/uploads/{upload_id}/').status_code, 404)
+
+    def test_stale_uploads_are_cleared(self):
+        upload_id = self._open()
+        part = UploadSession.objects.get(pk=upload_id).part.path
+        UploadSession.objects.update(updated_at=timezone.now() - timedelta(days=3))
+        self.assertEqual(clear_stale(), 1)
+        self.assertFalse(UploadSession.objects.exists() or os.path.exists(part))
+
+
+@override_settings(ALLOW_LEGACY_USER_ID_AUTH=True)
+class ContentAddressedStorageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username='staff', role='staff')
+        cls.parents = [User.objects.create(username=f'parent{i}', role='parent') for i in range(3)]
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=self.media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_USER_ID=str(self.staff.id))
+
+    def _blob_files(self):
+        blobs = os.path.join(self.media.name, 'blobs')
+        return [
+            os.path.join(root, name)
+            for root, _, names in os.walk(blobs)
+            for name in names if os.path.relpath(root, blobs) != 'tmp'
+        ]
+
+    def test_identical_files_are_stored_once(self):
+        now = timezone.now()
+        for i in range(3):
+            Assignment.objects.create(
+                name=f'Booklet {i}', release_date=now, due_date=now, created_by=self.staff,
+                questions=SimpleUploadedFile('HW_Booklet.pdf', b'%PDF-1.4 booklet'),
+            )
+        names = set(Assignment.objects.exclude(questions='').values_list('questions', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(len(self._blob_files()), 1)
+        self.assertEqual(Blob.objects.get().ref_count, 3)
+        self.assertTrue(names.pop().endswith('.pdf'))
+
+    def test_broadcast_attachment_is_stored_once(self):
+        response = self.client.post(
+            '/chat/messages/send-to-all/', {'text': 'Trip', 'attachment': SimpleUploadedFile('trip.txt', b'trip notice')},
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(set(Message.objects.values_list('attachment', flat=True))), 1)
+        self.assertEqual(Blob.objects.get().ref_count, 3)
+
+    def test_garbage_collection_recounts_references(self):
+        first, second = (
+            Message.objects.create(
+                conversation=Conversation.objects.create(created_by=self.staff), from_user=self.staff,
+                attachment=SimpleUploadedFile('note.txt', b'same note'),
+            )
+            for _ in range(2)
+        )
+        path = first.attachment.path
+
+        # Rows removed without touching storage leave ref_count too high; the sweep corrects it
+        first.delete()
+        Blob.objects.update(updated_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(collect_garbage(), (0, 0))
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+
+        second.attachment.delete(save=True)
+        Blob.objects.update(updated_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(collect_garbage(), (1, len(b'same note')))
+        self.assertFalse(os.path.exists(path) or Blob.objects.exists())
+
+    def test_legacy_files_are_imported_and_deduplicated(self):
+        legacy = []
+        for i in range(2):
+            relative = f'submissions/2025/01/0{i + 1}/HW_Booklet.pdf'
+            os.makedirs(os.path.dirname(os.path.join(self.media.name, relative)), exist_ok=True)
+            with open(os.path.join(self.media.name, relative), 'wb') as f:
+                f.write(b'%PDF-1.4 booklet')
+            legacy.append(relative)
+        conversation = Conversation.objects.create(created_by=self.staff)
+        Message.objects.bulk_create([
+            Message(conversation=conversation, from_user=self.staff, attachment=name) for name in legacy
+        ])
+
+        self.assertEqual(import_legacy_files(), (2, len(b'%PDF-1.4 booklet')))
+        self.assertEqual(len(set(Message.objects.values_list('attachment', flat=True))), 1)
+        self.assertEqual(len(self._blob_files()), 1)
+        self.assertFalse(any(os.path.exists(os.path.join(self.media.name, name)) for name in legacy))
+
+
+def _png(width, height):
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), 'orange').save(out, 'PNG')
+    return out.getvalue()
+
+
+_flaky_calls = []
+
+
+@jobs.handler('test.flaky')
+def _flaky(object_id):
+    _flaky_calls.append(object_id)
+    if len(_flaky_calls) < 2:
+        raise OSError('disk busy')
+
+
+@override_settings(ALLOW_LEGACY_USER_ID_AUTH=True)
+class MediaJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent = User.objects.create(username='parent', role='parent')
+        teacher = User.objects.create(username='teacher', role='teacher')
+        now = timezone.now()
+        cls.assignment = Assignment.objects.create(
+            name='Draw', release_date=now, due_date=now + timedelta(days=1), created_by=teacher,
+        )
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=self.media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_USER_ID=str(self.parent.id))
+
+    def _submit(self, name, data, content_type):
+        response = self.client.post(
+            f'/assignments/{self.assignment.id}/submit/',
+            {'file': SimpleUploadedFile(name, data, content_type=content_type)}, format='multipart',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        return SubmissionAttachment.objects.get(submission_id=response.data['submission_id'])
+
+    def test_image_is_processed_in_the_background(self):
+        attachment = self._submit('drawing.png', _png(1200, 900), 'image/png')
+        self.assertEqual(attachment.transcode_status, SubmissionAttachment.TRANSCODE_PENDING)
+        self.assertIsNone(attachment.width)
+
+        self.assertEqual(jobs.run_pending(), 1)
+        attachment.refresh_from_db()
+        self.assertEqual(attachment.transcode_status, SubmissionAttachment.TRANSCODE_SUCCESS)
+        self.assertEqual((attachment.width, attachment.height), (1200, 900))
+        with attachment.preview.open('rb') as preview, Image.open(preview) as image:
+            self.assertEqual(image.size, (480, 360))
+
+    def test_unreadable_image_fails_without_retry(self):
+        # A PNG signature, but no image after it
+        attachment = self._submit('drawing.png', b'\x89PNG\r\n\x1a\n not really a png', 'image/png')
+        with self.assertLogs('mediaapp.processing', 'WARNING'):
+            jobs.run_pending()
+        attachment.refresh_from_db()
+        self.assertEqual(attachment.transcode_status, SubmissionAttachment.TRANSCODE_FAILED)
+        self.assertEqual(MediaJob.objects.get().status, MediaJob.STATUS_DONE)
+
+    def test_truncated_image_fails_without_retry(self):
+        data = _png(1200, 900)
+        attachment = self._submit('drawing.png', data[:len(data) // 2], 'image/png')
+        with self.assertLogs('mediaapp.processing', 'WARNING'):
+            jobs.run_pending()
+        attachment.refresh_from_db()
+        self.assertEqual(attachment.transcode_status, SubmissionAttachment.TRANSCODE_FAILED)
+        self.assertEqual(MediaJob.objects.get().status, MediaJob.STATUS_DONE)
+
+    def test_video_probe_timeout_fails_without_retry(self):
+        attachment = self._submit('reading.mp4', VIDEO, 'video/mp4')
+        with mock.patch('mediaapp.processing.shutil.which', return_value='/usr/bin/ffprobe'), \
+                mock.patch('mediaapp.processing.subprocess.run', side_effect=subprocess.TimeoutExpired('ffprobe', 120)), \
+                self.assertLogs('mediaapp.processing', 'WARNING'):
+            jobs.run_pending()
+        attachment.refresh_from_db()
+        self.assertEqual(attachment.transcode_status, SubmissionAttachment.TRANSCODE_FAILED)
+
+    def test_failed_jobs_are_retried_with_backoff(self):
+        _flaky_calls.clear()
+        job = jobs.enqueue('test.flaky', 7)
+        with self.assertLogs('mediaapp.jobs', 'ERROR'):
+            self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (MediaJob.STATUS_PENDING, 1))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(jobs.run_pending(), 0)
+
+        MediaJob.objects.update(run_after=timezone.now())
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, _flaky_calls), (MediaJob.STATUS_DONE, 2, [7, 7]))
+
+    def test_jobs_of_a_dead_worker_are_reclaimed(self):
+        _flaky_calls.clear()
+        _flaky_calls.append(0)  # succeed straight away
+        job = jobs.enqueue('test.flaky', 1)
+        self.assertEqual(jobs.claim(), job)
+        self.assertIsNone(jobs.claim())
+
+        MediaJob.objects.update(started_at=timezone.now() - jobs.JOB_TIMEOUT - timedelta(seconds=1))
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(MediaJob.objects.get().status, MediaJob.STATUS_DONE)
+
+
+@override_settings(ALLOW_LEGACY_USER_ID_AUTH=True)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent = User.objects.create(username='parent', role='parent')
+        cls.other_parent = User.objects.create(username='other', role='parent')
+        cls.teacher = User.objects.create(username='teacher', role='teacher')
+        now = timezone.now()
+        cls.assignment = Assignment.objects.create(
+            name='Draw', release_date=now, due_date=now + timedelta(days=1), created_by=cls.teacher,
+        )
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=self.media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        client = APIClient()
+        client.credentials(HTTP_USER_ID=str(self.parent.id))
+        response = client.post(
+            f'/assignments/{self.assignment.id}/submit/',
+            {'file': SimpleUploadedFile('drawing.png', _png(1200, 900), content_type='image/png')}, format='multipart',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.attachment = SubmissionAttachment.objects.get(submission_id=response.data['submission_id'])
+        self.url = thumbnail_urls(self.attachment)['md']
+
+    def _cached_files(self):
+        root = os.path.join(self.media.name, 'derived')
+        return sorted(os.path.join(d, f) for d, _, names in os.walk(root) for f in names)
+
+    def _get(self, user, accept='image/*'):
+        return self.client.get(self.url, HTTP_USER_ID=str(user.id), HTTP_ACCEPT=accept)
+
+    def test_thumbnail_is_rendered_once_and_cached(self):
+        response = self._get(self.parent, accept='image/webp,image/*')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('Accept', response['Vary'])
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (480, 360)))
+        cached = self._cached_files()
+        self.assertEqual(len(cached), 1)
+
+        mtime = os.stat(cached[0]).st_mtime_ns
+        response = self._get(self.teacher, accept='image/webp')
+        response.close()
+        self.assertEqual(self._cached_files(), cached)
+        self.assertEqual(os.stat(cached[0]).st_mtime_ns, mtime)
+
+    def test_jpeg_for_clients_without_webp(self):
+        response = self._get(self.parent)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.format, 'JPEG')
+
+    def test_other_parents_and_anonymous_users_are_refused_without_a_signature(self):
+        self.url = self.url.split('?')[0]
+        self.assertEqual(self._get(self.other_parent).status_code, 403)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self._get(self.parent).status_code, 200)
+        self.assertEqual(self.client.get(self.url + '?expires=9999999999&sig=forged').status_code, 403)
+
+    def test_signed_url_loads_without_credentials(self):
+        # As an <img> tag fetches it
+        url = SubmissionAttachmentSerializer(self.attachment).data['thumbnails']['lg']
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        # The signature covers the attachment, not just any thumbnail
+        other = url.replace(f'/{self.attachment.pk}/', f'/{self.attachment.pk + 1}/')
+        self.assertEqual(self.client.get(other).status_code, 404)
+
+    def test_unknown_size_is_not_found(self):
+        self.assertEqual(self.client.get(self.url.replace('/md/', '/xl/'), HTTP_USER_ID=str(self.parent.id)).status_code, 404)
+
+    def test_least_recently_used_thumbnails_are_evicted(self):
+        for url in thumbnail_urls(self.attachment).values():
+            self.client.get(url, HTTP_USER_ID=str(self.parent.id)).close()
+        files = self._cached_files()
+        oldest = min(files, key=lambda path: os.stat(path).st_mtime)
+        os.utime(oldest, (1, 1))
+        total = sum(os.path.getsize(path) for path in files)
+
+        evict(max_bytes=total - 1)
+        self.assertNotIn(oldest, self._cached_files())
+
+    def test_serializer_lists_thumbnail_urls(self):
+        data = SubmissionAttachmentSerializer(self.attachment).data
+        self.assertEqual(set(data['thumbnails']), {'sm', 'md', 'lg'})
+        self.assertEqual(data['thumbnails']['md'], self.url)
+
+        document = SubmissionAttachment.objects.create(
+            submission=self.attachment.submission, kind=SubmissionAttachment.FILE,
+            blob=SimpleUploadedFile('notes.pdf', b'%PDF-1.4'),
+        )
+        self.assertIsNone(SubmissionAttachmentSerializer(document).data['thumbnails'])
+
+
+@override_settings(ALLOW_LEGACY_USER_ID_AUTH=True)
+class MediaServingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent = User.objects.create(username='parent', role='parent')
+        cls.other_parent = User.objects.create(username='other', role='parent')
+        cls.teacher = User.objects.create(username='teacher', role='teacher')
+        now = timezone.now()
+        cls.assignment = Assignment.objects.create(
+            name='Read aloud', release_date=now, due_date=now + timedelta(days=1), created_by=cls.teacher,
+        )
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=self.media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        client = APIClient()
+        client.credentials(HTTP_USER_ID=str(self.parent.id))
+        response = client.post(
+            f'/assignments/{self.assignment.id}/submit/',
+            {'file': SimpleUploadedFile('reading.mp4', VIDEO, content_type='video/mp4')}, format='multipart',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.attachment = SubmissionAttachment.objects.get(submission_id=response.data['submission_id'])
+        self.url = self.attachment.blob.url
+
+    def _get(self, url=None, user=None, **headers):
+        user = self.parent if user is None else user
+        return self.client.get(url or self.url, HTTP_USER_ID=str(user.id), **headers)
+
+    def test_whole_file_with_cache_headers(self):
+        response = self._get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), VIDEO)
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(response['Content-Length'], str(len(VIDEO)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], '"%s"' % hashlib.sha256(VIDEO).hexdigest())
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_conditional_get(self):
+        etag = self._get()['ETag']
+        response = self._get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self._get(HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_byte_ranges(self):
+        response = self._get(HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(VIDEO)}')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(b''.join(response.streaming_content), VIDEO[100:200])
+
+        response = self._get(HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), VIDEO[-10:])
+        response = self._get(HTTP_RANGE='bytes=10000-')
+        self.assertEqual(b''.join(response.streaming_content), VIDEO[10000:])
+
+        response = self._get(HTTP_RANGE=f'bytes={len(VIDEO)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(VIDEO)}')
+
+        # Whole file for several ranges or a changed file
+        self.assertEqual(self._get(HTTP_RANGE='bytes=0-1,5-6').status_code, 200)
+        self.assertEqual(self._get(HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+    def test_only_people_who_may_see_the_submission_get_it_without_a_signature(self):
+        unsigned = '/media/' + self.attachment.blob.name
+        self.assertEqual(self._get(unsigned, user=self.teacher).status_code, 200)
+        self.assertEqual(self._get(unsigned, user=self.other_parent).status_code, 404)
+        self.assertEqual(self.client.get(unsigned).status_code, 404)
+        self.assertEqual(self._get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self._get('/media/blobs/00/00/unknown.mp4').status_code, 404)
+
+    def test_serializer_url_loads_without_credentials(self):
+        # As a <video> or <iframe> tag fetches it
+        url = SubmissionAttachmentSerializer(self.attachment).data['blob']
+        self.assertIn('sig=', url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), VIDEO)
+
+    def test_tampered_and_expired_signatures_are_refused(self):
+        path, query = self.url.split('?')
+        params = dict(param.split('=') for param in query.split('&'))
+        self.assertEqual(self.client.get(f"{path}?expires={int(params['expires']) + 1}&sig={params['sig']}").status_code, 404)
+        self.assertEqual(self.client.get(f"{path}?expires={params['expires']}&sig={params['sig'][:-1]}x").status_code, 404)
+        self.assertEqual(self.client.get(f"/media/blobs/00/00/other.mp4?{query}").status_code, 404)
+        with mock.patch('mediaapp.signing.time.time', return_value=int(params['expires']) + 1):
+            self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_forum_media_is_public(self):
+        post = Forum.objects.create(posted_by=self.teacher, content='Our trip', status='approved')
+        attachment = ForumAttachment.objects.create(
+            forum_post=post, file=SimpleUploadedFile('trip.png', _png(20, 20)),
+            file_type='image', file_name='trip.png', file_size=1,
+        )
+        response = self.client.get(attachment.file.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        response.close()
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect', MEDIA_ACCEL_REDIRECT_PREFIX='/internal/')
+    def test_proxy_sends_the_file_when_configured(self):
+        response = self._get(HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/internal/' + self.attachment.blob.name)
+        self.assertEqual(response.content, b'')
+        self.assertIn('ETag', response)
+
+
+@override_settings(ALLOW_LEGACY_USER_ID_AUTH=True)
+class UploadValidationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.parent = User.objects.create(username='parent', role='parent')
+        teacher = User.objects.create(username='teacher', role='teacher')
+        now = timezone.now()
+        cls.assignment = Assignment.objects.create(
+            name='Draw', release_date=now, due_date=now + timedelta(days=1), created_by=teacher,
+        )
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=self.media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_USER_ID=str(self.parent.id))
+
+    def _submit(self, name, data, content_type):
+        return self.client.post(
+            f'/assignments/{self.assignment.id}/submit/',
+            {'file': SimpleUploadedFile(name, data, content_type=content_type)}, format='multipart',
+        )
+
+    def _staged_files(self):
+        return os.listdir(os.path.join(self.media.name, 'blobs', 'tmp'))
+
+    def test_type_comes_from_the_bytes(self):
+        response = self._submit('reading.mp4', _png(40, 30), 'video/mp4')
+        self.assertEqual(response.status_code, 201, response.data)
+        attachment = SubmissionAttachment.objects.get(submission_id=response.data['submission_id'])
+        self.assertEqual(attachment.kind, SubmissionAttachment.IMAGE)
+
+    def test_staged_file_is_moved_into_place_without_rehashing(self):
+        with mock.patch('mediaapp.storage.file_sha256', side_effect=AssertionError('hashed twice')):
+            response = self._submit('reading.mp4', VIDEO, 'video/mp4')
+        self.assertEqual(response.status_code, 201, response.data)
+        attachment = SubmissionAttachment.objects.get(submission_id=response.data['submission_id'])
+        self.assertEqual(attachment.blob.name, Blob.objects.get(sha256=hashlib.sha256(VIDEO).hexdigest()).name)
+        with attachment.blob.open('rb') as stored:
+            self.assertEqual(stored.read(), VIDEO)
+        self.assertEqual(self._staged_files(), [])
+
+    def test_unsupported_type_is_refused(self):
+        response = self._submit('homework.pdf', b'MZ\x90\x00' + bytes(600), 'application/pdf')
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(self.assignment.submissions.exists())
+        self.assertEqual(self._staged_files(), [])
+
+    def test_file_over_its_kind_limit_is_dropped_while_streaming(self):
+        with mock.patch.dict(filetypes.UPLOAD_KIND_LIMITS, {'video': 5000}):
+            response = self._submit('reading.mp4', VIDEO, 'video/mp4')
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('at most', response.data['detail'])
+        self.assertFalse(self.assignment.submissions.exists())
+        self.assertEqual(self._staged_files(), [])
+
+    def test_request_too_big_for_any_kind_is_not_read(self):
+        limits = dict.fromkeys(filetypes.UPLOAD_KIND_LIMITS, 1000)
+        with mock.patch.dict(filetypes.UPLOAD_KIND_LIMITS, limits), \
+                mock.patch('mediaapp.upload_handlers.MediaUploadHandler.new_file') as new_file:
+            response = self._submit('reading.mp4', VIDEO * 120, 'video/mp4')
+        self.assertEqual(response.status_code, 413)
+        new_file.assert_not_called()
+
+    def test_sniffing(self):
+        sniff = filetypes.sniff_content_type
+        self.assertEqual(sniff(b'%PDF-1.7 ...', 'x.bin'), 'application/pdf')
+        self.assertEqual(sniff(b'PK\x03\x04rest', 'essay.docx'), filetypes.ZIP_TYPES['.docx'])
+        self.assertIsNone(sniff(b'PK\x03\x04rest', 'archive.zip'))
+        self.assertEqual(sniff(b'\x1a\x45\xdf\xa3rest', 'voice.webm', 'audio/webm'), 'audio/webm')
+        self.assertEqual(sniff('naïve notes'.encode(), 'notes.txt'), 'text/plain')
+        self.assertIsNone(sniff(b'plain text', 'notes.html'))
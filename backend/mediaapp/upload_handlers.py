@@ -0,0 +1,152 @@
+"""
+Streaming, validating handling of multipart file uploads.
+
+Django's default handlers keep small files in memory and spool big ones to a temporary
+file, which FileField then copies into MEDIA_ROOT: every large upload is written
+twice, and its size and type are only known once it has all arrived. Views wrapped in
+@media_uploads() use MediaUploadHandler instead. It writes each file straight into the
+blob staging directory (MEDIA_ROOT/blobs/tmp/, on the same disk as the blobs) while
+hashing it, so storing it afterwards is a rename (see ContentAddressedStorage._save).
+It takes the file's type from its first bytes (mediaapp.filetypes), and drops the file
+as soon as the type is not allowed or the file grows past its kind's limit; a request
+whose declared length is already too big is not read at all.
+
+Dropped files are missing from request.FILES; the view asks rejected_upload(request)
+why, before doing anything else.
+"""
+import hashlib
+import os
+import tempfile
+from functools import wraps
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+
+from .filetypes import SNIFF_BYTES, UPLOAD_KIND_LIMITS, UploadRejected, check_size, sniff_content_type, upload_limit
+from .storage import BLOB_STAGING_DIR
+
+# Room for the form fields and multipart framing around the files
+UPLOAD_FORM_OVERHEAD = 1024 * 1024
+
+
+class StagedUploadedFile(UploadedFile):
+    """An upload written to the staging directory, with its SHA-256 and sniffed type"""
+
+    def __init__(self, file, name, content_type, size, charset, sha256):
+        super().__init__(file, name, content_type, size, charset)
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            # Moved into the blob store
+            pass
+
+
+class MediaUploadHandler(FileUploadHandler):
+    def __init__(self, request=None, kinds=None):
+        super().__init__(request)
+        self.kinds = kinds
+        self.file = None
+
+    def _reject(self, error):
+        self.request.upload_errors.append(error)
+        if self.file is not None:
+            # Deletes it
+            self.file.close()
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        largest = max(UPLOAD_KIND_LIMITS[kind] for kind in (self.kinds or UPLOAD_KIND_LIMITS))
+        if content_length > largest + UPLOAD_FORM_OVERHEAD:
+            self._reject(UploadRejected(f'Files may be at most {largest // (1024 * 1024)} MB', status=413))
+            # Parsed as empty, without reading the body
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        staging = default_storage.path(BLOB_STAGING_DIR)
+        os.makedirs(staging, exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(dir=staging, suffix='.upload')
+        self.digest = hashlib.sha256()
+        self.head = b''
+        self.sniffed = None
+
+    def _sniff(self):
+        self.sniffed = sniff_content_type(self.head, self.file_name, self.content_type)
+        try:
+            upload_limit(self.sniffed, self.kinds)
+            # The part's own Content-Length, if the client sent one, is known up front
+            check_size(self.sniffed, max(len(self.head), self.content_length or 0))
+        except UploadRejected as e:
+            self._reject(e)
+            raise SkipFile
+        self._write(self.head)
+
+    def _write(self, data):
+        self.file.write(data)
+        self.digest.update(data)
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.sniffed is None:
+            self.head += raw_data
+            if len(self.head) >= SNIFF_BYTES:
+                self._sniff()
+        else:
+            try:
+                check_size(self.sniffed, start + len(raw_data))
+            except UploadRejected as e:
+                self._reject(e)
+                raise SkipFile
+            self._write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if file_size == 0:
+            self._reject(UploadRejected(f'{self.file_name} is empty'))
+            return None
+        if self.sniffed is None:
+            try:
+                self._sniff()
+            except SkipFile:
+                return None
+        self.file.flush()
+        self.file.seek(0)
+        return StagedUploadedFile(
+            self.file, self.file_name, self.sniffed, file_size, self.charset, self.digest.hexdigest(),
+        )
+
+    def upload_interrupted(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def media_uploads(kinds=None):
+    """
+    Handle the view's file uploads with MediaUploadHandler, allowing only files of
+    `kinds` (default: all of UPLOAD_KIND_LIMITS). Goes outside @api_view, since DRF
+    may parse the body while authenticating.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            request.upload_errors = []
+            request.upload_handlers = [MediaUploadHandler(request, kinds)]
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def rejected_upload(request):
+    """The UploadRejected error of the first file the request's upload handler dropped, or None"""
+    # Parse the body if nothing has yet
+    request.FILES
+    errors = getattr(request, 'upload_errors', None)
+    return errors[0] if errors else None
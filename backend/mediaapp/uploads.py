@@ -0,0 +1,244 @@
+"""
+Chunked, resumable uploads.
+
+A client opens an UploadSession with the file's name, size and, optionally, its
+SHA-256, then sends the bytes in order, one PATCH per chunk, each saying which
+offset it starts at. Chunks are streamed from the request straight into the
+session's part file under MEDIA_ROOT/uploads/partial/, never held in memory whole,
+so a dropped connection costs at most the chunk in flight: GET on the session
+tells the client where to carry on. A chunk may carry its own SHA-256; completing
+the session checks the total size and the file's SHA-256, and the file's type and
+size against the limits in mediaapp.filetypes.
+
+A complete upload is attached exactly once to a SubmissionAttachment, ForumAttachment
+or Message by the view that creates it. The part file is moved into the target
+FileField's storage (as a blob, see mediaapp.storage) rather than copied. Uploads
+never completed are removed by manage.py clear_stale_uploads.
+"""
+import hashlib
+import os
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from .filetypes import UploadRejected, check_file
+from .models import UploadSession
+from .storage import ContentAddressedStorage
+
+UPLOAD_MAX_SIZE = 512 * 1024 * 1024
+UPLOAD_CHUNK_MAX_SIZE = 16 * 1024 * 1024
+UPLOAD_READ_SIZE = 64 * 1024
+UPLOAD_STALE_AFTER = timedelta(days=2)
+
+
+class UploadError(Exception):
+    """The request cannot be applied to the upload; the message is safe to show"""
+
+
+class UploadOffsetMismatch(UploadError):
+    def __init__(self, offset):
+        super().__init__(f'Upload is at offset {offset}')
+        self.offset = offset
+
+
+def _is_sha256(value):
+    return len(value) == 64 and all(c in '0123456789abcdef' for c in value)
+
+
+def open_session(user, filename, size, content_type='', sha256=''):
+    """Start an upload of `size` bytes"""
+    filename = os.path.basename(str(filename or '').replace('\\', '/')).strip()
+    if not filename:
+        raise UploadError('filename is required')
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('size must be an integer')
+    if size < 1 or size > UPLOAD_MAX_SIZE:
+        raise UploadError(f'size must be between 1 and {UPLOAD_MAX_SIZE} bytes')
+    sha256 = str(sha256 or '').lower()
+    if sha256 and not _is_sha256(sha256):
+        raise UploadError('sha256 must be 64 hexadecimal characters')
+
+    session = UploadSession(
+        user=user, filename=filename[:255], content_type=str(content_type or '')[:100], size=size, sha256=sha256,
+    )
+    session.part.name = f'uploads/partial/{session.id}.part'
+    path = session.part.path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    session.save()
+    return session
+
+
+def write_chunk(session, offset, stream, length, sha256=''):
+    """
+    Append `length` bytes read from `stream` at `offset`, which must be where the
+    upload currently ends. Returns the session with its new offset.
+    """
+    if length is None or length < 1:
+        raise UploadError('Chunk is empty')
+    if length > UPLOAD_CHUNK_MAX_SIZE:
+        raise UploadError(f'Chunks may be at most {UPLOAD_CHUNK_MAX_SIZE} bytes')
+    sha256 = (sha256 or '').lower()
+    if sha256 and not _is_sha256(sha256):
+        raise UploadError('Chunk SHA-256 must be 64 hexadecimal characters')
+
+    # No transaction or row lock is held while the bytes arrive (SQLite would be locked
+    # for the whole chunk); the offset only moves if nobody else moved it meanwhile.
+    session = UploadSession.objects.get(pk=session.pk)
+    if session.status != UploadSession.STATUS_UPLOADING:
+        raise UploadError('Upload is already complete')
+    if offset != session.offset:
+        raise UploadOffsetMismatch(session.offset)
+    if offset + length > session.size:
+        raise UploadError('Chunk goes past the declared size')
+
+    digest = hashlib.sha256()
+    received = 0
+    with open(session.part.path, 'r+b') as part:
+        part.seek(offset)
+        while received < length:
+            data = stream.read(min(UPLOAD_READ_SIZE, length - received))
+            if not data:
+                break
+            part.write(data)
+            digest.update(data)
+            received += len(data)
+
+        problem = None
+        if received != length:
+            problem = 'Chunk was cut short; resend it'
+        elif sha256 and digest.hexdigest() != sha256:
+            problem = 'Chunk SHA-256 does not match; resend it'
+        if problem:
+            # Drop the partial chunk so the next attempt starts from the same offset
+            part.truncate(offset)
+            raise UploadError(problem)
+        part.truncate(offset + length)
+
+        moved = UploadSession.objects.filter(
+            pk=session.pk, offset=offset, status=UploadSession.STATUS_UPLOADING,
+        ).update(offset=offset + length, updated_at=timezone.now())
+        if not moved:
+            # Another request sent this chunk first (or completed the upload)
+            session.refresh_from_db(fields=['offset', 'status'])
+            if session.offset <= offset:
+                part.truncate(session.offset)
+            raise UploadOffsetMismatch(session.offset)
+
+    session.offset = offset + length
+    return session
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for data in iter(lambda: part.read(UPLOAD_READ_SIZE), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def complete(session):
+    """Check the size and SHA-256 of a fully sent upload and mark it complete"""
+    session = UploadSession.objects.get(pk=session.pk)
+    if session.status != UploadSession.STATUS_UPLOADING:
+        return session
+    if session.offset != session.size:
+        raise UploadError(f'Upload has {session.offset} of {session.size} bytes')
+
+    # Hashed and sniffed outside any transaction; no chunk can change the file now
+    # that it has all its bytes
+    actual = _file_sha256(session.part.path)
+    if session.sha256 and session.sha256 != actual:
+        raise UploadError('SHA-256 does not match the uploaded file')
+    try:
+        content_type = check_file(session.part.path, session.filename, session.size, session.content_type)
+    except UploadRejected as e:
+        raise UploadError(str(e))
+
+    UploadSession.objects.filter(
+        pk=session.pk, status=UploadSession.STATUS_UPLOADING, offset=session.size,
+    ).update(sha256=actual, content_type=content_type, status=UploadSession.STATUS_COMPLETE, updated_at=timezone.now())
+    # Whether this request or a concurrent one completed it
+    session.refresh_from_db()
+    return session
+
+
+def get_complete_upload(upload_id, user):
+    """The user's complete, not yet attached upload with this id"""
+    try:
+        session = UploadSession.objects.filter(pk=upload_id, user=user).first()
+    except ValidationError:
+        # Not a UUID
+        session = None
+    if session is None:
+        raise UploadError('Upload not found')
+    if session.status != UploadSession.STATUS_COMPLETE:
+        raise UploadError('Upload is not complete' if session.status == UploadSession.STATUS_UPLOADING
+                          else 'Upload has already been used')
+    return session
+
+
+def attach_upload(session, instance, field_name):
+    """
+    Move a complete upload into `instance`'s FileField `field_name` (the instance is
+    not saved). Each upload can be attached once.
+    """
+    claimed = UploadSession.objects.filter(
+        pk=session.pk, status=UploadSession.STATUS_COMPLETE,
+    ).update(status=UploadSession.STATUS_ATTACHED, updated_at=timezone.now())
+    if not claimed:
+        raise UploadError('Upload has already been used')
+
+    field = getattr(instance, field_name)
+    storage = field.storage
+    try:
+        if isinstance(storage, ContentAddressedStorage):
+            # The digest was verified on completion; no need to hash again
+            name = storage.store(session.part.path, session.sha256, session.size, session.filename)
+        else:
+            name = storage.get_available_name(field.field.generate_filename(instance, session.filename))
+            target = storage.path(name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(session.part.path, target)
+    except OSError:
+        UploadSession.objects.filter(pk=session.pk).update(status=UploadSession.STATUS_COMPLETE)
+        raise UploadError('Upload could not be stored; try again')
+    field.name = name
+
+    UploadSession.objects.filter(pk=session.pk).update(part='')
+    session.status = UploadSession.STATUS_ATTACHED
+    session.part.name = ''
+    return session
+
+
+def clear_stale(older_than=UPLOAD_STALE_AFTER):
+    """Delete uploads that were never attached and saw no activity for `older_than`"""
+    stale = UploadSession.objects.filter(
+        status__in=[UploadSession.STATUS_UPLOADING, UploadSession.STATUS_COMPLETE],
+        updated_at__lt=timezone.now() - older_than,
+    )
+    count = 0
+    for session in stale.iterator():
+        if session.part:
+            session.part.delete(save=False)
+        session.delete()
+        count += 1
+    UploadSession.objects.filter(status=UploadSession.STATUS_ATTACHED, updated_at__lt=timezone.now() - older_than).delete()
+    return count
+
+
+def upload_data(session):
+    """Public state of an upload"""
+    return {
+        'upload_id': str(session.id),
+        'filename': session.filename,
+        'content_type': session.content_type,
+        'size': session.size,
+        'offset': session.offset,
+        'status': session.status,
+        'sha256': session.sha256 or None,
+        'chunk_max_size': UPLOAD_CHUNK_MAX_SIZE,
+    }
@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.urls import path
+from . import views
+
+app_name = "mediaapp"
+
+urlpatterns = [
+    path("uploads/", views.upload_create, name="upload_create"),
+    path("uploads/<uuid:upload_id>/", views.upload_detail, name="upload_detail"),
+    path("uploads/<uuid:upload_id>/complete/", views.upload_complete, name="upload_complete"),
+    path(settings.MEDIA_URL.lstrip("/") + "<path:name>", views.serve_media, name="media"),
+    path("thumbnails/<str:source>/<int:pk>/<str:size>/", views.thumbnail, name="thumbnail"),
+]
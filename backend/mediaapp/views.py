@@ -0,0 +1,142 @@
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponseForbidden
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_safe
+from rest_framework import status
+from rest_framework.decorators import api_view, parser_classes
+from rest_framework.response import Response
+
+from account.authentication import acting_user
+
+from . import serving, uploads
+from .access import can_view, can_view_file, request_user
+from .derivatives import SOURCES, THUMBNAIL_SIZES, get_thumbnail, source_file, thumbnail_key
+from .models import UploadSession
+from .signing import valid_token
+from .uploads import UploadError, UploadOffsetMismatch, upload_data
+
+
+@api_view(['POST'])
+def upload_create(request):
+    """
+    Start a chunked upload
+    Body: {"filename": "reading.mp4", "size": <bytes>, "content_type": "video/mp4", "sha256": "<hex>" (optional)}
+    Then PATCH the bytes to /uploads/<upload_id>/ and POST /uploads/<upload_id>/complete/.
+    """
+    user = acting_user(request)
+    if not user:
+        return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    try:
+        session = uploads.open_session(
+            user,
+            filename=request.data.get('filename'),
+            size=request.data.get('size'),
+            content_type=request.data.get('content_type', ''),
+            sha256=request.data.get('sha256', ''),
+        )
+    except UploadError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'upload': upload_data(session)}, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET', 'PATCH', 'DELETE'])
+@parser_classes([])  # chunk bodies are read from the request stream, never parsed
+def upload_detail(request, upload_id):
+    """
+    GET: progress of an upload; resume from its offset
+    PATCH: send the next chunk as the raw request body
+        Headers: Upload-Offset: <offset the chunk starts at>, Chunk-SHA256: <hex> (optional)
+    DELETE: abandon the upload
+    """
+    user = acting_user(request)
+    if not user:
+        return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
+    session = get_object_or_404(UploadSession, pk=upload_id, user=user)
+
+    if request.method == 'GET':
+        return Response({'upload': upload_data(session)}, headers={'Upload-Offset': str(session.offset)})
+
+    if request.method == 'DELETE':
+        if session.status != UploadSession.STATUS_ATTACHED:
+            session.part.delete(save=False)
+            session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return Response({'error': 'Upload-Offset header must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        session = uploads.write_chunk(
+            session, offset, request.stream, length, sha256=request.headers.get('Chunk-SHA256', ''),
+        )
+    except UploadOffsetMismatch as e:
+        return Response(
+            {'error': str(e), 'offset': e.offset}, status=status.HTTP_409_CONFLICT,
+            headers={'Upload-Offset': str(e.offset)},
+        )
+    except UploadError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'upload': upload_data(session)}, headers={'Upload-Offset': str(session.offset)})
+
+
+@api_view(['POST'])
+def upload_complete(request, upload_id):
+    """Verify size and checksum of a fully sent upload; its upload_id can then be attached"""
+    user = acting_user(request)
+    if not user:
+        return Response({'error': 'User-ID invalid'}, status=status.HTTP_401_UNAUTHORIZED)
+    session = get_object_or_404(UploadSession, pk=upload_id, user=user)
+
+    try:
+        session = uploads.complete(session)
+    except UploadError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'upload': upload_data(session)})
+
+
+@require_safe
+def thumbnail(request, source, pk, size):
+    """
+    A thumbnail of an image (or video poster) attachment, WebP if accepted, else JPEG
+    Sizes: sm, md, lg. Serializers list the (signed) URLs under "thumbnails"; without a
+    valid signature the requester must be allowed to see the attachment.
+    """
+    if source not in SOURCES or size not in THUMBNAIL_SIZES:
+        raise Http404
+    queryset = SOURCES[source].objects.all()
+    if source == 'submission':
+        queryset = queryset.select_related('submission')
+    obj = get_object_or_404(queryset, pk=pk)
+    if not valid_token(thumbnail_key(source, pk), request.GET) and not can_view(request_user(request), obj):
+        return HttpResponseForbidden()
+
+    field_file = source_file(obj)
+    fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+    path = get_thumbnail(field_file, size, fmt) if field_file else None
+    if path is None:
+        raise Http404
+
+    response = FileResponse(open(path, 'rb'), content_type=f'image/{fmt}')
+    response['Cache-Control'] = 'private, max-age=86400'
+    response['Vary'] = 'Accept'
+    return response
+
+
+@require_safe
+def serve_media(request, name):
+    """
+    A stored media file (what FileField URLs point at), if the URL is validly signed or
+    the requester may see a row that uses it. Unknown and forbidden files both get 404.
+    """
+    try:
+        default_storage.path(name)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not valid_token(name, request.GET) and not can_view_file(request_user(request), name):
+        raise Http404
+    return serving.serve(request, default_storage, name)
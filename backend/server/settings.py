@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
     'assignmentapp',
     'chatapp',
     'forumapp',
+    'mediaapp',
 ]
 
 MIDDLEWARE = [
@@ -90,6 +92,26 @@ DATABASES = {
     }
 }
 
+# Cache
+# Cached users and tokens, the school registry, the leaderboard, school stats and
+# assignment analytics are invalidated through the cache, so every worker process must
+# share it: set REDIS_URL (e.g. redis://localhost:6379/0) whenever more than one process
+# serves requests. Without it each process has its own LocMemCache and only sees its own
+# invalidations; other processes catch up when their cached copies expire.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -127,6 +149,23 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded media is stored once per distinct content (mediaapp/storage.py);
+# unreferenced blobs are removed by manage.py gc_media
+STORAGES = {
+    'default': {'BACKEND': 'mediaapp.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Disk space for cached image thumbnails (media/derived/); least recently used ones
+# are deleted past this
+THUMBNAIL_CACHE_MAX_BYTES = 1024 ** 3
+
+# Media files are served by mediaapp (access checks, ranges, ETags). Behind nginx set
+# 'x-accel-redirect' (with an internal location MEDIA_ACCEL_REDIRECT_PREFIX aliasing
+# MEDIA_ROOT), behind Apache/lighttpd 'x-sendfile', to let the proxy send the bytes
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -153,8 +192,28 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
     'User-ID',  # Custom header for user identification
+    'Upload-Offset',  # Chunked uploads (mediaapp)
+    'Chunk-SHA256',
     'Content-Type'
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
-CORS_ALLOW_CREDENTIALS = True
\ No newline at end of file
+CORS_ALLOW_CREDENTIALS = True
+CORS_EXPOSE_HEADERS = ['Upload-Offset']
+
+# REST framework: identify the acting user once per request (see account/authentication.py)
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'account.authentication.CachedTokenAuthentication',
+        'account.authentication.UserIDAuthentication',
+    ],
+}
+
+# Deprecated: take the acting user from a User-ID header. Anyone can send any id, so this
+# is off unless ALLOW_LEGACY_USER_ID_AUTH=1 is set, for clients that do not yet log in for
+# a token ("Authorization: Token <key>"). It will be removed.
+ALLOW_LEGACY_USER_ID_AUTH = os.environ.get('ALLOW_LEGACY_USER_ID_AUTH') == '1'
+
+# Deleting a school (or all its users) runs as a batched background job (account/purge.py).
+# Set to False to run it inside the request instead, e.g. in tests.
+SCHOOL_PURGE_IN_BACKGROUND = True
@@ -15,10 +15,8 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.conf.urls.static import static
 from django.http import HttpResponse
 from django.urls import path, include
-from django.conf import settings
 
 urlpatterns = [
     path('', view=lambda request: HttpResponse("Welcome to the server!")),
@@ -27,4 +25,5 @@ urlpatterns = [
     path('assignments/', include(('assignmentapp.urls', 'assignmentapp'), namespace='assignmentapp')),
     path('chat/', include('chatapp.urls')),
     path('forum/', include(('forumapp.urls', 'forumapp'), namespace='forumapp')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('', include('mediaapp.urls')),
+]